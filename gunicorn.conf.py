@@ -0,0 +1,46 @@
+"""
+Gunicorn configuration for the OC Lettings site.
+
+Workers and threads are sized from the CPU count and can be overridden with
+the ``WEB_CONCURRENCY`` and ``GUNICORN_THREADS`` environment variables. The
+application is preloaded in the master process, so the workers share the
+imported code and compiled templates copy-on-write: the master warms them up
+before forking, so the first request of a worker does not pay any cold-start
+cost.
+
+Usage:
+    gunicorn -c gunicorn.conf.py oc_lettings_site.wsgi:application
+"""
+
+import multiprocessing
+import os
+
+bind = "0.0.0.0:%s" % os.environ.get("PORT", "8000")
+
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", "2"))
+worker_class = "gthread" if threads > 1 else "sync"
+
+preload_app = True
+
+# Recycle workers regularly, with jitter so they do not all restart at once.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+
+def when_ready(server):
+    """Warm up the master process once, before the workers are forked."""
+    from django.db import connections
+
+    from oc_lettings_site.warmup import warm_up
+
+    warm_up()
+    # Rendering the error pages may have connected; workers must not share it.
+    connections.close_all()
@@ -1,5 +1,41 @@
 from django.contrib import admin
+
+from oc_lettings_site.admin_tools import CachedValuesListFilter, ScalableModelAdmin
 from .models import Letting, Address
 
-admin.site.register(Letting)
-admin.site.register(Address)
+
+class StateListFilter(CachedValuesListFilter):
+    title = "state"
+    parameter_name = "state"
+    field_path = "state"
+
+
+class LettingStateListFilter(StateListFilter):
+    field_path = "address__state"
+
+
+@admin.register(Letting)
+class LettingAdmin(ScalableModelAdmin):
+    """
+    Admin for lettings.
+
+    The address is picked with an autocomplete widget instead of a select
+    listing every address, and the changelist loads addresses with a join.
+    """
+
+    list_display = ("title", "address")
+    list_select_related = ("address",)
+    list_filter = (LettingStateListFilter,)
+    search_fields = ("^title",)
+    ordering = ("title", "id")
+    autocomplete_fields = ("address",)
+
+
+@admin.register(Address)
+class AddressAdmin(ScalableModelAdmin):
+    """Admin for addresses, also serving the address autocomplete of lettings."""
+
+    list_display = ("number", "street", "city", "state", "zip_code", "country_iso_code")
+    list_filter = (StateListFilter,)
+    search_fields = ("^street", "^city", "=zip_code")
+    ordering = ("-id",)
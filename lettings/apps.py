@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LettingsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "lettings"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,203 @@
+"""
+Geographic helpers for the lettings radius search.
+
+Addresses are geocoded offline from a local table of postcode centroids
+(``settings.ZIP_CENTROIDS_FILE``, a CSV file with ``country_iso_code``,
+``zip_code``, ``latitude`` and ``longitude`` columns). Each geocoded address
+also stores the geohash of its coordinates, as an integer in an indexed
+column: the bits of its latitude and longitude, interleaved. The addresses
+of any cell of a quadtree over the globe, from a quarter of it down to
+``GEOHASH_BITS`` levels below, then form one range of geohashes, so a
+radius query picks cells of a size fitting its radius and reads each of
+them with an index range scan.
+"""
+
+import csv
+import math
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Q
+
+GEOHASH_BITS = 26
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def _spread(value):
+    """Insert a zero bit before each of the 32 low bits of a number."""
+    value = (value | value << 16) & 0x0000FFFF0000FFFF
+    value = (value | value << 8) & 0x00FF00FF00FF00FF
+    value = (value | value << 4) & 0x0F0F0F0F0F0F0F0F
+    value = (value | value << 2) & 0x3333333333333333
+    return (value | value << 1) & 0x5555555555555555
+
+
+def _interleave(column, row):
+    """Interleave the bits of a column and a row, the column's bit first."""
+    return _spread(column) << 1 | _spread(row)
+
+
+def geohash(latitude, longitude):
+    """
+    Return the geohash of a point, as an integer.
+
+    Args:
+        latitude (float): Latitude in degrees.
+        longitude (float): Longitude in degrees.
+
+    Returns:
+        int: Interleaved ``GEOHASH_BITS`` bits of the longitude and of the
+            latitude, about 0.3 m apart.
+    """
+    side = 1 << GEOHASH_BITS
+    row = min(int((latitude + 90) / 180 * side), side - 1)
+    column = int((longitude + 180) / 360 * side) % side
+    return _interleave(column, row)
+
+
+def cell_range(cell):
+    """
+    Return the first and last geohash of the points in a cell.
+
+    Args:
+        cell (tuple): ``(level, column, row)`` of the cell, in a grid of
+            ``2 ** level`` columns of longitude and rows of latitude.
+    """
+    level, column, row = cell
+    shift = 2 * (GEOHASH_BITS - level)
+    first = _interleave(column << (GEOHASH_BITS - level), row << (GEOHASH_BITS - level))
+    return first, first + (1 << shift) - 1
+
+
+def cell_distance_km(latitude, longitude, cell):
+    """Return the distance from a point to the nearest point of a cell."""
+    level, column, row = cell
+    lat_size, lon_size = 180 / 2**level, 360 / 2**level
+    south = row * lat_size - 90
+    west = column * lon_size - 180
+    nearest_lat = min(max(latitude, south), south + lat_size)
+    # Longitude offset of the point east of the cell's west edge, in [0, 360).
+    offset = (longitude - west) % 360
+    if offset <= lon_size:
+        nearest_lon = longitude
+    elif offset - lon_size < 360 - offset:
+        nearest_lon = west + lon_size
+    else:
+        nearest_lon = west
+    return distances_km(latitude, longitude, [(nearest_lat, nearest_lon)])[0]
+
+
+def children(cell, levels=1):
+    """Return the cells a cell splits into, ``levels`` levels down."""
+    level, column, row = cell
+    side = 2**levels
+    return [
+        (level + levels, column * side + right, row * side + top)
+        for right in range(side)
+        for top in range(side)
+    ]
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """
+    Return the cells that may hold points within a radius of a center.
+
+    The cells are at the deepest level whose cells are at least half the
+    radius high, so a circle is covered by about twenty of them.
+
+    Returns:
+        list: ``(level, column, row)`` of the cells, nearest first.
+    """
+    level = int(math.log2(360 * KM_PER_DEGREE / radius_km))
+    level = min(max(level, 1), GEOHASH_BITS)
+    count = 2**level
+    lat_size, lon_size = 180 / count, 360 / count
+    lat_span = radius_km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(min(abs(latitude) + lat_span, 89.9)))
+    lon_span = min(radius_km / (KM_PER_DEGREE * cos_lat), 180)
+    first_row = max(int(math.floor((latitude - lat_span + 90) / lat_size)), 0)
+    last_row = min(int(math.floor((latitude + lat_span + 90) / lat_size)), count - 1)
+    first_column = int(math.floor((longitude - lon_span + 180) / lon_size))
+    last_column = int(math.floor((longitude + lon_span + 180) / lon_size))
+    columns = range(first_column, min(last_column, first_column + count - 1) + 1)
+
+    cells = []
+    for row in range(first_row, last_row + 1):
+        for column in columns:
+            cell = (level, column % count, row)
+            distance = cell_distance_km(latitude, longitude, cell)
+            if distance <= radius_km:
+                cells.append((distance, cell))
+    return [cell for _distance, cell in sorted(cells)]
+
+
+def cells_query(latitude, longitude, radius_km, field="geohash"):
+    """
+    Build a filter matching the cells that may hold points within a radius.
+
+    Returns:
+        Q: Filter on ``field``, one range per cell of ``covering_cells()``.
+    """
+    query = Q()
+    for cell in covering_cells(latitude, longitude, radius_km):
+        first, last = cell_range(cell)
+        query |= Q(**{field + "__gte": first, field + "__lte": last})
+    return query
+
+
+def distances_km(latitude, longitude, points):
+    """
+    Compute haversine distances from a center to many points.
+
+    Args:
+        latitude (float): Latitude of the center in degrees.
+        longitude (float): Longitude of the center in degrees.
+        points (list): ``(latitude, longitude)`` tuples in degrees.
+
+    Returns:
+        list: Distances in kilometers, in the order of ``points``.
+    """
+    lat0 = math.radians(latitude)
+    lon0 = math.radians(longitude)
+    cos_lat0 = math.cos(lat0)
+    radians, sin, cos, asin, sqrt = math.radians, math.sin, math.cos, math.asin, math.sqrt
+    diameter = 2 * EARTH_RADIUS_KM
+    result = []
+    for lat, lon in points:
+        lat = radians(lat)
+        half_dlat = sin((lat - lat0) / 2)
+        half_dlon = sin((radians(lon) - lon0) / 2)
+        a = half_dlat * half_dlat + cos_lat0 * cos(lat) * half_dlon * half_dlon
+        result.append(diameter * asin(sqrt(min(a, 1.0))))
+    return result
+
+
+@lru_cache(maxsize=4)
+def load_centroids(path=None):
+    """
+    Load the postcode centroid table.
+
+    Args:
+        path (str): CSV file to read, ``settings.ZIP_CENTROIDS_FILE`` by default.
+
+    Returns:
+        dict: ``(latitude, longitude)`` keyed by ``(country_iso_code, zip_code)``.
+    """
+    centroids = {}
+    with open(path or settings.ZIP_CENTROIDS_FILE, newline="") as centroid_file:
+        for row in csv.DictReader(centroid_file):
+            key = (row["country_iso_code"].upper(), int(row["zip_code"]))
+            centroids[key] = (float(row["latitude"]), float(row["longitude"]))
+    return centroids
+
+
+def geocode(country_iso_code, zip_code):
+    """
+    Look up the centroid of a postcode.
+
+    Returns:
+        tuple: ``(latitude, longitude)``, or ``None`` if the postcode is not
+            in the table.
+    """
+    return load_centroids().get((country_iso_code.upper(), zip_code))
@@ -0,0 +1,139 @@
+"""
+Benchmark of the radius search against its latency budget.
+
+``--lettings`` lettings are generated as by the ``seed`` command (clustered
+around the largest US cities, see ``oc_lettings_site.seeding``) and
+inserted in a transaction rolled back at the end. Searches centered on
+cities, and away from them, are then timed with ``_nearest`` and checked
+against the search of the whole radius in a single query, reading every
+address of its cells: both must find lettings at the same distances. The
+command fails if the slowest search takes longer than ``--budget-ms`` on
+average.
+
+Usage:
+    python manage.py bench_near --lettings 1000000 --budget-ms 20
+"""
+
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from lettings.geo import cells_query, distances_km
+from lettings.models import Address, Letting
+from lettings.views import _nearest
+from oc_lettings_site import seeding
+
+RADII = (10, 50, 100)
+
+
+def _single_query(latitude, longitude, radius):
+    """Search the whole radius at once, reading every address in its cells."""
+    candidates = list(
+        Address.objects.filter(cells_query(latitude, longitude, radius), letting__isnull=False)
+        .values_list("letting__id", "letting__title", "latitude", "longitude")
+    )
+    distances = distances_km(latitude, longitude, [row[2:] for row in candidates])
+    return sorted(
+        (
+            {"id": row[0], "title": row[1], "distance": distance}
+            for row, distance in zip(candidates, distances)
+            if distance <= radius
+        ),
+        key=lambda result: result["distance"],
+    )[: settings.NEARBY_MAX_RESULTS]
+
+
+def _timed(func, repeat):
+    """Return the mean duration of a call, in milliseconds, after a warm-up call."""
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return 1000 * (time.perf_counter() - started) / repeat
+
+
+def _insert(count, batch_size=10000):
+    """Insert seeded addresses and lettings, after the existing ones."""
+    first_id = 1 + max(
+        model.objects.aggregate(last=Max("pk"))["last"] or 0 for model in (Address, Letting)
+    )
+    timestamp = connection.ops.adapt_datetimefield_value(timezone.now())
+    address_sql = seeding.insert_sql(connection, Address._meta.db_table, seeding.ADDRESS_COLUMNS)
+    letting_sql = seeding.insert_sql(connection, Letting._meta.db_table, seeding.LETTING_COLUMNS)
+    with connection.cursor() as cursor:
+        for batch, start in enumerate(range(0, count, batch_size)):
+            addresses, lettings, _summaries = seeding.letting_rows(
+                0, batch, first_id + start, min(batch_size, count - start), timestamp
+            )
+            cursor.executemany(address_sql, addresses)
+            cursor.executemany(letting_sql, lettings)
+
+
+def _centers(cities):
+    """Return search centers on the largest cities and at random points around them."""
+    rng = random.Random(0)
+    centers = []
+    for name, _state, _zip, latitude, longitude, _population in seeding.CITIES[:cities]:
+        centers.append((name, latitude, longitude))
+        centers.append(
+            (name + " outskirts", latitude + rng.gauss(0, 0.2), longitude + rng.gauss(0, 0.2))
+        )
+    return centers
+
+
+class Command(BaseCommand):
+    help = "Time the radius search on seeded lettings and check it against its budget."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lettings", type=int, default=1000000, help="Seeded lettings to search."
+        )
+        parser.add_argument("--cities", type=int, default=5, help="Cities searched around.")
+        parser.add_argument("--repeat", type=int, default=20, help="Searches timed per case.")
+        parser.add_argument(
+            "--budget-ms", type=float, default=20.0, help="Slowest mean search allowed."
+        )
+
+    def handle(self, *args, **options):
+        timings = []
+        with transaction.atomic():
+            started = time.perf_counter()
+            _insert(options["lettings"])
+            self.stdout.write(
+                "Inserted %d lettings in %.1fs"
+                % (options["lettings"], time.perf_counter() - started)
+            )
+            for name, latitude, longitude in _centers(options["cities"]):
+                for radius in RADII:
+                    found = _nearest(latitude, longitude, radius)
+                    expected = _single_query(latitude, longitude, radius)
+                    if [r["distance"] for r in found] != [r["distance"] for r in expected]:
+                        raise CommandError(
+                            "The searches around %s within %d km found different lettings."
+                            % (name, radius)
+                        )
+                    elapsed = _timed(
+                        lambda: _nearest(latitude, longitude, radius), options["repeat"]
+                    )
+                    timings.append(elapsed)
+                    self.stdout.write(
+                        "%-24s %3d km  %2d results  %6.2f ms"
+                        % (name, radius, len(found), elapsed)
+                    )
+            transaction.set_rollback(True)
+        if max(timings) > options["budget_ms"]:
+            raise CommandError(
+                "The slowest search took %.2f ms, over the %.0f ms budget."
+                % (max(timings), options["budget_ms"])
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Slowest search %.2f ms, within the %.0f ms budget."
+                % (max(timings), options["budget_ms"])
+            )
+        )
@@ -0,0 +1,94 @@
+"""
+Report, and optionally merge, duplicate addresses.
+
+Addresses are duplicates when their normalized keys are equal (see
+``oc_lettings_site.normalization.address_key``). The duplicate keys are
+found with a single grouped pass over the key index, then the addresses
+of those keys are read in chunks of keys.
+
+``--merge`` deletes the duplicates that no letting uses, keeping the
+addresses of lettings, or the oldest address of a group without any. A
+letting has its own address, so the groups left with several lettings at
+the same address are reported rather than merged.
+
+Usage:
+    python manage.py dedupe_addresses
+    python manage.py dedupe_addresses --merge
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from lettings.models import Address
+
+
+class Command(BaseCommand):
+    help = "Report the duplicate addresses, and merge them with --merge."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=500, help="Duplicate keys read at a time."
+        )
+        parser.add_argument(
+            "--limit", type=int, default=20, help="Duplicate groups listed in the report."
+        )
+        parser.add_argument(
+            "--merge",
+            action="store_true",
+            help="Delete the duplicates that no letting uses.",
+        )
+
+    def handle(self, *args, **options):
+        keys = list(
+            Address.objects.exclude(normalized_key="")
+            .values("normalized_key")
+            .annotate(count=Count("id"))
+            .filter(count__gt=1)
+            .order_by()
+            .values_list("normalized_key", flat=True)
+        )
+        duplicates = deleted = shared = 0
+        listed = 0
+        for start in range(0, len(keys), options["chunk_size"]):
+            groups = {}
+            chunk = keys[start:start + options["chunk_size"]]
+            rows = (
+                Address.objects.filter(normalized_key__in=chunk)
+                .order_by("normalized_key", "pk")
+                .values_list("normalized_key", "pk", "letting__id")
+            )
+            for key, pk, letting_id in rows:
+                groups.setdefault(key, []).append((pk, letting_id))
+            redundant = []
+            for members in groups.values():
+                duplicates += len(members) - 1
+                if listed < options["limit"]:
+                    address = Address.objects.get(pk=members[0][0])
+                    self.stdout.write(
+                        "%s: %s"
+                        % (address, ", ".join("#%d" % pk for pk, _ in members))
+                    )
+                    listed += 1
+                used = [pk for pk, letting_id in members if letting_id is not None]
+                if len(used) > 1:
+                    shared += 1
+                keep = set(used) or {members[0][0]}
+                redundant.extend(pk for pk, _ in members if pk not in keep)
+            if options["merge"] and redundant:
+                with transaction.atomic():
+                    deleted += Address.objects.filter(
+                        pk__in=redundant, letting__isnull=True
+                    ).delete()[0]
+
+        self.stdout.write(
+            "%d duplicate groups, %d duplicate addresses" % (len(keys), duplicates)
+        )
+        if shared:
+            self.stdout.write(
+                self.style.WARNING(
+                    "%d groups have several lettings at the same address" % shared
+                )
+            )
+        if options["merge"]:
+            self.stdout.write(self.style.SUCCESS("Deleted %d duplicate addresses" % deleted))
@@ -0,0 +1,63 @@
+"""
+Geocode addresses from the local postcode centroid table.
+
+Addresses without coordinates (or all of them with ``--all``) are read in
+primary key chunks, located with ``settings.ZIP_CENTROIDS_FILE`` and updated
+with one bulk update per chunk, along with their geohash. No external
+service is called. Saved addresses are geocoded as they are saved (see
+``lettings.signals``); this command catches up after bulk inserts.
+
+Usage:
+    python manage.py geocode_addresses --chunk-size 5000
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lettings.geo import geocode, geohash
+from lettings.models import Address
+
+
+class Command(BaseCommand):
+    help = "Fill the coordinates of addresses from the postcode centroid table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=5000, help="Addresses per chunk."
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Geocode addresses that already have coordinates too.",
+        )
+
+    def handle(self, *args, **options):
+        addresses = Address.objects.order_by("pk").only("pk", "zip_code", "country_iso_code")
+        if not options["all"]:
+            addresses = addresses.filter(latitude__isnull=True)
+
+        geocoded = missing = 0
+        last_pk = 0
+        while True:
+            chunk = list(addresses.filter(pk__gt=last_pk)[: options["chunk_size"]])
+            if not chunk:
+                break
+            located = []
+            for address in chunk:
+                point = geocode(address.country_iso_code, address.zip_code)
+                if point is None:
+                    missing += 1
+                    continue
+                address.latitude, address.longitude = point
+                address.geohash = geohash(*point)
+                located.append(address)
+            with transaction.atomic():
+                Address.objects.bulk_update(located, ["latitude", "longitude", "geohash"])
+            geocoded += len(located)
+            last_pk = chunk[-1].pk
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Geocoded %d addresses, %d postcodes not found" % (geocoded, missing)
+            )
+        )
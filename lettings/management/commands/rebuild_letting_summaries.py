@@ -0,0 +1,61 @@
+"""
+Rebuild the LettingSummary read model from the lettings and addresses tables.
+
+The lettings are read in primary key order, one chunk at a time, and each
+chunk of summaries is upserted in a single statement, so the command runs
+in constant memory and can be interrupted and rerun at any point. It is
+needed after loading rows without going through the ORM signals.
+
+Usage:
+    python manage.py rebuild_letting_summaries --chunk-size 5000
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lettings import recommendations
+from lettings.models import Letting, LettingSummary
+
+
+class Command(BaseCommand):
+    help = "Repopulate the letting summaries used by the listing pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=5000, help="Lettings per chunk."
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete every summary before rebuilding.",
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            LettingSummary.objects.all().delete()
+
+        rebuilt = 0
+        last_pk = 0
+        while True:
+            chunk = list(
+                Letting.objects.filter(pk__gt=last_pk)
+                .select_related("address")
+                .order_by("pk")[: options["chunk_size"]]
+            )
+            if not chunk:
+                break
+            summaries = [LettingSummary.from_letting(letting) for letting in chunk]
+            with transaction.atomic():
+                LettingSummary.objects.bulk_create(
+                    summaries,
+                    update_conflicts=True,
+                    unique_fields=["letting"],
+                    update_fields=["title", "city", "state", "city_key", "updated_at"],
+                )
+            recommendations.invalidate(*(summary.city_key for summary in summaries))
+            rebuilt += len(chunk)
+            last_pk = chunk[-1].pk
+            if options["verbosity"] > 1:
+                self.stdout.write("%d summaries rebuilt" % rebuilt)
+
+        self.stdout.write(self.style.SUCCESS("Rebuilt %d letting summaries" % rebuilt))
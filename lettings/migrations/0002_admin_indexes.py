@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Index the columns the admin sorts, searches and filters on.
+    """
+
+    dependencies = [
+        ("lettings", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="address",
+            index=models.Index(fields=["city"], name="address_city_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="address",
+            index=models.Index(fields=["state"], name="address_state_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="address",
+            index=models.Index(fields=["street"], name="address_street_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="letting",
+            index=models.Index(fields=["title"], name="letting_title_idx"),
+        ),
+    ]
@@ -0,0 +1,72 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+CHUNK_SIZE = 2000
+
+
+def populate_summaries(apps, schema_editor):
+    """Fill the summary table from the existing lettings, in primary key chunks."""
+    Letting = apps.get_model("lettings", "Letting")
+    LettingSummary = apps.get_model("lettings", "LettingSummary")
+    last_pk = 0
+    while True:
+        chunk = list(
+            Letting.objects.filter(pk__gt=last_pk)
+            .select_related("address")
+            .order_by("pk")[:CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+        LettingSummary.objects.bulk_create(
+            LettingSummary(
+                letting_id=letting.pk,
+                title=letting.title,
+                city=letting.address.city,
+                state=letting.address.state,
+            )
+            for letting in chunk
+        )
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+    """
+    Add the LettingSummary read model and fill it from the existing lettings.
+    """
+
+    dependencies = [
+        ("lettings", "0002_admin_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LettingSummary",
+            fields=[
+                (
+                    "letting",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="summary",
+                        serialize=False,
+                        to="lettings.letting",
+                    ),
+                ),
+                ("title", models.CharField(max_length=256)),
+                ("city", models.CharField(max_length=64)),
+                ("state", models.CharField(max_length=2)),
+            ],
+            options={
+                "db_table": "lettings_lettingsummary",
+                "verbose_name": "Letting summary",
+                "verbose_name_plural": "Letting summaries",
+                "ordering": ["title", "letting_id"],
+                "indexes": [
+                    models.Index(
+                        fields=["title", "letting"], name="lettingsummary_title_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
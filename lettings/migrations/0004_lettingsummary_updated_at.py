@@ -0,0 +1,23 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    """
+    Track when each letting summary last changed, for the sitemap lastmod.
+    """
+
+    dependencies = [
+        ("lettings", "0003_lettingsummary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lettingsummary",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Add the coordinates of addresses and their indexed grid cell.
+    """
+
+    dependencies = [
+        ("lettings", "0004_lettingsummary_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="address",
+            name="latitude",
+            field=models.FloatField(
+                blank=True, null=True, help_text="Latitude in degrees"
+            ),
+        ),
+        migrations.AddField(
+            model_name="address",
+            name="longitude",
+            field=models.FloatField(
+                blank=True, null=True, help_text="Longitude in degrees"
+            ),
+        ),
+        migrations.AddField(
+            model_name="address",
+            name="grid_cell",
+            field=models.IntegerField(
+                blank=True, db_index=True, editable=False, null=True
+            ),
+        ),
+    ]
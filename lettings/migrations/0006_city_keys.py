@@ -0,0 +1,65 @@
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+CHUNK_SIZE = 2000
+
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def city_key(name):
+    """
+    Return the normalized form of a city name.
+
+    A copy of ``oc_lettings_site.normalization.city_key`` as of this
+    migration, so later changes to it do not change what this migration
+    writes.
+    """
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return "-".join(word for word in _SEPARATORS.split(stripped) if word)[:64]
+
+
+def populate_city_keys(apps, schema_editor):
+    """Fill the city keys of the existing summaries, in primary key chunks."""
+    LettingSummary = apps.get_model("lettings", "LettingSummary")
+    last_pk = 0
+    while True:
+        chunk = list(
+            LettingSummary.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .only("pk", "city")[:CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+        for summary in chunk:
+            summary.city_key = city_key(summary.city)
+        LettingSummary.objects.bulk_update(chunk, ["city_key"])
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+    """
+    Add the normalized city key of each letting summary, with the index
+    listing the lettings of a city in title order.
+    """
+
+    dependencies = [
+        ("lettings", "0005_address_coordinates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lettingsummary",
+            name="city_key",
+            field=models.CharField(default="", editable=False, max_length=64),
+        ),
+        migrations.RunPython(populate_city_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="lettingsummary",
+            index=models.Index(
+                fields=["city_key", "title", "letting"], name="lettingsummary_city_idx"
+            ),
+        ),
+    ]
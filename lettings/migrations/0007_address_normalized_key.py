@@ -0,0 +1,93 @@
+import hashlib
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+CHUNK_SIZE = 2000
+
+_SEPARATORS = re.compile(r"[\W_]+")
+
+STREET_ABBREVIATIONS = {
+    "avenue": "ave",
+    "boulevard": "blvd",
+    "court": "ct",
+    "drive": "dr",
+    "lane": "ln",
+    "place": "pl",
+    "road": "rd",
+    "street": "st",
+}
+
+
+def _words(text):
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return [word for word in _SEPARATORS.split(stripped) if word]
+
+
+def address_key(number, street, city, state, zip_code, country_iso_code):
+    """
+    Return the normalized key of an address.
+
+    A copy of ``oc_lettings_site.normalization.address_key`` as of this
+    migration, so later changes to it do not change what this migration
+    writes.
+    """
+    street_words = [STREET_ABBREVIATIONS.get(word, word) for word in _words(street)]
+    normalized = "|".join(
+        [
+            str(number),
+            "-".join(street_words),
+            "-".join(_words(city))[:64],
+            "-".join(_words(state)),
+            str(zip_code),
+            "-".join(_words(country_iso_code)),
+        ]
+    )
+    return hashlib.sha1(normalized.encode(), usedforsecurity=False).hexdigest()
+
+
+def populate_normalized_keys(apps, schema_editor):
+    """Fill the normalized keys of the existing addresses, in primary key chunks."""
+    Address = apps.get_model("lettings", "Address")
+    last_pk = 0
+    while True:
+        chunk = list(Address.objects.filter(pk__gt=last_pk).order_by("pk")[:CHUNK_SIZE])
+        if not chunk:
+            break
+        for address in chunk:
+            address.normalized_key = address_key(
+                address.number,
+                address.street,
+                address.city,
+                address.state,
+                address.zip_code,
+                address.country_iso_code,
+            )
+        Address.objects.bulk_update(chunk, ["normalized_key"])
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+    """
+    Add the normalized key of each address, with the index grouping the
+    duplicate addresses.
+    """
+
+    dependencies = [
+        ("lettings", "0006_city_keys"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="address",
+            name="normalized_key",
+            field=models.CharField(blank=True, default="", editable=False, max_length=40),
+        ),
+        migrations.RunPython(populate_normalized_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="address",
+            index=models.Index(fields=["normalized_key"], name="address_normalized_key_idx"),
+        ),
+    ]
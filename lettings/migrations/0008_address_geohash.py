@@ -0,0 +1,74 @@
+from django.db import migrations, models
+
+CHUNK_SIZE = 2000
+GEOHASH_BITS = 26
+
+
+def _spread(value):
+    value = (value | value << 16) & 0x0000FFFF0000FFFF
+    value = (value | value << 8) & 0x00FF00FF00FF00FF
+    value = (value | value << 4) & 0x0F0F0F0F0F0F0F0F
+    value = (value | value << 2) & 0x3333333333333333
+    return (value | value << 1) & 0x5555555555555555
+
+
+def geohash(latitude, longitude):
+    """
+    Return the geohash of a point, as an integer.
+
+    A copy of ``lettings.geo.geohash`` as of this migration, so later
+    changes to it do not change what this migration writes.
+    """
+    side = 1 << GEOHASH_BITS
+    row = min(int((latitude + 90) / 180 * side), side - 1)
+    column = int((longitude + 180) / 360 * side) % side
+    return _spread(column) << 1 | _spread(row)
+
+
+def populate_geohashes(apps, schema_editor):
+    """Fill the geohashes of the geocoded addresses, in primary key chunks."""
+    Address = apps.get_model("lettings", "Address")
+    addresses = Address.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    last_pk = 0
+    while True:
+        chunk = list(
+            addresses.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .only("pk", "latitude", "longitude")[:CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+        for address in chunk:
+            address.geohash = geohash(address.latitude, address.longitude)
+        Address.objects.bulk_update(chunk, ["geohash"])
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+    """
+    Replace the 0.1 degree grid cell of addresses with their geohash, which
+    indexes cells of any size, in an index covering the coordinates.
+    """
+
+    dependencies = [
+        ("lettings", "0007_address_normalized_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="address",
+            name="geohash",
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(populate_geohashes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="address",
+            index=models.Index(
+                fields=["geohash", "latitude", "longitude"], name="address_geohash_idx"
+            ),
+        ),
+        migrations.RemoveField(
+            model_name="address",
+            name="grid_cell",
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.core.validators import MaxValueValidator, MinLengthValidator
 
+from oc_lettings_site.normalization import ADDRESS_KEY_LENGTH, address_key, city_key
+from .geo import geohash
+
 
 class Address(models.Model):
     """
@@ -17,6 +20,14 @@ class Address(models.Model):
         state (CharField): State abbreviation, exactly 2 characters.
         zip_code (PositiveIntegerField): Postal code, must be between 1-99999.
         country_iso_code (CharField): ISO country code, exactly 3 characters.
+        latitude (FloatField): Latitude in degrees, if geocoded.
+        longitude (FloatField): Longitude in degrees, if geocoded.
+        geohash (BigIntegerField): Geohash of the coordinates, maintained
+            on save and indexed along with them, so the radius search
+            reads the coordinates from the index (see ``lettings.geo``).
+        normalized_key (CharField): Indexed hash of the normalized address,
+            shared by duplicate addresses, maintained on save (see
+            ``oc_lettings_site.normalization.address_key``).
 
     Note:
         This model uses a custom database table name 'lettings_address'
@@ -41,11 +52,64 @@ class Address(models.Model):
         validators=[MinLengthValidator(3)],
         help_text="ISO country code (exactly 3 characters)",
     )
+    latitude = models.FloatField(null=True, blank=True, help_text="Latitude in degrees")
+    longitude = models.FloatField(null=True, blank=True, help_text="Longitude in degrees")
+    geohash = models.BigIntegerField(null=True, blank=True, editable=False)
+    normalized_key = models.CharField(
+        max_length=ADDRESS_KEY_LENGTH, default="", blank=True, editable=False
+    )
+
+    def set_derived_fields(self):
+        """
+        Compute the geohash and the normalized key from the other fields.
+
+        Called by ``save()``; bulk inserts must call it on each address.
+        """
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = None
+        self.normalized_key = address_key(
+            self.number,
+            self.street,
+            self.city,
+            self.state,
+            self.zip_code,
+            self.country_iso_code,
+        )
+
+    def save(self, *args, **kwargs):
+        """
+        Save the address, updating its geohash and normalized key.
+        """
+        self.set_derived_fields()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = set(kwargs["update_fields"]) | {
+                "geohash",
+                "normalized_key",
+            }
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        """
+        String representation of the Address model.
+
+        Returns:
+            str: The street address and city, e.g. "7 Main Street, Anytown".
+        """
+        return f"{self.number} {self.street}, {self.city}"
 
     class Meta:
         db_table = "lettings_address"
         verbose_name = "Address"
         verbose_name_plural = "Addresses"
+        indexes = [
+            models.Index(fields=["city"], name="address_city_idx"),
+            models.Index(fields=["state"], name="address_state_idx"),
+            models.Index(fields=["street"], name="address_street_idx"),
+            models.Index(fields=["normalized_key"], name="address_normalized_key_idx"),
+            models.Index(fields=["geohash", "latitude", "longitude"], name="address_geohash_idx"),
+        ]
 
 
 class Letting(models.Model):
@@ -75,8 +139,86 @@ class Letting(models.Model):
         help_text="Associated address for this letting",
     )
 
+    def __str__(self):
+        """
+        String representation of the Letting model.
+
+        Returns:
+            str: The title of the letting.
+        """
+        return self.title
+
     class Meta:
         db_table = "lettings_letting"
         verbose_name = "Letting"
         verbose_name_plural = "Lettings"
         ordering = ["title"]
+        indexes = [
+            models.Index(fields=["title"], name="letting_title_idx"),
+        ]
+
+
+class LettingSummary(models.Model):
+    """
+    Denormalized read model of a letting for the listing and search pages.
+
+    Each row copies the few columns these pages display from a Letting and
+    its Address, so they are served from this table alone, in title order,
+    by a scan of its covering index instead of a join. Rows are kept up to
+    date by the signal handlers in ``lettings.signals`` and can be rebuilt
+    with the ``rebuild_letting_summaries`` management command.
+
+    Attributes:
+        letting (OneToOneField): The summarized Letting, also the primary key.
+        title (CharField): Copy of ``Letting.title``.
+        city (CharField): Copy of ``Address.city``.
+        state (CharField): Copy of ``Address.state``.
+        city_key (CharField): Normalized ``city``, matched against
+            ``Profile.favorite_city_key`` to recommend lettings.
+        updated_at (DateTimeField): Last change of the letting or its
+            address, used as the sitemap ``lastmod``.
+    """
+
+    letting = models.OneToOneField(
+        Letting, on_delete=models.CASCADE, primary_key=True, related_name="summary"
+    )
+    title = models.CharField(max_length=256)
+    city = models.CharField(max_length=64)
+    state = models.CharField(max_length=2)
+    city_key = models.CharField(max_length=64, default="", editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def from_letting(cls, letting):
+        """
+        Build the summary of a letting, without saving it.
+
+        Args:
+            letting (Letting): The letting, whose address should already be
+                loaded to avoid a query.
+
+        Returns:
+            LettingSummary: The unsaved summary.
+        """
+        return cls(
+            letting_id=letting.pk,
+            title=letting.title,
+            city=letting.address.city,
+            state=letting.address.state,
+            city_key=city_key(letting.address.city),
+        )
+
+    def __str__(self):
+        return self.title
+
+    class Meta:
+        db_table = "lettings_lettingsummary"
+        verbose_name = "Letting summary"
+        verbose_name_plural = "Letting summaries"
+        ordering = ["title", "letting_id"]
+        indexes = [
+            models.Index(fields=["title", "letting"], name="lettingsummary_title_idx"),
+            models.Index(
+                fields=["city_key", "title", "letting"], name="lettingsummary_city_idx"
+            ),
+        ]
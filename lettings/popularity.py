@@ -0,0 +1,43 @@
+"""
+Most viewed lettings, from the page view counters.
+
+The ranking is read from the ``pageviewcount_ranking_idx`` index of the
+counters, with the title of each letting from its summary row, in one
+query, and cached for ``POPULAR_LETTINGS_CACHE_TIMEOUT`` seconds. Counters
+of deleted lettings have no summary and are left out.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BigIntegerField, OuterRef, Subquery
+from django.db.models.functions import Cast
+
+from oc_lettings_site.models import PageViewCount
+from .models import LettingSummary
+
+CACHE_KEY = "popular-lettings"
+
+
+def popular_lettings():
+    """
+    Return the most viewed lettings.
+
+    Returns:
+        list: Dicts with the ``id``, ``title`` and ``views`` of at most
+            ``POPULAR_LETTINGS_LIMIT`` lettings, most viewed first.
+    """
+    lettings = cache.get(CACHE_KEY)
+    if lettings is None:
+        title = LettingSummary.objects.filter(
+            letting_id=Cast(OuterRef("object_key"), BigIntegerField())
+        ).values("title")[:1]
+        rows = (
+            PageViewCount.objects.filter(kind="letting")
+            .annotate(title=Subquery(title))
+            .filter(title__isnull=False)
+            .order_by("-count")
+            .values_list("object_key", "title", "count")[: settings.POPULAR_LETTINGS_LIMIT]
+        )
+        lettings = [{"id": int(key), "title": title, "views": views} for key, title, views in rows]
+        cache.set(CACHE_KEY, lettings, settings.POPULAR_LETTINGS_CACHE_TIMEOUT)
+    return lettings
@@ -0,0 +1,55 @@
+"""
+Lettings recommended to a profile, from its favorite city.
+
+The top lettings of each city, in title order, are read from the
+``lettingsummary_city_idx`` covering index of the LettingSummary table and
+cached per city key, empty lists included. The signal handlers in
+``lettings.signals`` delete, in a background task, the cached list of every city a letting enters
+or leaves, so profile pages read it from the cache until it changes.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from oc_lettings_site.tasks import task
+from .models import LettingSummary
+
+
+def _cache_key(key):
+    return "city-lettings:%s" % key
+
+
+def city_lettings(key):
+    """
+    Return the first lettings of a city, in title order.
+
+    Args:
+        key (str): Normalized city, as stored in ``city_key`` fields.
+
+    Returns:
+        list: Dicts with the ``id`` and ``title`` of at most
+            ``RECOMMENDATIONS_LIMIT`` lettings, empty for an empty key.
+    """
+    if not key:
+        return []
+    lettings = cache.get(_cache_key(key))
+    if lettings is None:
+        lettings = list(
+            LettingSummary.objects.filter(city_key=key)
+            .order_by("title", "letting_id")
+            .values("title", id=F("letting_id"))[: settings.RECOMMENDATIONS_LIMIT]
+        )
+        cache.set(_cache_key(key), lettings, settings.RECOMMENDATIONS_CACHE_TIMEOUT)
+    return lettings
+
+
+@task
+def invalidate(*keys):
+    """
+    Delete the cached lettings of cities.
+
+    Args:
+        *keys (str): Normalized cities whose lettings changed.
+    """
+    cache.delete_many([_cache_key(key) for key in set(keys) if key])
@@ -0,0 +1,85 @@
+"""
+Signal handlers keeping the LettingSummary read model in sync.
+
+Saving a Letting rewrites its summary row and saving an Address updates the
+summary of its letting in place. Deleting a Letting deletes its summary
+through the foreign key cascade. Each change also invalidates the cached
+recommendations of the cities the letting was and is in, in a background
+task (see ``oc_lettings_site.tasks``).
+
+Saving an address without coordinates geocodes it from its postcode in a
+background task, so it shows up in the radius search.
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from oc_lettings_site.normalization import city_key
+from oc_lettings_site.tasks import task
+from . import recommendations
+from .geo import geocode, geohash
+from .models import Address, Letting, LettingSummary
+
+
+def _summary_city_keys(**filters):
+    return list(LettingSummary.objects.filter(**filters).values_list("city_key", flat=True))
+
+
+@receiver(post_save, sender=Letting, dispatch_uid="lettings_summary_letting_saved")
+def letting_saved(sender, instance, created=False, raw=False, **kwargs):
+    """Create or refresh the summary of a saved letting."""
+    if raw:
+        return
+    previous = [] if created else _summary_city_keys(pk=instance.pk)
+    summary = LettingSummary.from_letting(instance)
+    summary.save(force_insert=created)
+    recommendations.invalidate.defer(summary.city_key, *previous)
+
+
+@receiver(post_save, sender=Address, dispatch_uid="lettings_summary_address_saved")
+def address_saved(sender, instance, created=False, raw=False, **kwargs):
+    """Copy the new city and state of an address into its letting's summary."""
+    if raw or created:
+        return
+    previous = _summary_city_keys(letting__address=instance)
+    if not previous:
+        return
+    key = city_key(instance.city)
+    LettingSummary.objects.filter(letting__address=instance).update(
+        city=instance.city, state=instance.state, city_key=key, updated_at=timezone.now()
+    )
+    recommendations.invalidate.defer(key, *previous)
+
+
+@task
+def geocode_address(pk):
+    """
+    Fill the coordinates of an address still missing them.
+
+    Args:
+        pk (int): Primary key of the address.
+    """
+    address = (
+        Address.objects.filter(pk=pk, latitude__isnull=True)
+        .values("country_iso_code", "zip_code")
+        .first()
+    )
+    point = address and geocode(address["country_iso_code"], address["zip_code"])
+    if point:
+        Address.objects.filter(pk=pk, latitude__isnull=True).update(
+            latitude=point[0], longitude=point[1], geohash=geohash(*point)
+        )
+
+
+@receiver(post_save, sender=Address, dispatch_uid="lettings_address_geocode")
+def address_located(sender, instance, raw=False, **kwargs):
+    """Geocode a saved address without coordinates."""
+    if not raw and instance.latitude is None:
+        geocode_address.defer(instance.pk)
+
+
+@receiver(post_delete, sender=LettingSummary, dispatch_uid="lettings_summary_deleted")
+def summary_deleted(sender, instance, **kwargs):
+    """Drop the cached recommendations of the city of a deleted letting."""
+    recommendations.invalidate.defer(instance.city_key)
@@ -1,8 +1,16 @@
-from django.test import TestCase, Client
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.db import IntegrityError
-from .models import Address, Letting
+from oc_lettings_site.admin_tools import CappedCountPaginator
+from .geo import cell_range, cells_query, covering_cells, distances_km, geocode, geohash
+from .models import Address, Letting, LettingSummary
 
 
 class AddressModelTest(TestCase):
@@ -188,8 +196,13 @@ class LettingsViewsTest(TestCase):
         self.assertIn("lettings_list", response.context)
         lettings_list = response.context["lettings_list"]
         self.assertEqual(len(lettings_list), 2)
-        self.assertIn(self.letting1, lettings_list)
-        self.assertIn(self.letting2, lettings_list)
+        self.assertEqual(
+            list(lettings_list),
+            [
+                {"id": self.letting1.id, "title": "Beautiful Apartment"},
+                {"id": self.letting2.id, "title": "Cozy House"},
+            ],
+        )
 
     def test_index_view_content(self):
         """Test that index view contains letting titles."""
@@ -273,3 +286,475 @@ class LettingsURLsTest(TestCase):
         """Test that letting detail URL is accessible."""
         response = self.client.get(f"/lettings/{self.letting.id}/")
         self.assertEqual(response.status_code, 200)
+
+
+class LettingsAdminTest(TestCase):
+    """Tests for the lettings and addresses admin."""
+
+    def setUp(self):
+        """Log in a superuser and create a few lettings."""
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "adminpass")
+        self.client.force_login(self.admin)
+        for index in range(5):
+            address = Address.objects.create(
+                number=index + 1,
+                street="Street %d" % index,
+                city="Anytown",
+                state="CA" if index % 2 else "NY",
+                zip_code=10000 + index,
+                country_iso_code="USA",
+            )
+            Letting.objects.create(title="Letting %d" % index, address=address)
+
+    def test_letting_changelist_queries_do_not_grow_with_rows(self):
+        """Test that the changelist loads addresses with a join."""
+        url = reverse("admin:lettings_letting_changelist")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        address = Address.objects.create(
+            number=99,
+            street="Extra",
+            city="Anytown",
+            state="CA",
+            zip_code=1,
+            country_iso_code="USA",
+        )
+        Letting.objects.create(title="Letting extra", address=address)
+        with CaptureQueriesContext(connection) as more:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(few), len(more))
+        self.assertContains(response, "Letting extra")
+
+    def test_letting_change_form_uses_autocomplete(self):
+        """Test that the address field does not list every address."""
+        response = self.client.get(reverse("admin:lettings_letting_add"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "admin-autocomplete")
+        self.assertNotContains(response, "Street 3, Anytown")
+
+    def test_address_autocomplete_searches_by_prefix(self):
+        """Test that the address autocomplete matches street prefixes."""
+        response = self.client.get(
+            reverse("admin:autocomplete"),
+            {
+                "term": "Street 2",
+                "app_label": "lettings",
+                "model_name": "letting",
+                "field_name": "address",
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        results = [result["text"] for result in response.json()["results"]]
+        self.assertEqual(results, ["3 Street 2, Anytown"])
+
+    def test_address_search_by_zip_code(self):
+        """Test that exact searches ignore non-numeric terms on the zip code."""
+        url = reverse("admin:lettings_address_changelist")
+        response = self.client.get(url, {"q": "10003"})
+        self.assertContains(response, "Street 3")
+        self.assertNotContains(response, "Street 4")
+        response = self.client.get(url, {"q": "Nowhere"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_letting_filter_by_state(self):
+        """Test the cached state filter on the letting changelist."""
+        url = reverse("admin:lettings_letting_changelist")
+        response = self.client.get(url, {"state": "CA"})
+        self.assertContains(response, "Letting 1")
+        self.assertNotContains(response, "Letting 2")
+
+    def test_capped_count_paginator(self):
+        """Test that the paginator stops counting at its limit."""
+        paginator = CappedCountPaginator(Letting.objects.all(), 2)
+        paginator.count_limit = 3
+        self.assertEqual(paginator.count, 3)
+        self.assertEqual(paginator.num_pages, 2)
+
+
+class LettingSummaryTest(TestCase):
+    """Tests for the LettingSummary read model."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.address = Address.objects.create(
+            number=123,
+            street="Main Street",
+            city="Anytown",
+            state="CA",
+            zip_code=12345,
+            country_iso_code="USA",
+        )
+        self.letting = Letting.objects.create(title="Beautiful Apartment", address=self.address)
+
+    def test_summary_created_with_letting(self):
+        """Test that creating a letting creates its summary."""
+        summary = LettingSummary.objects.get(letting=self.letting)
+        self.assertEqual(summary.title, "Beautiful Apartment")
+        self.assertEqual(summary.city, "Anytown")
+        self.assertEqual(summary.state, "CA")
+
+    def test_summary_follows_letting_and_address_changes(self):
+        """Test that saving a letting or its address updates the summary."""
+        self.letting.title = "Renamed"
+        self.letting.save()
+        self.address.city = "Elsewhere"
+        self.address.save()
+        summary = LettingSummary.objects.get(letting=self.letting)
+        self.assertEqual(summary.title, "Renamed")
+        self.assertEqual(summary.city, "Elsewhere")
+
+    def test_summary_deleted_with_letting(self):
+        """Test that deleting a letting deletes its summary."""
+        self.letting.delete()
+        self.assertFalse(LettingSummary.objects.exists())
+
+    def test_rebuild_command(self):
+        """Test that the rebuild command restores missing and stale summaries."""
+        other = Address.objects.create(
+            number=1,
+            street="Oak Avenue",
+            city="Somewhere",
+            state="NY",
+            zip_code=54321,
+            country_iso_code="USA",
+        )
+        second = Letting.objects.create(title="Cozy House", address=other)
+        LettingSummary.objects.filter(letting=second).delete()
+        LettingSummary.objects.filter(letting=self.letting).update(title="Stale")
+
+        call_command("rebuild_letting_summaries", chunk_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            list(LettingSummary.objects.values_list("letting_id", "title")),
+            [(self.letting.id, "Beautiful Apartment"), (second.id, "Cozy House")],
+        )
+
+    def test_index_is_a_single_covering_index_scan(self):
+        """Test that the lettings index runs one query served by the covering index."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("lettings:index"))
+        self.assertEqual(len(queries), 1)
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + queries[0]["sql"])
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn("COVERING INDEX lettingsummary_title_idx", plan)
+
+
+class NearbyLettingsTest(TestCase):
+    """Tests for the radius search of lettings."""
+
+    def setUp(self):
+        """Set up lettings around Portland, Maine and one far away."""
+        self.places = {
+            "Center": (43.6591, -70.2568),
+            "Close": (43.6800, -70.3000),
+            "Farther": (43.9000, -70.1000),
+            "Faraway": (40.7128, -74.0060),
+        }
+        for number, (title, (latitude, longitude)) in enumerate(self.places.items(), start=1):
+            address = Address.objects.create(
+                number=number,
+                street="Main Street",
+                city="Portland",
+                state="ME",
+                zip_code=4101,
+                country_iso_code="USA",
+                latitude=latitude,
+                longitude=longitude,
+            )
+            Letting.objects.create(title=title, address=address)
+
+    def test_geohash_saved_with_coordinates(self):
+        """Test that saving an address stores the geohash of its coordinates."""
+        address = Address.objects.get(letting__title="Close")
+        self.assertEqual(address.geohash, geohash(43.68, -70.3))
+        address.latitude = address.longitude = None
+        address.save(update_fields=["latitude", "longitude"])
+        address.refresh_from_db()
+        self.assertIsNone(address.geohash)
+
+    def test_covering_cells_hold_the_circle(self):
+        """Test that the cells covering a circle hold the points within it."""
+        center = self.places["Center"]
+        for radius in (0.25, 3, 40, 100):
+            cells = covering_cells(*center, radius)
+            self.assertLessEqual(len(cells), 25)
+            ranges = [cell_range(cell) for cell in cells]
+            for latitude, longitude in self.places.values():
+                if distances_km(*center, [(latitude, longitude)])[0] <= radius:
+                    code = geohash(latitude, longitude)
+                    self.assertTrue(any(first <= code <= last for first, last in ranges))
+
+    def test_distances_km(self):
+        """Test that haversine distances match known values."""
+        paris, london = (48.8566, 2.3522), (51.5074, -0.1278)
+        (distance,) = distances_km(*paris, [london])
+        self.assertAlmostEqual(distance, 343.5, delta=1)
+        self.assertEqual(distances_km(*paris, [paris]), [0.0])
+
+    def test_cells_query_wraps_around_antimeridian(self):
+        """Test that the cell ranges include points across the 180th meridian."""
+        Address.objects.create(
+            number=9,
+            street="Beach Road",
+            city="Suva",
+            state="FJ",
+            zip_code=1,
+            country_iso_code="FJI",
+            latitude=-18.0,
+            longitude=-179.98,
+        )
+        found = Address.objects.filter(cells_query(-18.0, 179.98, 10))
+        self.assertEqual([address.city for address in found], ["Suva"])
+
+    def test_near_view_orders_by_distance_within_radius(self):
+        """Test that the search lists lettings within the radius, nearest first."""
+        center = self.places["Center"]
+        response = self.client.get(
+            reverse("lettings:near"), {"lat": center[0], "lon": center[1], "radius": 40}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "lettings/near.html")
+        results = response.context["results"]
+        self.assertEqual([r["title"] for r in results], ["Center", "Close", "Farther"])
+        self.assertEqual(results[0]["distance"], 0.0)
+        self.assertContains(response, "Farther")
+        self.assertNotContains(response, "Faraway")
+
+    @override_settings(NEARBY_MAX_RESULTS=2, NEARBY_FIRST_RADIUS_KM=5)
+    def test_near_view_stops_at_the_first_full_circle(self):
+        """Test that the search does not widen once it found enough lettings."""
+        center = self.places["Center"]
+        params = {"lat": center[0], "lon": center[1], "radius": 80}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("lettings:near"), params)
+        self.assertEqual([r["title"] for r in response.context["results"]], ["Center", "Close"])
+        # The first circle, then the titles of the lettings found in it.
+        self.assertEqual(len(queries), 2)
+
+    @override_settings(NEARBY_MAX_RESULTS=2, NEARBY_CELL_CANDIDATES=1, NEARBY_FIRST_RADIUS_KM=40)
+    def test_near_view_splits_full_cells(self):
+        """Test that cells holding more lettings than are read are split until read whole."""
+        center = self.places["Center"]
+        for number in (3, 2, 1):
+            address = Address.objects.create(
+                number=10 + number,
+                street="North Street",
+                city="Portland",
+                state="ME",
+                zip_code=4101,
+                country_iso_code="USA",
+                latitude=center[0] + 0.01 * number,
+                longitude=center[1],
+            )
+            Letting.objects.create(title="North %d" % number, address=address)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("lettings:near"), {"lat": center[0], "lon": center[1], "radius": 40}
+            )
+        titles = [r["title"] for r in response.context["results"]]
+        self.assertEqual(titles, ["Center", "North 1"])
+        self.assertGreater(len(queries), 2)
+
+    @override_settings(NEARBY_MAX_RESULTS=5, NEARBY_CELL_CANDIDATES=2)
+    def test_near_view_with_lettings_sharing_coordinates(self):
+        """Test that lettings geocoded to the same centroid end the search within its budget."""
+        center = self.places["Center"]
+        addresses = Address.objects.bulk_create(
+            Address(
+                number=number,
+                street="Centroid Street",
+                city="Portland",
+                state="ME",
+                zip_code=4101,
+                country_iso_code="USA",
+                latitude=center[0],
+                longitude=center[1],
+                geohash=geohash(*center),
+            )
+            for number in range(10, 30)
+        )
+        Letting.objects.bulk_create(
+            Letting(title="Shared %d" % address.number, address=address) for address in addresses
+        )
+        response = self.client.get(
+            reverse("lettings:near"), {"lat": center[0], "lon": center[1], "radius": 40}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["distance"] for r in response.context["results"]], [0.0] * 5)
+
+    def test_near_view_by_zip_code(self):
+        """Test that a zip code is used as the center of the search."""
+        url = reverse("lettings:near")
+        response = self.client.get(url, {"zip": 11554, "radius": 50})
+        self.assertEqual([r["title"] for r in response.context["results"]], ["Faraway"])
+        response = self.client.get(url, {"zip": 11554, "radius": 10})
+        self.assertEqual(response.context["results"], [])
+        self.assertContains(response, "No lettings within 10 km.")
+
+    def test_near_view_rejects_invalid_parameters(self):
+        """Test that invalid search parameters return a 400 response."""
+        url = reverse("lettings:near")
+        self.assertEqual(self.client.get(url).status_code, 200)
+        invalid = (
+            {"lat": "x", "lon": 1},
+            {"lat": 1},
+            {"lat": 91, "lon": 1},
+            {"zip": 99999},
+            {"lat": 1, "lon": 1, "radius": 1000},
+        )
+        for params in invalid:
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+    def test_address_geocoded_on_save(self):
+        """Test that an address saved without coordinates is geocoded from its postcode."""
+        address = Address.objects.create(
+            number=7,
+            street="Bay Street",
+            city="East Meadow",
+            state="NY",
+            zip_code=11554,
+            country_iso_code="USA",
+        )
+        address.refresh_from_db()
+        self.assertEqual((address.latitude, address.longitude), geocode("usa", 11554))
+        self.assertEqual(address.geohash, geohash(address.latitude, address.longitude))
+
+    def test_geocode_addresses_command(self):
+        """Test that the command geocodes addresses from the centroid table."""
+        address = Address.objects.create(
+            number=7,
+            street="Bay Street",
+            city="East Meadow",
+            state="NY",
+            zip_code=11554,
+            country_iso_code="USA",
+        )
+        Address.objects.filter(pk=address.pk).update(latitude=None, longitude=None)
+        call_command("geocode_addresses", chunk_size=1, stdout=StringIO())
+        address.refresh_from_db()
+        self.assertEqual((address.latitude, address.longitude), geocode("usa", 11554))
+        self.assertEqual(address.geohash, geohash(address.latitude, address.longitude))
+
+
+class LettingsBatchTest(TestCase):
+    """Tests for the batch lookup endpoint."""
+
+    def setUp(self):
+        """Set up three lettings."""
+        self.ids = []
+        for number, title in enumerate(("First", "Second", "Third"), start=1):
+            address = Address.objects.create(
+                number=number,
+                street="Main Street",
+                city="Portland",
+                state="ME",
+                zip_code=4101,
+                country_iso_code="USA",
+            )
+            self.ids.append(Letting.objects.create(title=title, address=address).id)
+        self.url = reverse("lettings:batch")
+
+    def test_lettings_in_request_order_with_missing_ids(self):
+        """Test that lettings come back in request order, in one query, with missing ids."""
+        ids = [self.ids[2], 9999, self.ids[0], self.ids[2]]
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"ids": ",".join(map(str, ids))})
+        data = response.json()
+        self.assertEqual([letting["title"] for letting in data["lettings"]], ["Third", "First"])
+        self.assertEqual(data["lettings"][0]["address"]["city"], "Portland")
+        self.assertEqual(data["missing"], [9999])
+
+    def test_conditional_request(self):
+        """Test that an unchanged batch is answered 304 to its ETag, a changed one 200."""
+        params = {"ids": ",".join(map(str, self.ids))}
+        etag = self.client.get(self.url, params)["ETag"]
+        response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        Letting.objects.filter(id=self.ids[1]).update(title="Renamed")
+        response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_invalid_ids(self):
+        """Test that missing, malformed or too many ids are rejected."""
+        with self.settings(LETTINGS_BATCH_MAX_IDS=2):
+            for ids in ("", "1,,2", "1,a", "0", "-1", "1,2,3"):
+                response = self.client.get(self.url, {"ids": ids})
+                self.assertEqual(response.status_code, 400, ids)
+                self.assertIn("error", response.json())
+
+    def test_non_ascii_and_overlong_ids(self):
+        """Test that digits other than ASCII ones and ids past 64 bits are a 400, not a 500."""
+        for ids in ("²", "١", "9" * 20, str(2**63), "1," + "9" * 5000):
+            response = self.client.get(self.url, {"ids": ids})
+            self.assertEqual(response.status_code, 400, ids)
+            self.assertEqual(
+                response.json()["error"], "ids must be comma-separated letting ids", ids
+            )
+        response = self.client.get(self.url, {"ids": str(2**63 - 1)})
+        self.assertEqual(response.status_code, 200)
+
+
+class AddressDedupTest(TestCase):
+    """Tests for the normalized address keys and the duplicate report."""
+
+    def create_address(self, street, city="Anytown", letting=None):
+        address = Address.objects.create(
+            number=7,
+            street=street,
+            city=city,
+            state="CA",
+            zip_code=12345,
+            country_iso_code="USA",
+        )
+        if letting:
+            Letting.objects.create(title=letting, address=address)
+        return address
+
+    def dedupe(self, *args):
+        out = StringIO()
+        call_command("dedupe_addresses", "--chunk-size", "1", *args, stdout=out)
+        return out.getvalue()
+
+    def test_normalized_key(self):
+        """Test that spelling variants of an address share its normalized key."""
+        first = self.create_address("Main Street")
+        second = self.create_address(" main  st.", city="ANYTÖWN")
+        third = self.create_address("Main Avenue")
+        self.assertEqual(len(first.normalized_key), 40)
+        self.assertEqual(first.normalized_key, second.normalized_key)
+        self.assertNotEqual(first.normalized_key, third.normalized_key)
+
+    def test_normalized_key_updated_on_save(self):
+        """Test that saving an address recomputes its key, even with update_fields."""
+        address = self.create_address("Main Street")
+        other = self.create_address("Elm Street")
+        address.street = "Elm St"
+        address.save(update_fields=["street"])
+        address.refresh_from_db()
+        self.assertEqual(address.normalized_key, other.normalized_key)
+
+    def test_report_and_merge(self):
+        """Test that duplicates are reported, and only the unused ones deleted by a merge."""
+        kept = self.create_address("Main Street", letting="Main")
+        unused = self.create_address("Main St")
+        self.create_address("Elm Street", letting="Elm 1")
+        self.create_address("Elm St.", letting="Elm 2")
+        self.create_address("Oak Street")
+
+        with CaptureQueriesContext(connection) as queries:
+            report = self.dedupe("--limit", "0")
+        self.assertIn("2 duplicate groups, 2 duplicate addresses", report)
+        self.assertIn("1 groups have several lettings at the same address", report)
+        self.assertEqual(len(queries), 3)
+        self.assertTrue(Address.objects.filter(pk=unused.pk).exists())
+
+        self.assertIn("Deleted 1 duplicate addresses", self.dedupe("--merge"))
+        self.assertFalse(Address.objects.filter(pk=unused.pk).exists())
+        self.assertTrue(Address.objects.filter(pk=kept.pk).exists())
+        self.assertEqual(Address.objects.count(), 4)
+        self.assertEqual(Letting.objects.count(), 3)
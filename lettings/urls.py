@@ -5,5 +5,7 @@ app_name = "lettings"
 
 urlpatterns = [
     path("", views.index, name="index"),
+    path("near/", views.near, name="near"),
+    path("batch/", views.batch, name="batch"),
     path("<int:letting_id>/", views.letting, name="letting"),
 ]
@@ -5,21 +5,58 @@ This module contains views for displaying property lettings,
 including the listings index and individual letting details.
 """
 
+import hashlib
+import heapq
+import json
 import logging
+import math
+from functools import lru_cache
 
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404
-from .models import Letting
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from oc_lettings_site.page_cache import page_cache
+from oc_lettings_site.page_views import count_views
+from oc_lettings_site.query_budget import query_budget
+from oc_lettings_site.stateless import stateless
+from oc_lettings_site.streaming import render_list
+from .geo import (
+    GEOHASH_BITS,
+    cell_distance_km,
+    cell_range,
+    children,
+    covering_cells,
+    distances_km,
+    geocode,
+)
+from .models import Address, Letting, LettingSummary
+from .popularity import popular_lettings
 
 logger = logging.getLogger(__name__)
 
+# Queries made at most by the radius search, and cells read at most by each.
+NEARBY_MAX_QUERIES = 16
+NEARBY_CELLS_PER_QUERY = 32
+
 
+@stateless
+@query_budget(2)
+@page_cache
 def index(request):
     """
     Display a list of all available lettings.
 
-    Retrieves all letting records from the database and renders them
-    in the lettings index template. This view serves as the main
-    listing page for property rentals.
+    Reads the lettings from the denormalized LettingSummary table, in title
+    order, which is a single scan of its covering index, and renders them
+    in the lettings index template, along with the most viewed lettings
+    (cached, see ``lettings.popularity``). Long lists are streamed, see
+    ``oc_lettings_site.streaming``. This view serves as the main listing
+    page for property rentals.
 
     Args:
         request (HttpRequest): The HTTP request object containing
@@ -27,20 +64,34 @@ def index(request):
 
     Returns:
         HttpResponse: Rendered HTML response containing the lettings
-            index page with a list of all available lettings.
+            index page with a list of all available lettings, or a
+            StreamingHttpResponse for long lists.
 
     Template:
         lettings/index.html: Template used to display the lettings list.
+        lettings/index_rows.html: Template of the rows of the list.
 
     Context:
-        lettings_list (QuerySet): All Letting objects from the database.
+        lettings_list (list): One dict per letting, with its ``id`` and
+            ``title``.
+        popular_lettings (list): The most viewed lettings, with their ``id``,
+            ``title`` and ``views``.
     """
-    lettings_list = Letting.objects.all()
-    logger.info("Lettings index accessed - %d lettings found", len(lettings_list))
-    context = {"lettings_list": lettings_list}
-    return render(request, "lettings/index.html", context)
+    logger.info("Lettings index accessed")
+    return render_list(
+        request,
+        "lettings/index.html",
+        "lettings/index_rows.html",
+        {"popular_lettings": popular_lettings()},
+        "lettings_list",
+        LettingSummary.objects.values("title", id=F("letting_id")),
+    )
 
 
+@stateless
+@count_views("letting", "letting_id")
+@query_budget(1)
+@page_cache
 def letting(request, letting_id):
     """
     Display detailed information for a specific letting.
@@ -72,9 +123,346 @@ def letting(request, letting_id):
         Uses get_object_or_404() for proper error handling when letting doesn't exist.
     """
     logger.info("Letting detail accessed - ID: %d", letting_id)
-    letting = get_object_or_404(Letting, id=letting_id)
+    letting = get_object_or_404(Letting.objects.select_related("address"), id=letting_id)
     context = {
         "title": letting.title,
         "address": letting.address,
     }
     return render(request, "lettings/letting.html", context)
+
+
+# Largest primary key of a letting, a signed 64-bit integer in the database.
+MAX_ID = 2**63 - 1
+
+
+def _is_id(value):
+    """Return whether a string is a letting id, without parsing overlong numbers."""
+    return (
+        value.isascii()
+        and value.isdigit()
+        and len(value) <= len(str(MAX_ID))
+        and 0 < int(value) <= MAX_ID
+    )
+
+
+def _batch_ids(params):
+    """
+    Read the ids of a batch lookup from the ``ids`` query parameter.
+
+    Returns:
+        list: Distinct ids, in request order.
+
+    Raises:
+        ValueError: If an id is not a positive integer, or there are none or
+            more than ``LETTINGS_BATCH_MAX_IDS``.
+    """
+    values = params.get("ids", "").split(",")
+    if len(values) > settings.LETTINGS_BATCH_MAX_IDS:
+        raise ValueError("at most %d ids per request" % settings.LETTINGS_BATCH_MAX_IDS)
+    if not all(_is_id(value) for value in values):
+        raise ValueError("ids must be comma-separated letting ids")
+    return list(dict.fromkeys(int(value) for value in values))
+
+
+def _letting_json(letting):
+    address = letting.address
+    return {
+        "id": letting.id,
+        "title": letting.title,
+        "address": {
+            "number": address.number,
+            "street": address.street,
+            "city": address.city,
+            "state": address.state,
+            "zip_code": address.zip_code,
+            "country_iso_code": address.country_iso_code,
+        },
+    }
+
+
+@stateless
+@query_budget(1)
+def batch(request):
+    """
+    Return several lettings and their addresses as JSON, in one query.
+
+    Meant for partner integrations, which would otherwise fetch the
+    letting pages one by one. The response carries an ``ETag`` of its
+    body, so a client sending it back in ``If-None-Match`` gets a ``304
+    Not Modified`` without the body when none of its lettings changed.
+
+    Args:
+        request (HttpRequest): The HTTP request object, with the ``ids``
+            query parameter: comma-separated letting ids, at most
+            ``LETTINGS_BATCH_MAX_IDS``.
+
+    Returns:
+        JsonResponse: ``lettings``, the lettings found in request order, and
+            ``missing``, the ids without a letting; or an ``error`` with a
+            400 status code when the ids are invalid.
+    """
+    try:
+        ids = _batch_ids(request.GET)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    lettings = Letting.objects.select_related("address").in_bulk(ids)
+    data = {
+        "lettings": [_letting_json(lettings[pk]) for pk in ids if pk in lettings],
+        "missing": [pk for pk in ids if pk not in lettings],
+    }
+    body = json.dumps(data).encode()
+    etag = quote_etag(hashlib.md5(body, usedforsecurity=False).hexdigest())
+    logger.info("Lettings batch - %d requested, %d missing", len(ids), len(data["missing"]))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    return response
+
+
+def _search_center(params):
+    """
+    Read the center and radius of a radius search from query parameters.
+
+    The center is given either as ``lat`` and ``lon`` or as a ``zip`` code
+    (with an optional ``country``, ``USA`` by default) located with the
+    postcode centroid table.
+
+    Returns:
+        tuple: ``(latitude, longitude, radius_km)``.
+
+    Raises:
+        ValueError: If the parameters are missing or invalid.
+    """
+    radius = float(params.get("radius", 10))
+    if not 0 < radius <= settings.NEARBY_MAX_RADIUS_KM:
+        raise ValueError("radius must be between 0 and %d km" % settings.NEARBY_MAX_RADIUS_KM)
+    if params.get("zip"):
+        point = geocode(params.get("country", "USA"), int(params["zip"]))
+        if point is None:
+            raise ValueError("unknown zip code")
+        return point[0], point[1], radius
+    latitude, longitude = float(params["lat"]), float(params["lon"])
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("coordinates out of range")
+    return latitude, longitude, radius
+
+
+@lru_cache(maxsize=8)
+def _cell_sql(limit):
+    """
+    Build the query reading up to ``limit`` lettings of one cell, compiled once.
+
+    The query only reads indexes: the coordinates from the geohash index and
+    the letting id from the index of the lettings' addresses. The parameters
+    are the position of the cell, tagging its rows, and the first and last
+    geohash to read.
+    """
+    queryset = (
+        Address.objects.filter(geohash__range=(0, 0), letting__isnull=False)
+        .order_by("geohash")
+        .values_list("letting__id", "geohash", "latitude", "longitude")[:limit]
+    )
+    sql, _params = queryset.query.sql_with_params()
+    return "SELECT %s, * FROM (" + sql + ")"
+
+
+def _cell_candidates():
+    """
+    Return the lettings read at most per cell.
+
+    A full cell at the deepest level cannot be split any further, so at
+    least ``NEARBY_MAX_RESULTS`` lettings are read from each cell: those of
+    such a cell are all within 0.3 m of each other.
+    """
+    return max(settings.NEARBY_CELL_CANDIDATES, settings.NEARBY_MAX_RESULTS)
+
+
+def _read_cells(latitude, longitude, cells, found):
+    """
+    Read the lettings of cells, up to ``_cell_candidates()`` per cell and one more.
+
+    Args:
+        latitude (float): Latitude of the center in degrees.
+        longitude (float): Longitude of the center in degrees.
+        cells (list): ``(cell, start)`` pairs of the cells to read (see
+            ``lettings.geo.covering_cells``) and of the geohash to read
+            each of them from.
+        found (dict): Distances of the lettings read so far, keyed by id,
+            updated with the lettings read.
+
+    Returns:
+        list: ``(cell, resume)`` pairs of the cells holding more than
+            ``_cell_candidates()`` lettings from their start, of which
+            the lettings before the ``resume`` geohash were all read.
+    """
+    params = []
+    for position, (cell, start) in enumerate(cells):
+        params += [position, start, cell_range(cell)[1]]
+    with connection.cursor() as cursor:
+        # One LIMIT-ed index range scan per cell, so a crowded cell cannot
+        # crowd the others out.
+        sql = " UNION ALL ".join([_cell_sql(_cell_candidates() + 1)] * len(cells))
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    counts = [0] * len(cells)
+    resume = [None] * len(cells)
+    distances = distances_km(latitude, longitude, [row[3:] for row in rows])
+    for (position, pk, code, _latitude, _longitude), distance in zip(rows, distances):
+        counts[position] += 1
+        resume[position] = code
+        found[pk] = distance
+    return [
+        (cell, resume[position])
+        for position, ((cell, _start), count) in enumerate(zip(cells, counts))
+        if count > _cell_candidates()
+    ]
+
+
+def _split(latitude, longitude, cell, resume, bound):
+    """
+    Return the parts of a full cell left to read.
+
+    The more lettings the part of the cell read so far holds, the more
+    levels down the cell is split, so that each part holds about half
+    ``_cell_candidates()`` lettings. The parts read already, and those
+    farther than ``bound`` from the center, are left out.
+
+    Returns:
+        list: ``(distance, cell, start)`` of the parts.
+    """
+    level = cell[0]
+    if level == GEOHASH_BITS:
+        return []
+    first, last = cell_range(cell)
+    candidates = _cell_candidates()
+    estimate = (candidates + 1) * (last - first + 1) / (resume - first + 1)
+    levels = math.ceil(math.log(2 * estimate / candidates, 4))
+    parts = []
+    for part in children(cell, min(max(levels, 1), 3, GEOHASH_BITS - level)):
+        part_first, part_last = cell_range(part)
+        if part_last < resume:
+            continue
+        distance = cell_distance_km(latitude, longitude, part)
+        if distance <= bound:
+            parts.append((distance, part, max(part_first, resume)))
+    return parts
+
+
+def _nearest(latitude, longitude, radius):
+    """
+    Find the lettings nearest to a point within a radius.
+
+    The search starts with a circle of ``NEARBY_FIRST_RADIUS_KM`` and widens
+    it until ``NEARBY_MAX_RESULTS`` lettings are found in it or it reaches
+    the radius, so dense areas only read the cells close to the center.
+    Each circle is covered by about twenty cells of a size fitting it, read
+    in one query up to ``NEARBY_CELL_CANDIDATES`` lettings per cell (and one
+    more, telling a full cell, see ``_cell_candidates``). The rest of the full cells is split into
+    smaller cells, read nearest first, in turn, unless they are farther than
+    the circle or than the nearest lettings read so far, so a crowded cell
+    never makes the search read more than the cells around the lettings it
+    returns.
+
+    After ``NEARBY_MAX_QUERIES`` queries, the search returns the nearest
+    lettings read so far, which only happens when many addresses share
+    the same coordinates, such as a postcode centroid. The titles of the
+    lettings returned are read last, in one more query.
+
+    Returns:
+        list: Dicts with the ``id``, ``title`` and ``distance`` of the
+            lettings, nearest first.
+    """
+    wanted = settings.NEARBY_MAX_RESULTS
+    found = {}
+    queries = 0
+    step_radius = min(settings.NEARBY_FIRST_RADIUS_KM, radius)
+    while True:
+        pending = [
+            (cell_distance_km(latitude, longitude, cell), cell, cell_range(cell)[0])
+            for cell in covering_cells(latitude, longitude, step_radius)
+        ]
+        bound = step_radius
+        while pending and queries < NEARBY_MAX_QUERIES:
+            pending.sort()
+            cells = [(cell, start) for _distance, cell, start in pending[:NEARBY_CELLS_PER_QUERY]]
+            del pending[:NEARBY_CELLS_PER_QUERY]
+            full = _read_cells(latitude, longitude, cells, found)
+            queries += 1
+            nearest = heapq.nsmallest(wanted, found.values())
+            if len(nearest) == wanted:
+                bound = min(bound, nearest[-1])
+            for cell, resume in full:
+                pending += _split(latitude, longitude, cell, resume, bound)
+            pending = [part for part in pending if part[0] <= bound]
+        results = sorted(
+            (
+                {"id": pk, "distance": distance}
+                for pk, distance in found.items()
+                if distance <= step_radius
+            ),
+            key=lambda result: result["distance"],
+        )[:wanted]
+        logger.info(
+            "Nearby lettings search - %d candidates, %d results within %.2f km, %d queries",
+            len(found),
+            len(results),
+            step_radius,
+            queries,
+        )
+        if len(results) == wanted or step_radius >= radius or pending:
+            break
+        # Widen faster through empty areas.
+        step_radius = min((2 if found else 4) * step_radius, radius)
+    if results:
+        titles = dict(
+            Letting.objects.filter(pk__in=[result["id"] for result in results]).values_list(
+                "id", "title"
+            )
+        )
+        for result in results:
+            result["title"] = titles[result["id"]]
+    return results
+
+
+@stateless
+@query_budget(NEARBY_MAX_QUERIES + 1)
+def near(request):
+    """
+    Display the lettings within a radius of a point, nearest first.
+
+    Candidates are narrowed down with the indexed geohashes of their
+    addresses, in circles widening up to the radius (see ``_nearest``),
+    then exact distances are computed for those candidates only, filtered
+    on the radius and sorted.
+
+    Args:
+        request (HttpRequest): The HTTP request object, with ``lat`` and
+            ``lon`` or ``zip`` (and optionally ``country``) query
+            parameters, and ``radius`` in kilometers (10 by default, at most
+            ``NEARBY_MAX_RADIUS_KM``).
+
+    Returns:
+        HttpResponse: Rendered HTML response listing the nearby lettings,
+            or the search form with a 400 status code when the parameters
+            are invalid.
+
+    Template:
+        lettings/near.html: Template used to display the search results.
+
+    Context:
+        results (list): Dicts with the ``id``, ``title`` and ``distance``
+            in kilometers of each letting, at most ``NEARBY_MAX_RESULTS``.
+        radius (float): Search radius in kilometers.
+        error (str): Description of invalid parameters, if any.
+    """
+    try:
+        latitude, longitude, radius = _search_center(request.GET)
+    except (KeyError, ValueError) as exc:
+        status = 400 if request.GET else 200
+        context = {"results": None, "error": str(exc) if request.GET else ""}
+        return render(request, "lettings/near.html", context, status=status)
+
+    results = _nearest(latitude, longitude, radius)
+    return render(request, "lettings/near.html", {"results": results, "radius": radius})
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class OCLettingsSiteConfig(AppConfig):
     name = "oc_lettings_site"
+
+    def ready(self):
+        from . import sitemaps, slow_queries  # noqa: F401
@@ -1,7 +1,15 @@
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
+from oc_lettings_site.monitoring import init_sentry
+from oc_lettings_site.preload import EarlyHintsMiddleware
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "oc_lettings_site.settings")
 
 application = get_asgi_application()
+# After the setup, so Sentry reads its configuration from the loaded settings.
+init_sentry()
+if settings.EARLY_HINTS:
+    application = EarlyHintsMiddleware(application)
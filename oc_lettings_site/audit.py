@@ -0,0 +1,210 @@
+"""
+Data integrity audit of the lettings and profiles tables.
+
+Rows loaded in bulk bypass model validation and, on SQLite, foreign key
+checks. Each audited table is checked with one set-based query per chunk of
+primary keys, whose ``WHERE`` clause matches any row breaking a rule:
+
+* the relations of ``RELATION_CHECKS``, such as an address without a
+  letting or a profile whose user is missing;
+* the value validators of the model fields that translate to SQL
+  (``MaxValueValidator``, ``MinLengthValidator``, ``max_length`` and so
+  on) and the ``blank=False`` text fields holding empty strings.
+
+Only the offending primary keys and a flag per rule are streamed back with
+``.iterator()``, so memory stays constant whatever the size of the table.
+Validators that have no SQL equivalent run in Python on the streamed values
+of their fields. ``audit_tables`` runs the tables in parallel threads, each
+with its own database connection.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from operator import or_
+
+from django.contrib.auth.models import User
+from django.core import validators
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import BooleanField, Exists, ExpressionWrapper, OuterRef, Q
+from django.db.models.functions import Length
+from django.db.models.lookups import GreaterThan, LessThan
+
+from lettings.models import Address, Letting, LettingSummary
+from profiles.models import Profile
+
+AUDITED_MODELS = (Address, Letting, LettingSummary, Profile)
+
+RELATION_CHECKS = {
+    Address: {
+        "without_letting": lambda: Q(letting__isnull=True),
+    },
+    Letting: {
+        "missing_address": lambda: ~Exists(Address.objects.filter(pk=OuterRef("address_id"))),
+        "missing_summary": lambda: Q(summary__isnull=True),
+    },
+    LettingSummary: {
+        "missing_letting": lambda: ~Exists(Letting.objects.filter(pk=OuterRef("letting_id"))),
+    },
+    Profile: {
+        "missing_user": lambda: ~Exists(User.objects.filter(pk=OuterRef("user_id"))),
+    },
+}
+
+
+def _limit(validator):
+    limit = validator.limit_value
+    return limit() if callable(limit) else limit
+
+
+def field_rules(model):
+    """
+    Split the value rules of a model's fields into SQL conditions and Python checks.
+
+    Returns:
+        tuple: A dict of ``Q`` conditions matching the invalid rows, keyed by
+            ``"<field>.<rule>"``, and a list of ``(name, field, validator)``
+            for validators without an SQL translation.
+    """
+    conditions = {}
+    python_rules = []
+    for field in model._meta.concrete_fields:
+        if field.primary_key or field.is_relation:
+            continue
+        name = field.attname
+        if not field.blank and field.get_internal_type() in ("CharField", "TextField"):
+            conditions[name + ".blank"] = Q(**{name: ""})
+        for validator in field.validators:
+            if isinstance(validator, validators.MaxValueValidator):
+                conditions[name + ".max_value"] = Q(**{name + "__gt": _limit(validator)})
+            elif isinstance(validator, validators.MinValueValidator):
+                conditions[name + ".min_value"] = Q(**{name + "__lt": _limit(validator)})
+            elif isinstance(validator, validators.MaxLengthValidator):
+                conditions[name + ".max_length"] = Q(GreaterThan(Length(name), _limit(validator)))
+            elif isinstance(validator, validators.MinLengthValidator):
+                conditions[name + ".min_length"] = Q(LessThan(Length(name), _limit(validator)))
+            else:
+                rule = type(validator).__name__
+                python_rules.append(("%s.%s" % (name, rule), field, validator))
+    return conditions, python_rules
+
+
+def pk_ranges(model, chunk_size, using="default"):
+    """
+    Yield ``(first, last)`` primary key bounds of consecutive chunks of a table.
+
+    Each chunk holds ``chunk_size`` rows, found by seeking the primary key
+    index, so gaps in the keys do not produce empty chunks. ``last`` is
+    ``None`` for the final chunk.
+    """
+    keys = model._default_manager.using(using).order_by("pk").values_list("pk", flat=True)
+    first = keys.first()
+    while first is not None:
+        bound = list(keys.filter(pk__gte=first)[chunk_size - 1:chunk_size])
+        if not bound:
+            yield first, None
+            return
+        yield first, bound[0]
+        first = keys.filter(pk__gt=bound[0]).first()
+
+
+def audit_model(model, chunk_size=10000, sample_size=10, using="default"):
+    """
+    Check every row of a table.
+
+    Args:
+        model (Model): The audited model.
+        chunk_size (int): Primary keys per query.
+        sample_size (int): Offending primary keys kept per rule.
+        using (str): Database alias.
+
+    Returns:
+        dict: ``rows`` (number of rows checked), ``problems`` (number of
+            rule violations), ``checks`` (``count`` and ``sample`` of the
+            offending primary keys per rule) and ``seconds``.
+    """
+    started = time.monotonic()
+    conditions = {
+        name: condition() for name, condition in RELATION_CHECKS.get(model, {}).items()
+    }
+    value_conditions, python_rules = field_rules(model)
+    conditions.update(value_conditions)
+    checks = {name: {"count": 0, "sample": []} for name in conditions}
+    checks.update({name: {"count": 0, "sample": []} for name, _f, _v in python_rules})
+    flags = {"check_%d" % index: name for index, name in enumerate(conditions)}
+
+    def record(name, pk):
+        check = checks[name]
+        check["count"] += 1
+        if len(check["sample"]) < sample_size:
+            check["sample"].append(pk)
+
+    manager = model._default_manager.using(using)
+    rows = 0
+    for first, last in pk_ranges(model, chunk_size, using):
+        chunk = manager.filter(pk__gte=first)
+        if last is not None:
+            chunk = chunk.filter(pk__lte=last)
+        rows += chunk.count()
+        if conditions:
+            offending = (
+                chunk.filter(reduce(or_, conditions.values()))
+                .annotate(
+                    **{
+                        flag: ExpressionWrapper(conditions[name], output_field=BooleanField())
+                        for flag, name in flags.items()
+                    }
+                )
+                .order_by("pk")
+                .values_list("pk", *flags)
+            )
+            for pk, *matched in offending.iterator(chunk_size=chunk_size):
+                for flag, hit in zip(flags, matched):
+                    if hit:
+                        record(flags[flag], pk)
+        if python_rules:
+            names = sorted({field.attname for _name, field, _validator in python_rules})
+            for values in chunk.order_by("pk").values("pk", *names).iterator(chunk_size):
+                for name, field, validator in python_rules:
+                    value = values[field.attname]
+                    if value in field.empty_values:
+                        continue
+                    try:
+                        validator(value)
+                    except ValidationError:
+                        record(name, values["pk"])
+
+    return {
+        "rows": rows,
+        "problems": sum(check["count"] for check in checks.values()),
+        "checks": checks,
+        "seconds": round(time.monotonic() - started, 3),
+    }
+
+
+def _audit_in_thread(model, **options):
+    try:
+        return audit_model(model, **options)
+    finally:
+        connections.close_all()
+
+
+def audit_tables(models=AUDITED_MODELS, jobs=1, **options):
+    """
+    Audit several tables, ``jobs`` of them at a time.
+
+    With more than one job, each table is audited in a worker thread with
+    its own database connection, so it only sees committed rows.
+
+    Returns:
+        dict: ``audit_model`` reports keyed by model label.
+    """
+    if jobs <= 1:
+        return {model._meta.label: audit_model(model, **options) for model in models}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            model._meta.label: executor.submit(_audit_in_thread, model, **options)
+            for model in models
+        }
+        return {label: future.result() for label, future in futures.items()}
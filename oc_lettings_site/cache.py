@@ -0,0 +1,358 @@
+"""
+Shared cache backend for the OC Lettings site.
+
+Each gunicorn worker holding its own ``LocMemCache`` means every worker has to
+warm its own copy of every cached page. This module provides a cache backend
+backed by a single SQLite database in WAL mode, so all the worker processes on
+one host read and write the same entries without any external service.
+
+Entries expire after their timeout and the cache is kept within
+``MAX_ENTRIES`` entries and ``MAX_SIZE`` bytes by evicting expired entries
+first, then the least recently used ones. The number of entries and their
+total size are kept up to date by triggers in a single-row ``cache_stats``
+table, so checking the limits on a write does not scan the cache.
+
+Example:
+    CACHES = {
+        "default": {
+            "BACKEND": "oc_lettings_site.cache.SQLiteCache",
+            "LOCATION": "/tmp/oc-lettings-cache.sqlite3",
+            "OPTIONS": {"MAX_ENTRIES": 10000, "MAX_SIZE": 64 * 1024 * 1024},
+        }
+    }
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Minimum delay between two "last accessed" updates of the same entry, so a
+# hot key does not turn every read into a write.
+ACCESS_RESOLUTION = 1.0
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache backend storing pickled values in a SQLite database shared across processes.
+
+    The database is opened lazily, once per thread and per process, so the
+    backend is safe to use with preforking servers such as gunicorn.
+
+    Args:
+        location (str): Path of the SQLite database file.
+        params (dict): Cache parameters from ``settings.CACHES``. Besides the
+            standard ``TIMEOUT``, ``MAX_ENTRIES`` and ``CULL_FREQUENCY``
+            options, ``OPTIONS`` accepts ``MAX_SIZE`` (total size of the
+            stored values in bytes, ``0`` for no limit) and ``BUSY_TIMEOUT``
+            (seconds to wait for the write lock).
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._path = str(location)
+        self._max_size = int(options.get("MAX_SIZE", 0))
+        self._busy_timeout = float(options.get("BUSY_TIMEOUT", 5.0))
+        self._local = threading.local()
+
+    def _connection(self):
+        """
+        Return the SQLite connection of the current thread, creating it if needed.
+
+        Returns:
+            sqlite3.Connection: An autocommit connection to the cache database.
+        """
+        pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == pid:
+            return conn
+
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(
+            self._path, timeout=self._busy_timeout, isolation_level=None
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires REAL,"
+            " accessed REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self._create_stats(conn)
+        self._local.conn = conn
+        self._local.pid = pid
+        return conn
+
+    def _create_stats(self, conn):
+        """
+        Create the ``cache_stats`` row and the triggers maintaining it.
+
+        The row is filled from the existing entries once, when the database
+        predates it, in the same transaction as the triggers.
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_stats ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0),"
+                " count INTEGER NOT NULL,"
+                " size INTEGER NOT NULL"
+                ")"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_stats_insert AFTER INSERT ON cache BEGIN"
+                " UPDATE cache_stats SET count = count + 1, size = size + new.size; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_stats_update"
+                " AFTER UPDATE OF size ON cache BEGIN"
+                " UPDATE cache_stats SET size = size - old.size + new.size; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_stats_delete AFTER DELETE ON cache BEGIN"
+                " UPDATE cache_stats SET count = count - 1, size = size - old.size; END"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO cache_stats (id, count, size)"
+                " SELECT 0, COUNT(*), TOTAL(size) FROM cache"
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _stats(self, conn):
+        """Return the number of entries and their total size."""
+        return conn.execute("SELECT count, size FROM cache_stats").fetchone()
+
+    def _write(self, key, value, timeout, mode):
+        """
+        Store a value, evicting old entries when the cache is over its limits.
+
+        Args:
+            key (str): Full cache key, already made and validated.
+            value: Value to pickle and store.
+            timeout: Timeout as accepted by ``get_backend_timeout()``.
+            mode (str): ``"set"`` to overwrite, ``"add"`` to keep an existing
+                live value.
+
+        Returns:
+            bool: Whether the value was stored.
+        """
+        expires = self.get_backend_timeout(timeout)
+        data = pickle.dumps(value, self.pickle_protocol)
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if mode == "add":
+                row = conn.execute(
+                    "SELECT expires FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and (row[0] is None or row[0] > now):
+                    conn.execute("COMMIT")
+                    return False
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete
+            # would not fire the stats trigger.
+            conn.execute(
+                "INSERT INTO cache (key, value, size, expires, accessed)"
+                " VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value,"
+                " size = excluded.size, expires = excluded.expires,"
+                " accessed = excluded.accessed",
+                (key, data, len(data), expires, now),
+            )
+            self._cull(conn, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def _cull(self, conn, now):
+        """
+        Evict entries until the cache fits within its entry and size limits.
+
+        Expired entries go first; if that is not enough, the least recently
+        used ``1 / CULL_FREQUENCY`` of the entries are removed.
+        """
+        count, size = self._stats(conn)
+        if count <= self._max_entries and (not self._max_size or size <= self._max_size):
+            return
+        conn.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+        count, size = self._stats(conn)
+        if count <= self._max_entries and (not self._max_size or size <= self._max_size):
+            return
+        if self._cull_frequency == 0:
+            conn.execute("DELETE FROM cache")
+            return
+        conn.execute(
+            "DELETE FROM cache WHERE key IN ("
+            " SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+            (max(count // self._cull_frequency, 1),),
+        )
+        if self._max_size:
+            # A few large entries can exceed the size limit on their own.
+            size = self._stats(conn)[1]
+            while size > self._max_size:
+                row = conn.execute(
+                    "SELECT key, size FROM cache ORDER BY accessed LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                conn.execute("DELETE FROM cache WHERE key = ?", (row[0],))
+                size -= row[1]
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write(key, value, timeout, "add")
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._write(key, value, timeout, "set")
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, expires, accessed FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return default
+        data, expires, accessed = row
+        now = time.time()
+        if expires is not None and expires <= now:
+            conn.execute("DELETE FROM cache WHERE key = ? AND expires <= ?", (key, now))
+            return default
+        if now - accessed > ACCESS_RESOLUTION:
+            conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return pickle.loads(data)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        cursor = self._connection().execute(
+            "UPDATE cache SET expires = ?, accessed = ?"
+            " WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            "SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM cache"
+                " WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            data = pickle.dumps(value, self.pickle_protocol)
+            conn.execute(
+                "UPDATE cache SET value = ?, size = ?, accessed = ? WHERE key = ?",
+                (data, len(data), now, key),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def take_token(self, key, interval, burst, now=None, version=None):
+        """
+        Take a token from a token bucket, atomically across processes.
+
+        The bucket is an entry whose expiry is the time at which it will be
+        full again (the "generic cell rate algorithm" form of a token
+        bucket), so a missing or expired entry is a full bucket. Taking a
+        token is a single upsert, which only moves the expiry forward while
+        the bucket is not empty.
+
+        Args:
+            key (str): Cache key of the bucket.
+            interval (float): Seconds between two tokens.
+            burst (int): Size of the bucket.
+            now (float): Current time, ``time.time()`` by default.
+            version (int): Cache key version.
+
+        Returns:
+            float: ``0`` if a token was taken, else the seconds until one is
+                available.
+        """
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time() if now is None else now
+        data = pickle.dumps(None, self.pickle_protocol)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            taken = conn.execute(
+                "INSERT INTO cache (key, value, size, expires, accessed)"
+                " VALUES (:key, :data, :size, :now + :interval, :now)"
+                " ON CONFLICT (key) DO UPDATE"
+                " SET expires = MAX(COALESCE(expires, :now), :now) + :interval,"
+                " accessed = :now"
+                " WHERE MAX(COALESCE(expires, :now), :now) + :interval"
+                " <= :now + :burst * :interval"
+                " RETURNING expires",
+                {
+                    "key": key,
+                    "data": data,
+                    "size": len(data),
+                    "now": now,
+                    "interval": interval,
+                    "burst": burst,
+                },
+            ).fetchall()
+            if taken:
+                wait = 0
+                self._cull(conn, now)
+            else:
+                (full_at,) = conn.execute(
+                    "SELECT expires FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                wait = full_at + interval - now - burst * interval
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Connections are per thread and reused across requests on purpose:
+        # reopening the database on every request would defeat the cache.
+        pass
@@ -0,0 +1,150 @@
+"""
+Compression of the responses, with Brotli when it is installed.
+
+``CompressionMiddleware`` is Django's ``GZipMiddleware``, sending Brotli
+(with the optional ``brotli`` package) to the clients preferring it, as
+chosen by ``preferred_coding``. Streamed responses are compressed chunk by
+chunk, each chunk being flushed, so the browser still receives the rows of
+a streamed list as they are rendered (see ``oc_lettings_site.streaming``).
+Responses that already have a ``Content-Encoding`` are sent as they are:
+the error pages, compressed once with ``precompress`` in the coding the
+middleware would choose, and the sitemaps.
+"""
+
+import gzip
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Shortest content worth compressing, as in ``GZipMiddleware``.
+MIN_LENGTH = 200
+
+
+# Content codings the middleware can send, preferred first on equal weights.
+CODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _weights(header):
+    """Return the weight of each coding listed in an ``Accept-Encoding`` header."""
+    weights = {}
+    for item in header.split(","):
+        name, *params = item.split(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    return weights
+
+
+def _weight(weights, coding):
+    # The coding's own weight takes precedence over the one of "*".
+    return weights.get(coding, weights.get("*", 0.0))
+
+
+def accepts(header, coding):
+    """
+    Return whether an ``Accept-Encoding`` header accepts a content coding.
+
+    Args:
+        header (str): The header value, such as ``"gzip, br;q=0.8"``.
+        coding (str): The content coding, such as ``"br"``.
+
+    Returns:
+        bool: Whether the coding, or else ``*``, has a non-zero weight.
+    """
+    return _weight(_weights(header), coding) > 0
+
+
+def preferred_coding(header):
+    """
+    Return the coding of ``CODINGS`` an ``Accept-Encoding`` header prefers.
+
+    Returns:
+        str: ``"br"`` or ``"gzip"``, or ``None`` if the client accepts
+            neither.
+    """
+    weights = _weights(header)
+    best, best_weight = None, 0.0
+    for coding in CODINGS:
+        weight = _weight(weights, coding)
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def precompress(data, coding):
+    """Compress a body served many times, at the highest level of a coding."""
+    if coding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compress_sequence(sequence):
+    """Brotli-compress an iterable of byte strings, flushing after each one."""
+    compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+    for chunk in sequence:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """``GZipMiddleware`` sending Brotli to the clients preferring it."""
+
+    def process_response(self, request, response):
+        if (
+            not response.streaming and len(response.content) < MIN_LENGTH
+        ) or response.has_header("Content-Encoding"):
+            return response
+        coding = preferred_coding(request.headers.get("Accept-Encoding", ""))
+        if coding == "gzip":
+            return super().process_response(request, response)
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if coding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                original_iterator = response.streaming_content
+
+                async def brotli_wrapper():
+                    compressor = brotli.Compressor(
+                        quality=settings.COMPRESSION_BROTLI_QUALITY
+                    )
+                    async for chunk in original_iterator:
+                        yield compressor.process(chunk) + compressor.flush()
+                    yield compressor.finish()
+
+                response.streaming_content = brotli_wrapper()
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers["Content-Length"]
+        else:
+            compressed = brotli.compress(
+                response.content, quality=settings.COMPRESSION_BROTLI_QUALITY
+            )
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(response.content))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
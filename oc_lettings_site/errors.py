@@ -0,0 +1,158 @@
+"""
+Pre-rendered error pages and aggregated "page not found" logging.
+
+The 404 and 500 pages extend ``base.html`` but depend on nothing from the
+request, so they are rendered once per process (by ``warm_up``, or by the
+first error) and served from memory. With ``ERROR_PAGES_PRECOMPRESS`` they
+are compressed once as well, in each coding of ``CompressionMiddleware``
+(see ``oc_lettings_site.compression``), and the client gets the copy the
+middleware would have sent it; without it, the middleware compresses them
+on every response. A storm of bad URLs, or an outage turning every request
+into a 500, then costs no template rendering nor compression at all.
+
+Logging every 404 would be just as costly during such a storm. The first
+404 under a path prefix (the first segment of the path, such as
+``/lettings/``) is logged with its path; the following ones are only
+counted and logged as one line per prefix every ``NOT_FOUND_LOG_INTERVAL``
+seconds.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+
+from . import compression
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES = {404: "404.html", 500: "500.html"}
+
+# Served if the template itself cannot be rendered.
+FALLBACK_BODIES = {
+    404: b"<!DOCTYPE html><title>Page Not Found</title><h1>404 - Page Not Found</h1>",
+    500: b"<!DOCTYPE html><title>Server Error</title><h1>500 - Internal Server Error</h1>",
+}
+
+# Prefixes counted separately; the others are counted together.
+MAX_PREFIXES = 100
+OTHER_PREFIX = "(other)"
+
+_lock = threading.Lock()
+_pages = {}
+_not_found = {"counts": {}, "since": time.monotonic()}
+
+
+def render_error_page(status):
+    """
+    Render the page of an error status.
+
+    Returns:
+        tuple: The body, and its compressed copies keyed by content coding,
+            empty without ``ERROR_PAGES_PRECOMPRESS``.
+    """
+    try:
+        body = render_to_string(TEMPLATES[status]).encode()
+    except Exception:
+        logger.exception("Cannot render the %d page, serving a minimal one", status)
+        body = FALLBACK_BODIES[status]
+    compressed = {}
+    if getattr(settings, "ERROR_PAGES_PRECOMPRESS", True):
+        compressed = {
+            coding: compression.precompress(body, coding) for coding in compression.CODINGS
+        }
+    return body, compressed
+
+
+def render_error_pages():
+    """
+    Render every error page of the current process ahead of time.
+
+    Returns:
+        int: Number of pages rendered.
+    """
+    pages = {status: render_error_page(status) for status in TEMPLATES}
+    with _lock:
+        _pages.update(pages)
+    return len(pages)
+
+
+def reset():
+    """Forget the rendered pages and the pending 404 counts."""
+    with _lock:
+        _pages.clear()
+        _not_found["counts"] = {}
+        _not_found["since"] = time.monotonic()
+
+
+def error_response(request, status):
+    """
+    Build the response of an error page from its pre-rendered body.
+
+    Args:
+        request (HttpRequest): The failed request.
+        status (int): ``404`` or ``500``.
+
+    Returns:
+        HttpResponse: The page, compressed in the coding the client prefers
+            when it is precompressed.
+    """
+    page = _pages.get(status)
+    if page is None:
+        page = render_error_page(status)
+        with _lock:
+            _pages[status] = page
+    body, compressed = page
+    coding = None
+    if compressed:
+        coding = compression.preferred_coding(request.headers.get("Accept-Encoding", ""))
+    response = HttpResponse(compressed[coding] if coding else body, status=status)
+    if compressed:
+        if coding:
+            response["Content-Encoding"] = coding
+        patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def path_prefix(path):
+    """Return the first segment of a path, such as ``/lettings/``."""
+    segment = path.lstrip("/").split("/", 1)[0]
+    return "/%s/" % segment[:64] if segment else "/"
+
+
+def log_not_found(path):
+    """
+    Log a 404, or count it if its prefix was already logged in this interval.
+
+    Returns:
+        bool: Whether the path itself was logged.
+    """
+    prefix = path_prefix(path)
+    now = time.monotonic()
+    with _lock:
+        expired = now - _not_found["since"] >= settings.NOT_FOUND_LOG_INTERVAL
+        if expired:
+            counts, _not_found["counts"] = _not_found["counts"], {}
+            elapsed, _not_found["since"] = now - _not_found["since"], now
+        counts_now = _not_found["counts"]
+        if prefix not in counts_now and len(counts_now) >= MAX_PREFIXES:
+            prefix = OTHER_PREFIX
+        first = prefix not in counts_now
+        # Only the 404s not logged individually are counted.
+        counts_now[prefix] = counts_now.get(prefix, -1) + 1
+    if expired:
+        for counted_prefix, count in sorted(counts.items()):
+            if count:
+                logger.warning(
+                    "404 error: %d more pages not found under %s in the last %.0fs",
+                    count,
+                    counted_prefix,
+                    elapsed,
+                )
+    if first:
+        logger.warning("404 error: Page not found - %s", path)
+    return first
@@ -0,0 +1,140 @@
+"""
+Liveness and readiness checks for the OC Lettings site.
+
+``/healthz`` only tells that the process answers. ``/readyz`` also checks that
+the database is reachable, that every migration is applied and that the
+static files have been collected. Load balancers probe these endpoints many
+times per minute, so the readiness result is computed at most once per
+``READINESS_CACHE_TTL`` seconds per process and both responses are served by
+``HealthCheckMiddleware`` before sessions, authentication and CSRF run.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.db import DatabaseError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+LIVENESS_PATH = "/healthz"
+READINESS_PATH = "/readyz"
+
+_lock = threading.Lock()
+_readiness = {"expires": 0.0, "status": 503, "body": b""}
+
+
+def check_database():
+    """Return whether a trivial query succeeds on the default database."""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+    except DatabaseError:
+        logger.exception("Readiness check failed: database unreachable")
+        return False
+    return True
+
+
+def check_migrations():
+    """Return whether every known migration is applied to the default database."""
+    try:
+        executor = MigrationExecutor(connection)
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    except DatabaseError:
+        logger.exception("Readiness check failed: cannot read migrations")
+        return False
+    if plan:
+        logger.warning("Readiness check failed: %d unapplied migrations", len(plan))
+    return not plan
+
+
+def check_static_manifest():
+    """
+    Return whether the collected static files are present.
+
+    With a manifest storage the manifest file must exist, otherwise
+    ``STATIC_ROOT`` must be a directory.
+    """
+    manifest_name = getattr(staticfiles_storage, "manifest_name", None)
+    if manifest_name:
+        present = staticfiles_storage.exists(manifest_name)
+    else:
+        present = os.path.isdir(settings.STATIC_ROOT)
+    if not present:
+        logger.warning("Readiness check failed: static files not collected")
+    return present
+
+
+def _json_response(body, status):
+    response = HttpResponse(body, status=status, content_type="application/json")
+    response["Cache-Control"] = "no-store"
+    return response
+
+
+def liveness_response():
+    """
+    Build the liveness response.
+
+    Returns:
+        HttpResponse: Always ``200 OK``.
+    """
+    return _json_response(b'{"status": "ok"}', 200)
+
+
+def readiness_response():
+    """
+    Build the readiness response, rerunning the checks once the cached result expires.
+
+    Returns:
+        HttpResponse: ``200 OK`` when every check passes, ``503 Service
+            Unavailable`` otherwise, with the result of each check.
+    """
+    now = time.monotonic()
+    if _readiness["expires"] <= now:
+        with _lock:
+            if _readiness["expires"] <= now:
+                checks = {
+                    "database": check_database(),
+                    "migrations": check_migrations(),
+                    "static": check_static_manifest(),
+                }
+                ready = all(checks.values())
+                _readiness["body"] = json.dumps(
+                    {"status": "ok" if ready else "unavailable", "checks": checks}
+                ).encode()
+                _readiness["status"] = 200 if ready else 503
+                _readiness["expires"] = now + getattr(settings, "READINESS_CACHE_TTL", 5)
+    return _json_response(_readiness["body"], _readiness["status"])
+
+
+def reset_readiness_cache():
+    """Forget the cached readiness result, so the next probe reruns the checks."""
+    _readiness["expires"] = 0.0
+
+
+class HealthCheckMiddleware:
+    """
+    Answer health probes before the rest of the middleware stack.
+
+    This middleware must come first in ``settings.MIDDLEWARE``: probes then
+    skip sessions, authentication, CSRF, and even the ``ALLOWED_HOSTS``
+    check, so a load balancer can probe the container by IP address.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        path = request.path_info.rstrip("/")
+        if path == LIVENESS_PATH:
+            return liveness_response()
+        if path == READINESS_PATH:
+            return readiness_response()
+        return self.get_response(request)
@@ -0,0 +1,96 @@
+"""
+Optional Jinja2 rendering of the public pages.
+
+Jinja2 compiles templates to Python functions, which render the long loops
+of the list pages faster than the Django template engine. It is installed
+with the requirements, which the tests of the ports need, but only renders
+pages with ``TEMPLATE_ENGINE = "jinja2"``: the ``Jinja2`` backend below
+then comes before ``DjangoTemplates`` in ``TEMPLATES`` and renders the
+ports of the public templates, found in the ``jinja2`` directories
+(``templates/jinja2/`` and ``<app>/jinja2/``, as a top-level ``jinja2``
+directory would shadow the package). Templates without a port, such as the
+admin, error and search pages, are still rendered by ``DjangoTemplates``.
+
+The ports render the same markup as the Django templates, with the
+``static()`` and ``url()`` globals and the ``row_url`` filter (see
+``oc_lettings_site.row_urls``) set by ``environment()``. The rendered
+template is noted on the request, so ``PreloadMiddleware`` adds the links
+of its ``static()`` assets.
+
+``manage.py bench_templates`` compares the render times of both engines.
+"""
+
+import jinja2
+from django.template.backends import jinja2 as jinja2_backend
+from django.templatetags.static import static
+from django.urls import reverse
+from jinja2 import nodes
+
+from .preload import NotedTemplateMixin
+from .row_urls import row_url
+
+
+def url(viewname, *args, **kwargs):
+    """Return the URL of a view, like the ``{% url %}`` tag."""
+    return reverse(viewname, args=args or None, kwargs=kwargs or None)
+
+
+def environment(**options):
+    """
+    Create the Jinja2 environment of the ``Jinja2`` backend.
+
+    Returns:
+        jinja2.Environment: Environment with the ``static`` and ``url``
+            globals and the ``row_url`` filter.
+    """
+    env = jinja2.Environment(**options)
+    env.globals.update(static=static, url=url)
+    env.filters["row_url"] = row_url
+    return env
+
+
+class Template(NotedTemplateMixin, jinja2_backend.Template):
+    """Jinja2 template noting its name on the request it is rendered for."""
+
+
+class Jinja2(jinja2_backend.Jinja2):
+    """``Jinja2`` backend whose templates are noted on the request."""
+
+    def from_string(self, template_code):
+        return Template(self.env.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+    def static_paths(self, template_name, seen=None):
+        """
+        Return the literal ``static()`` paths of a template.
+
+        Args:
+            template_name (str): Name of the template.
+            seen (set): Names of the templates already walked.
+
+        Returns:
+            list: Paths in the order of the template, parents first.
+        """
+        seen = set() if seen is None else seen
+        seen.add(template_name)
+        try:
+            source = self.env.loader.get_source(self.env, template_name)[0]
+        except jinja2.TemplateNotFound:
+            return []
+        tree = self.env.parse(source)
+        paths = []
+        for node in tree.find_all((nodes.Extends, nodes.Include)):
+            name = node.template
+            if isinstance(name, nodes.Const) and name.value not in seen:
+                paths += self.static_paths(name.value, seen)
+        for node in tree.find_all(nodes.Call):
+            if (
+                isinstance(node.node, nodes.Name)
+                and node.node.name == "static"
+                and node.args
+                and isinstance(node.args[0], nodes.Const)
+            ):
+                paths.append(node.args[0].value)
+        return paths
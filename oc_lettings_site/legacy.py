@@ -0,0 +1,369 @@
+"""
+Online copy of the legacy ``oc_lettings_site_*`` tables into the app tables.
+
+The addresses, lettings and profiles of the first version of the site live
+in ``oc_lettings_site_address``, ``oc_lettings_site_letting`` and
+``oc_lettings_site_profile``. ``copy_table`` moves them to the ``lettings``
+and ``profiles`` tables in batches of legacy primary keys, each batch in
+its own short transaction that also records the new primary keys in
+``LegacyIdMap`` and the progress in ``LegacyCheckpoint``. The site keeps
+serving between batches, and an interrupted copy resumes after the last
+committed batch.
+
+Every batch is verified before it commits, by comparing checksums of the
+legacy rows and of the rows written for them. ``verify_table`` repeats the
+comparison over the whole table, and ``drop_tables`` drops the legacy
+tables once each of them has been verified.
+"""
+
+import hashlib
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from lettings import recommendations
+from lettings.models import Address, Letting, LettingSummary
+from oc_lettings_site import sitemaps
+from oc_lettings_site.normalization import city_key
+from profiles.models import Profile
+
+from .models import LegacyCheckpoint, LegacyIdMap
+
+
+class LegacyMigrationError(Exception):
+    """Raised when copied rows do not match their legacy rows."""
+
+
+class LegacyTable:
+    """
+    A legacy table and the app table its rows are copied to.
+
+    Args:
+        source (str): Short name, used in checkpoints and id mappings.
+        table (str): Name of the legacy table.
+        model (Model): Model of the app table.
+        fields (tuple): Columns shared by both tables, compared by the
+            checksums. Foreign key columns are translated with
+            ``translate`` before being written and compared.
+    """
+
+    def __init__(self, source, table, model, fields):
+        self.source = source
+        self.table = table
+        self.model = model
+        self.fields = fields
+
+    def exists(self):
+        return self.table in connection.introspection.table_names()
+
+    def read(self, after_id, limit):
+        """Return up to ``limit`` legacy rows with a primary key above ``after_id``."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id, %s FROM %s WHERE id > %%s ORDER BY id LIMIT %%s"
+                % (", ".join(self.fields), connection.ops.quote_name(self.table)),
+                [after_id, limit],
+            )
+            return cursor.fetchall()
+
+    def translate(self, rows):
+        """
+        Return the values to write for legacy rows.
+
+        Returns:
+            dict: Tuples of ``fields`` values keyed by legacy primary key,
+                ``None`` for rows that cannot be copied.
+        """
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+    def create(self, values):
+        """
+        Write the rows for translated legacy values.
+
+        Args:
+            values (dict): Tuples of ``fields`` values keyed by legacy id.
+
+        Returns:
+            dict: The new primary keys, keyed by legacy id. Rows left out
+                are counted as skipped.
+        """
+        objs = [self.build(row) for row in values.values()]
+        self.model.objects.bulk_create(objs)
+        return {legacy_id: obj.pk for legacy_id, obj in zip(values, objs)}
+
+    def build(self, row):
+        """Return the unsaved app row for a tuple of ``fields`` values."""
+        return self.model(**dict(zip(self.fields, row)))
+
+    def written(self, new_ids):
+        """Return the ``fields`` values of app rows, keyed by primary key."""
+        rows = self.model.objects.filter(pk__in=new_ids).values_list("pk", *self.fields)
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+    def after_batch(self, new_ids):
+        """Refresh what depends on the rows written by a committed batch."""
+
+
+class AddressTable(LegacyTable):
+    def build(self, row):
+        address = super().build(row)
+        address.set_derived_fields()
+        return address
+
+
+class LettingTable(LegacyTable):
+    def translate(self, rows):
+        addresses = id_map("address", [row[2] for row in rows])
+        return {
+            row[0]: (row[1], addresses[row[2]]) if row[2] in addresses else None for row in rows
+        }
+
+    def create(self, values):
+        new_ids = super().create(values)
+        lettings = Letting.objects.select_related("address").filter(pk__in=new_ids.values())
+        LettingSummary.objects.bulk_create(
+            [LettingSummary.from_letting(letting) for letting in lettings]
+        )
+        return new_ids
+
+    def after_batch(self, new_ids):
+        recommendations.invalidate(
+            *LettingSummary.objects.filter(pk__in=new_ids).values_list("city_key", flat=True)
+        )
+        _invalidate_sitemaps("lettings", new_ids)
+
+
+class ProfileTable(LegacyTable):
+    def translate(self, rows):
+        users = set(
+            User.objects.filter(pk__in=[row[2] for row in rows]).values_list("pk", flat=True)
+        )
+        return {row[0]: tuple(row[1:]) if row[2] in users else None for row in rows}
+
+    def create(self, values):
+        # A user who already has a profile keeps it, and the legacy row is skipped.
+        taken = set(
+            Profile.objects.filter(user_id__in=[row[1] for row in values.values()]).values_list(
+                "user_id", flat=True
+            )
+        )
+        new = {legacy_id: row for legacy_id, row in values.items() if row[1] not in taken}
+        objs = [
+            Profile(favorite_city=row[0], favorite_city_key=city_key(row[0]), user_id=row[1])
+            for row in new.values()
+        ]
+        Profile.objects.bulk_create(objs)
+        return {legacy_id: obj.pk for legacy_id, obj in zip(new, objs)}
+
+    def after_batch(self, new_ids):
+        _invalidate_sitemaps("profiles", new_ids)
+
+
+# In dependency order: lettings need the address mapping.
+TABLES = [
+    AddressTable(
+        "address",
+        "oc_lettings_site_address",
+        Address,
+        ("number", "street", "city", "state", "zip_code", "country_iso_code"),
+    ),
+    LettingTable("letting", "oc_lettings_site_letting", Letting, ("title", "address_id")),
+    ProfileTable("profile", "oc_lettings_site_profile", Profile, ("favorite_city", "user_id")),
+]
+
+
+def _invalidate_sitemaps(section, new_ids):
+    chunks = {}
+    for pk in new_ids:
+        chunks.setdefault(sitemaps.SECTIONS[section].chunk_of(pk), pk)
+    for pk in chunks.values():
+        sitemaps.invalidate(section, pk)
+
+
+def id_map(source, legacy_ids):
+    """Return the new primary keys of legacy rows, keyed by legacy id."""
+    return dict(
+        LegacyIdMap.objects.filter(source=source, legacy_id__in=legacy_ids).values_list(
+            "legacy_id", "new_id"
+        )
+    )
+
+
+def checksum(rows, digest=None):
+    """
+    Add rows to a SHA-256 digest.
+
+    Args:
+        rows (iterable): Tuples of values, in a stable order.
+        digest: Digest to update, a new one by default.
+
+    Returns:
+        The updated digest.
+    """
+    if digest is None:
+        digest = hashlib.sha256()
+    for row in rows:
+        digest.update(repr(row).encode())
+        digest.update(b"\n")
+    return digest
+
+
+def _compare(table, values, new_ids):
+    """
+    Compare translated legacy values with the app rows written for them.
+
+    Returns:
+        tuple: The legacy and the app digests.
+    """
+    written = table.written(new_ids.values())
+    legacy = checksum((legacy_id, values[legacy_id]) for legacy_id in new_ids)
+    copied = checksum(
+        (legacy_id, written.get(new_id)) for legacy_id, new_id in new_ids.items()
+    )
+    return legacy, copied
+
+
+def copy_table(table, batch_size=1000, pause=0.0, progress=None):
+    """
+    Copy the legacy rows not copied yet, one verified batch per transaction.
+
+    Args:
+        table (LegacyTable): The table to copy.
+        batch_size (int): Legacy rows per batch.
+        pause (float): Seconds to sleep between batches, to leave room for
+            the site's own writes.
+        progress (callable): Called with the checkpoint after each batch.
+
+    Returns:
+        LegacyCheckpoint: The checkpoint of the table.
+
+    Raises:
+        LegacyMigrationError: If a batch does not match its legacy rows; the
+            batch is rolled back and the checkpoint left before it.
+    """
+    checkpoint, _created = LegacyCheckpoint.objects.get_or_create(source=table.source)
+    if not table.exists():
+        return checkpoint
+    while True:
+        rows = table.read(checkpoint.last_legacy_id, batch_size)
+        if not rows:
+            break
+        with transaction.atomic():
+            values = table.translate(rows)
+            done = id_map(table.source, values)
+            pending = {
+                legacy_id: row
+                for legacy_id, row in values.items()
+                if row is not None and legacy_id not in done
+            }
+            new_ids = table.create(pending)
+            LegacyIdMap.objects.bulk_create(
+                LegacyIdMap(source=table.source, legacy_id=legacy_id, new_id=new_id)
+                for legacy_id, new_id in new_ids.items()
+            )
+            legacy, copied = _compare(table, pending, new_ids)
+            if legacy.digest() != copied.digest():
+                raise LegacyMigrationError(
+                    "%s rows %d to %d do not match their copies"
+                    % (table.source, rows[0][0], rows[-1][0])
+                )
+            checkpoint.last_legacy_id = rows[-1][0]
+            checkpoint.copied += len(new_ids)
+            checkpoint.skipped += len(rows) - len(done) - len(new_ids)
+            checkpoint.save()
+        table.after_batch(new_ids.values())
+        if progress:
+            progress(checkpoint)
+        if pause:
+            time.sleep(pause)
+    if checkpoint.status == LegacyCheckpoint.PENDING:
+        checkpoint.status = LegacyCheckpoint.COPIED
+        checkpoint.save(update_fields=["status", "updated_at"])
+    return checkpoint
+
+
+def verify_table(table, batch_size=1000):
+    """
+    Compare every legacy row of a table with its copy.
+
+    The rows are read in batches of legacy primary keys and folded into a
+    running checksum on each side. The checkpoint is marked verified when
+    both checksums match and no row was skipped or left uncopied.
+
+    Returns:
+        dict: ``rows``, ``missing`` (rows without a copy), and the
+            ``legacy_checksum`` and ``copied_checksum``.
+    """
+    checkpoint, _created = LegacyCheckpoint.objects.get_or_create(source=table.source)
+    legacy, copied = hashlib.sha256(), hashlib.sha256()
+    rows_seen = missing = 0
+    last_id = 0
+    exists = table.exists()
+    while exists:
+        rows = table.read(last_id, batch_size)
+        if not rows:
+            break
+        values = table.translate(rows)
+        new_ids = id_map(table.source, values)
+        missing += sum(legacy_id not in new_ids for legacy_id in values)
+        values = {legacy_id: row for legacy_id, row in values.items() if legacy_id in new_ids}
+        written = table.written(new_ids.values())
+        checksum(((legacy_id, values[legacy_id]) for legacy_id in values), legacy)
+        checksum(((legacy_id, written.get(new_ids[legacy_id])) for legacy_id in values), copied)
+        rows_seen += len(rows)
+        last_id = rows[-1][0]
+
+    report = {
+        "rows": rows_seen,
+        "missing": missing,
+        "legacy_checksum": legacy.hexdigest(),
+        "copied_checksum": copied.hexdigest(),
+    }
+    if checkpoint.status != LegacyCheckpoint.CLEANED:
+        matched = not missing and report["legacy_checksum"] == report["copied_checksum"]
+        checkpoint.status = LegacyCheckpoint.VERIFIED if matched else LegacyCheckpoint.COPIED
+        checkpoint.checksum = report["legacy_checksum"] if matched else ""
+        checkpoint.save(update_fields=["status", "checksum", "updated_at"])
+    return report
+
+
+def drop_tables(force=False):
+    """
+    Drop the legacy tables, dependent tables first.
+
+    Args:
+        force (bool): Drop the tables even if some were not verified.
+
+    Returns:
+        list: Names of the dropped tables.
+
+    Raises:
+        LegacyMigrationError: If a table has not been verified and
+            ``force`` is not set.
+    """
+    checkpoints = {
+        checkpoint.source: checkpoint
+        for checkpoint in LegacyCheckpoint.objects.filter(
+            source__in=[table.source for table in TABLES]
+        )
+    }
+    unverified = [
+        table.source
+        for table in TABLES
+        if table.exists()
+        and getattr(checkpoints.get(table.source), "status", None) != LegacyCheckpoint.VERIFIED
+    ]
+    if unverified and not force:
+        raise LegacyMigrationError("Not verified: %s" % ", ".join(unverified))
+
+    dropped = []
+    with connection.cursor() as cursor:
+        for table in reversed(TABLES):
+            if table.exists():
+                cursor.execute("DROP TABLE %s" % connection.ops.quote_name(table.table))
+                dropped.append(table.table)
+            LegacyCheckpoint.objects.update_or_create(
+                source=table.source, defaults={"status": LegacyCheckpoint.CLEANED}
+            )
+    return dropped
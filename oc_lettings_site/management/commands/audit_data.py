@@ -0,0 +1,59 @@
+"""
+Check the lettings and profiles tables for orphaned and invalid rows.
+
+Typically run after a bulk load, which bypasses model validation and, on
+SQLite, foreign key checks. Every table is read in primary key chunks with
+set-based queries (see ``oc_lettings_site.audit``), several tables at a
+time, and the findings are written as JSON: per table, the number of rows
+checked and, per rule, the number of offending rows with a sample of their
+primary keys.
+
+Usage:
+    python manage.py audit_data --jobs 4 --chunk-size 50000 --output audit.json
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from oc_lettings_site import audit
+
+
+class Command(BaseCommand):
+    help = "Report orphaned rows and field values breaking the model validators, as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=10000, help="Primary keys per query."
+        )
+        parser.add_argument(
+            "--jobs", type=int, default=4, help="Tables audited in parallel."
+        )
+        parser.add_argument(
+            "--sample", type=int, default=10, help="Offending primary keys listed per rule."
+        )
+        parser.add_argument(
+            "--output", help="Write the report to this file instead of the standard output."
+        )
+        parser.add_argument(
+            "--fail-on-problems",
+            action="store_true",
+            help="Exit with an error status when a problem is found.",
+        )
+
+    def handle(self, *args, **options):
+        tables = audit.audit_tables(
+            jobs=options["jobs"],
+            chunk_size=options["chunk_size"],
+            sample_size=options["sample"],
+        )
+        problems = sum(table["problems"] for table in tables.values())
+        report = json.dumps({"problems": problems, "tables": tables}, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(report + "\n")
+        else:
+            self.stdout.write(report)
+
+        if problems and options["fail_on_problems"]:
+            raise CommandError("%d problems found" % problems)
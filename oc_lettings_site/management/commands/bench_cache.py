@@ -0,0 +1,123 @@
+"""
+Benchmark the cache backends on the page-cache workload of the public views.
+
+The command renders the lettings and profiles pages once, then replays a
+skewed read-mostly workload against ``LocMemCache``, ``FileBasedCache`` and
+the project's shared ``SQLiteCache`` from several processes, the way gunicorn
+workers would use them. A miss stands for a page render and is followed by a
+``set``, so the hit rate shows how much rendering each backend saves.
+
+Usage:
+    python manage.py bench_cache --processes 4 --operations 20000
+"""
+
+import multiprocessing
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.utils.module_loading import import_string
+
+from lettings import views as lettings_views
+from lettings.models import Letting
+from oc_lettings_site import views as site_views
+from profiles import views as profiles_views
+from profiles.models import Profile
+
+BACKENDS = [
+    ("LocMemCache", "django.core.cache.backends.locmem.LocMemCache", None),
+    ("FileBasedCache", "django.core.cache.backends.filebased.FileBasedCache", "filebased"),
+    ("SQLiteCache", "oc_lettings_site.cache.SQLiteCache", "cache.sqlite3"),
+]
+
+
+def _run_worker(backend, location, pages, operations, seed):
+    """
+    Replay the workload against one cache instance.
+
+    Keys are drawn from a Pareto distribution so a few pages get most of the
+    traffic, as the index pages do in production.
+
+    Returns:
+        tuple: ``(hits, misses, elapsed_seconds)``.
+    """
+    cache = import_string(backend)(location, {"TIMEOUT": 300, "OPTIONS": {"MAX_ENTRIES": 10000}})
+    keys = list(pages)
+    rng = random.Random(seed)
+    hits = misses = 0
+    start = time.perf_counter()
+    for _ in range(operations):
+        index = min(int(rng.paretovariate(1.2)) - 1, len(keys) - 1)
+        key = keys[index]
+        if cache.get(key) is None:
+            misses += 1
+            cache.set(key, pages[key])
+        else:
+            hits += 1
+    return hits, misses, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = "Benchmark LocMemCache, FileBasedCache and SQLiteCache on the page-cache workload."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=4, help="Number of worker processes."
+        )
+        parser.add_argument(
+            "--operations",
+            type=int,
+            default=20000,
+            help="Cache operations per worker process.",
+        )
+
+    def handle(self, *args, **options):
+        pages = self._render_pages()
+        self.stdout.write(
+            "%d pages, %d bytes on average"
+            % (len(pages), sum(map(len, pages.values())) // len(pages))
+        )
+        context = multiprocessing.get_context("fork")
+        workdir = tempfile.mkdtemp(prefix="bench-cache-")
+        try:
+            for name, backend, location in BACKENDS:
+                path = "%s/%s" % (workdir, location) if location else name
+                jobs = [
+                    (backend, path, pages, options["operations"], seed)
+                    for seed in range(options["processes"])
+                ]
+                with context.Pool(options["processes"]) as pool:
+                    results = pool.starmap(_run_worker, jobs)
+                hits = sum(result[0] for result in results)
+                total = hits + sum(result[1] for result in results)
+                elapsed = max(result[2] for result in results)
+                self.stdout.write(
+                    "%-15s %10.0f ops/s  hit rate %5.1f%%"
+                    % (name, total / elapsed, 100.0 * hits / total)
+                )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _render_pages(self):
+        """
+        Render every public page once and key it by path.
+
+        Returns:
+            dict: Rendered response bodies keyed by request path.
+        """
+        factory = RequestFactory()
+        pages = {
+            "/": site_views.index(factory.get("/")).content,
+            "/lettings/": lettings_views.index(factory.get("/lettings/")).content,
+            "/profiles/": profiles_views.index(factory.get("/profiles/")).content,
+        }
+        for letting_id in Letting.objects.values_list("id", flat=True):
+            path = "/lettings/%d/" % letting_id
+            pages[path] = lettings_views.letting(factory.get(path), letting_id).content
+        for username in Profile.objects.values_list("user__username", flat=True):
+            path = "/profiles/%s/" % username
+            pages[path] = profiles_views.profile(factory.get(path), username).content
+        return pages
@@ -0,0 +1,102 @@
+"""
+Load test of the page cache at the moment a popular page expires.
+
+Many clients request the same page at once, right after its cache entry
+expired, first with single-flight regeneration disabled and then enabled.
+The command counts the database queries run by all the clients together,
+which shows the thundering herd hitting SQLite without coalescing and a
+single regeneration with it. ``--stale`` keeps the expired entry, so the
+clients are served it while one of them regenerates the page.
+
+Usage:
+    python manage.py bench_page_cache --clients 32 --path /lettings/
+"""
+
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+
+from oc_lettings_site import page_cache
+
+
+def _get(path):
+    """Run the view of a page, past the middleware, and return its status code."""
+    match = resolve(path)
+    return match.func(RequestFactory().get(path), *match.args, **match.kwargs).status_code
+
+
+def _request(path, barrier, results):
+    """Request the page once every client is ready, counting its queries."""
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    try:
+        with connection.execute_wrapper(count):
+            barrier.wait()
+            started = time.perf_counter()
+            status = _get(path)
+            results.append((status, len(queries), time.perf_counter() - started))
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Measure the queries run when a cached page expires under concurrent requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=32, help="Concurrent requests.")
+        parser.add_argument("--path", default="/lettings/", help="Page requested.")
+        parser.add_argument(
+            "--stale",
+            action="store_true",
+            help="Keep the expired entry, to be served while the page is regenerated.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        key = page_cache.cache_key(RequestFactory().get(path))
+        for single_flight in (False, True):
+            with override_settings(PAGE_CACHE_TIMEOUT=60, PAGE_CACHE_SINGLE_FLIGHT=single_flight):
+                _get(path)
+                self._expire(key, options["stale"])
+                results = []
+                barrier = threading.Barrier(options["clients"])
+                threads = [
+                    threading.Thread(target=_request, args=(path, barrier, results))
+                    for _ in range(options["clients"])
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            statuses = sorted({result[0] for result in results})
+            self.stdout.write(
+                "single-flight %-3s  %3d requests  %4d queries  %3d regenerations"
+                "  max latency %6.1f ms  statuses %s"
+                % (
+                    "on" if single_flight else "off",
+                    len(results),
+                    sum(result[1] for result in results),
+                    sum(1 for result in results if result[1]),
+                    1000 * max(result[2] for result in results),
+                    ", ".join(map(str, statuses)),
+                )
+            )
+        cache.delete(key)
+
+    def _expire(self, key, stale):
+        """Expire the cached page, keeping it as a stale entry if asked to."""
+        entry = cache.get(key)
+        if stale and entry is not None:
+            entry["fresh_until"] = 0
+            cache.set(key, entry, 60)
+        else:
+            cache.delete(key)
@@ -0,0 +1,62 @@
+"""
+Measure what stateless routing saves on the public pages.
+
+The command requests each public page many times through the full WSGI
+handler, once with ``STATELESS_ROUTES`` enabled and once with the session,
+authentication, CSRF and messages middleware running, and prints the mean
+time per request for both. Requests carry a session cookie, like those of a
+returning visitor.
+
+Usage:
+    python manage.py bench_stateless --requests 3000
+"""
+
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from lettings.models import Letting
+from profiles.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Compare the per-request time of public pages with and without stateless routing."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=2000, help="Requests per page and mode."
+        )
+
+    def handle(self, *args, **options):
+        paths = ["/", "/lettings/", "/profiles/"]
+        letting = Letting.objects.only("id").first()
+        if letting is not None:
+            paths.append("/lettings/%d/" % letting.id)
+        profile = Profile.objects.select_related("user").first()
+        if profile is not None:
+            paths.append("/profiles/%s/" % profile.user.username)
+
+        # Keep the view logging out of the measurement.
+        logging.disable(logging.INFO)
+        self.stdout.write("%-30s %12s %12s %8s" % ("path", "full (us)", "stateless", "saved"))
+        for path in paths:
+            full = min(self._time(path, options["requests"], stateless=False) for _ in range(3))
+            light = min(self._time(path, options["requests"], stateless=True) for _ in range(3))
+            self.stdout.write(
+                "%-30s %12.0f %12.0f %7.1f%%" % (path, full, light, 100 * (full - light) / full)
+            )
+
+    def _time(self, path, count, stateless):
+        """
+        Return the mean time in microseconds to serve ``path``.
+        """
+        with override_settings(STATELESS_ROUTES=stateless):
+            client = Client(HTTP_HOST="localhost")
+            client.cookies["sessionid"] = "0" * 32
+            client.get(path)
+            start = time.perf_counter()
+            for _ in range(count):
+                client.get(path)
+            return (time.perf_counter() - start) / count * 1e6
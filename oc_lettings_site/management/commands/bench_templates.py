@@ -0,0 +1,91 @@
+"""
+Benchmark of the template engines on the lettings index.
+
+The lettings index is rendered with ``--rows`` lettings, ``--repeat``
+times, by the Django template engine and, when it is installed, by Jinja2
+(see ``oc_lettings_site.jinja2``), whichever ``TEMPLATE_ENGINE`` is set.
+The command also times building the URLs of the rows with one
+``reverse()`` per row and with ``row_url`` (see
+``oc_lettings_site.row_urls``).
+
+Usage:
+    python manage.py bench_templates --rows 1000 --repeat 50
+"""
+
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.test import RequestFactory
+from django.urls import reverse
+
+from oc_lettings_site import row_urls
+
+TEMPLATE_NAME = "lettings/index.html"
+
+
+def _jinja2_engine():
+    """Return a Jinja2 backend for the ports of the templates, or ``None``."""
+    try:
+        from oc_lettings_site.jinja2 import Jinja2
+    except ImportError:
+        return None
+    return Jinja2(
+        {
+            "NAME": "bench-jinja2",
+            "DIRS": [os.path.join(settings.BASE_DIR, "templates", "jinja2")],
+            "APP_DIRS": True,
+            "OPTIONS": {"environment": "oc_lettings_site.jinja2.environment"},
+        }
+    )
+
+
+def _timed(func, repeat):
+    """Return the mean duration of a call, in milliseconds, after a warm-up call."""
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return 1000 * (time.perf_counter() - started) / repeat
+
+
+class Command(BaseCommand):
+    help = "Compare the render times of the lettings index with each template engine."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000, help="Lettings listed.")
+        parser.add_argument("--repeat", type=int, default=50, help="Renders timed.")
+
+    def handle(self, *args, **options):
+        rows = [{"id": pk, "title": "Letting %d" % pk} for pk in range(1, options["rows"] + 1)]
+        context = {"lettings_list": rows, "popular_lettings": rows[:5]}
+        request = RequestFactory().get(reverse("lettings:index"))
+        candidates = [
+            ("django", next(e for e in engines.all() if isinstance(e, DjangoTemplates))),
+            ("jinja2", _jinja2_engine()),
+        ]
+        for name, engine in candidates:
+            if engine is None:
+                self.stdout.write("%-8s not installed" % name)
+                continue
+            template = engine.get_template(TEMPLATE_NAME)
+            duration = _timed(lambda: template.render(dict(context), request), options["repeat"])
+            self.stdout.write(
+                "%-8s %6d rows  %8.2f ms/page" % (name, len(rows), duration)
+            )
+
+        reversed_urls = _timed(
+            lambda: [reverse("lettings:letting", args=[row["id"]]) for row in rows],
+            options["repeat"],
+        )
+        built_urls = _timed(
+            lambda: [row_urls.row_url(row["id"], "lettings:letting") for row in rows],
+            options["repeat"],
+        )
+        self.stdout.write(
+            "row URLs %6d rows  %8.2f ms with reverse(), %.2f ms with row_url"
+            % (len(rows), reversed_urls, built_urls)
+        )
@@ -0,0 +1,39 @@
+"""
+Write every sitemap file ahead of time.
+
+The sitemaps are otherwise built on the first request after a change; this
+command builds the index and every chunk at once, for example right after a
+deployment or a bulk import.
+
+Usage:
+    python manage.py build_sitemaps --base-url https://oc-lettings.example.com
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from oc_lettings_site import sitemaps
+
+
+class Command(BaseCommand):
+    help = "Build the sitemap index and the sitemap of every chunk."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--base-url",
+            default=settings.SITEMAP_BASE_URL,
+            help="Scheme and host of the site (defaults to SITEMAP_BASE_URL).",
+        )
+
+    def handle(self, *args, **options):
+        base_url = options["base_url"].rstrip("/")
+        if not base_url:
+            raise CommandError("Set SITEMAP_BASE_URL or pass --base-url.")
+
+        sitemaps.build_index(base_url)
+        built = 1
+        for section, sitemap in sitemaps.SECTIONS.items():
+            for number, _lastmod in sitemap.chunk_lastmods():
+                sitemaps.build_chunk(section, number, base_url)
+                built += 1
+        self.stdout.write(self.style.SUCCESS("Built %d sitemap files" % built))
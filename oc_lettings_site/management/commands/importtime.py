@@ -0,0 +1,101 @@
+"""
+Report where the start-up time of the project goes.
+
+The command starts a fresh interpreter with ``python -X importtime`` that runs
+``django.setup()``, parses the timings it prints and lists the most expensive
+imports, so regressions in the cold-start path of management commands and
+workers are easy to spot.
+
+Usage:
+    python manage.py importtime --top 20 --sort self
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+SETUP_SCRIPT = "import django; django.setup()"
+
+
+def parse_importtime(output):
+    """
+    Parse the output of ``python -X importtime``.
+
+    Args:
+        output (str): Text written to stderr by the interpreter.
+
+    Returns:
+        list: One dict per imported module, in import order, with the
+            ``module`` name, its ``self_us`` and ``cumulative_us`` times in
+            microseconds and its nesting ``depth``.
+    """
+    imports = []
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        imports.append(
+            {
+                "module": module,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                "depth": (len(indent) - 1) // 2,
+            }
+        )
+    return imports
+
+
+class Command(BaseCommand):
+    help = "Show the slowest imports of django.setup() using python -X importtime."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top", type=int, default=25, help="Number of imports to show."
+        )
+        parser.add_argument(
+            "--sort",
+            choices=["self", "cumulative"],
+            default="cumulative",
+            help="Sort by the import's own time or including its dependencies.",
+        )
+        parser.add_argument(
+            "--module",
+            action="append",
+            default=[],
+            help="Only show modules starting with this prefix (repeatable).",
+        )
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env.setdefault("DJANGO_SETTINGS_MODULE", "oc_lettings_site.settings")
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", SETUP_SCRIPT],
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError("django.setup() failed:\n%s" % result.stderr[-2000:])
+
+        imports = parse_importtime(result.stderr)
+        total_us = sum(item["self_us"] for item in imports)
+        if options["module"]:
+            imports = [
+                item for item in imports if item["module"].startswith(tuple(options["module"]))
+            ]
+        key = "self_us" if options["sort"] == "self" else "cumulative_us"
+        imports.sort(key=lambda item: item[key], reverse=True)
+
+        self.stdout.write("%10s %12s  module" % ("self (ms)", "cumul. (ms)"))
+        for item in imports[: options["top"]]:
+            self.stdout.write(
+                "%10.1f %12.1f  %s"
+                % (item["self_us"] / 1000, item["cumulative_us"] / 1000, item["module"])
+            )
+        self.stdout.write("Total import time: %.1f ms" % (total_us / 1000))
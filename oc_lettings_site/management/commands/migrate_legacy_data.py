@@ -0,0 +1,77 @@
+"""
+Copy the legacy ``oc_lettings_site_*`` tables into the lettings and profiles tables.
+
+The copy runs in small verified batches while the site stays online (see
+``oc_lettings_site.legacy``) and can be interrupted and rerun at any time:
+it resumes after the last committed batch. Once every table has been
+copied, the whole of each table is verified by checksum, and ``--cleanup``
+drops the legacy tables if they all match.
+
+Usage:
+    python manage.py migrate_legacy_data --batch-size 2000 --pause 0.05
+    python manage.py migrate_legacy_data --cleanup
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from oc_lettings_site import legacy
+
+
+class Command(BaseCommand):
+    help = "Copy, verify and optionally drop the legacy lettings and profiles tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Legacy rows per transaction."
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Seconds to wait between batches, to leave room for the site's writes.",
+        )
+        parser.add_argument(
+            "--cleanup",
+            action="store_true",
+            help="Drop the legacy tables once every one of them is verified.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="With --cleanup, drop the legacy tables even if some rows were not copied.",
+        )
+
+    def handle(self, *args, **options):
+        def progress(checkpoint):
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    "%s: %d copied, %d skipped, up to legacy id %d"
+                    % (
+                        checkpoint.source,
+                        checkpoint.copied,
+                        checkpoint.skipped,
+                        checkpoint.last_legacy_id,
+                    )
+                )
+
+        reports = {}
+        try:
+            for table in legacy.TABLES:
+                checkpoint = legacy.copy_table(
+                    table, options["batch_size"], options["pause"], progress
+                )
+                reports[table.source] = dict(
+                    legacy.verify_table(table, options["batch_size"]),
+                    copied=checkpoint.copied,
+                    skipped=checkpoint.skipped,
+                )
+            self.stdout.write(json.dumps(reports, indent=2))
+            if options["cleanup"]:
+                dropped = legacy.drop_tables(force=options["force"])
+                self.stdout.write(
+                    self.style.SUCCESS("Dropped %s" % (", ".join(dropped) or "nothing"))
+                )
+        except legacy.LegacyMigrationError as exc:
+            raise CommandError(str(exc))
@@ -0,0 +1,24 @@
+"""
+Show the query budget of each view and how often it was exceeded.
+
+Violations are counted in the shared cache by every server process running
+outside strict mode (see ``oc_lettings_site.query_budget``).
+
+Usage:
+    python manage.py query_budgets
+"""
+
+from django.core.management.base import BaseCommand
+
+from oc_lettings_site import query_budget
+
+
+class Command(BaseCommand):
+    help = "List the per-view query budgets and the violations counted so far."
+
+    def handle(self, *args, **options):
+        budgets = query_budget.budgets()
+        violations = query_budget.violations()
+        self.stdout.write("%-24s %8s %12s" % ("view", "budget", "violations"))
+        for name in sorted(budgets):
+            self.stdout.write("%-24s %8d %12d" % (name, budgets[name], violations[name]))
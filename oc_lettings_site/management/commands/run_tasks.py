@@ -0,0 +1,56 @@
+"""
+Run the background tasks deferred with ``TASKS_MODE = "db"``.
+
+The command claims the due ``Task`` rows in batches and runs them, then
+polls for new ones every ``--sleep`` seconds. Several workers can run side
+by side: each row is claimed by a single one.
+
+Usage:
+    python manage.py run_tasks
+    python manage.py run_tasks --once
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from oc_lettings_site import monitoring, slow_queries, tasks
+
+
+class Command(BaseCommand):
+    help = "Run the deferred tasks stored in the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=100, help="Tasks claimed at a time."
+        )
+        parser.add_argument(
+            "--sleep", type=float, default=1.0, help="Seconds between two polls when idle."
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once no task is due."
+        )
+
+    def handle(self, *args, **options):
+        # The failures of the tasks are logged as errors, reported to Sentry.
+        monitoring.init_sentry()
+        total = failures = 0
+        try:
+            while True:
+                close_old_connections()
+                ran, failed = tasks.run_pending(options["batch_size"])
+                slow_queries.flush_when_due()
+                total += ran
+                failures += failed
+                if ran and options["verbosity"] > 1:
+                    self.stdout.write("%d tasks run, %d failed" % (ran, failed))
+                if not ran:
+                    if options["once"]:
+                        break
+                    time.sleep(options["sleep"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(
+            self.style.SUCCESS("Ran %d tasks, %d failed" % (total, failures))
+        )
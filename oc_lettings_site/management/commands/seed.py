@@ -0,0 +1,151 @@
+"""
+Fill the database with synthetic lettings, users and profiles.
+
+Meant for load tests and benchmarks: millions of rows are generated from a
+seed (see ``oc_lettings_site.seeding``), optionally in worker processes,
+and inserted in batches of raw ``executemany`` calls, one transaction per
+batch. Rows are added after the existing ones; the letting summaries are
+written along with the lettings, and the caches that depend on them are
+invalidated at the end.
+
+Usage:
+    python manage.py seed --lettings 1000000 --users 500000 --fast --workers 3
+"""
+
+import multiprocessing
+import time
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from lettings import recommendations
+from lettings.models import Address, Letting, LettingSummary
+from oc_lettings_site import seeding, sitemaps
+from profiles.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Insert deterministic synthetic lettings, users and profiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lettings", type=int, default=100000, help="Lettings (and addresses) to add."
+        )
+        parser.add_argument(
+            "--users", type=int, help="Users (and profiles) to add; defaults to --lettings."
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the generated data.")
+        parser.add_argument(
+            "--batch-size", type=int, default=10000, help="Rows per table and transaction."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=max(multiprocessing.cpu_count() - 1, 0),
+            help="Processes generating rows while this one inserts them (0 to generate inline).",
+        )
+        parser.add_argument(
+            "--fast",
+            action="store_true",
+            help="Relax the SQLite durability pragmas during the load.",
+        )
+        parser.add_argument(
+            "--password",
+            help="Password of every user (hashed once); by default users cannot log in.",
+        )
+
+    def handle(self, *args, **options):
+        lettings = options["lettings"]
+        users = lettings if options["users"] is None else options["users"]
+        size = options["batch_size"]
+        timestamp = connection.ops.adapt_datetimefield_value(timezone.now())
+        password = make_password(options["password"]) if options["password"] else None
+
+        first_letting = self._next_id(Address, Letting)
+        first_user = self._next_id(User, Profile)
+        tasks = []
+        for batch, start in enumerate(range(0, lettings, size)):
+            count = min(size, lettings - start)
+            tasks.append(
+                ("lettings", options["seed"], batch, first_letting + start, count, timestamp)
+            )
+        for batch, start in enumerate(range(0, users, size)):
+            count = min(size, users - start)
+            tasks.append(
+                ("users", options["seed"], batch, first_user + start, count, timestamp, password)
+            )
+
+        tables = {
+            "lettings": [
+                (Address._meta.db_table, seeding.ADDRESS_COLUMNS),
+                (Letting._meta.db_table, seeding.LETTING_COLUMNS),
+                (LettingSummary._meta.db_table, seeding.SUMMARY_COLUMNS),
+            ],
+            "users": [
+                (User._meta.db_table, seeding.USER_COLUMNS),
+                (Profile._meta.db_table, seeding.PROFILE_COLUMNS),
+            ],
+        }
+        statements = {
+            kind: [seeding.insert_sql(connection, table, columns) for table, columns in specs]
+            for kind, specs in tables.items()
+        }
+
+        inserted = 0
+        started = time.perf_counter()
+        pool = multiprocessing.Pool(options["workers"]) if options["workers"] else None
+        try:
+            batches = pool.imap(seeding.generate, tasks) if pool else map(seeding.generate, tasks)
+            with seeding.relaxed_sqlite_pragmas(connection) if options["fast"] else nullcontext():
+                for kind, rows in batches:
+                    with transaction.atomic(), connection.cursor() as cursor:
+                        for sql, table_rows in zip(statements[kind], rows):
+                            cursor.executemany(sql, table_rows)
+                            inserted += len(table_rows)
+                    if options["verbosity"] > 1:
+                        self.stdout.write("%d rows inserted" % inserted)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        elapsed = time.perf_counter() - started
+
+        self._reset_sequences()
+        self._invalidate(first_letting, lettings, first_user, users)
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Inserted %d lettings and %d users (%d rows) in %.1fs, %.0f rows/s"
+                % (lettings, users, inserted, elapsed, inserted / elapsed if elapsed else 0)
+            )
+        )
+
+    def _next_id(self, *models):
+        """Return the first primary key free in all of ``models``."""
+        return 1 + max(model.objects.aggregate(last=Max("pk"))["last"] or 0 for model in models)
+
+    def _reset_sequences(self):
+        """Move the primary key sequences past the inserted rows, where the database has them."""
+        sql = connection.ops.sequence_reset_sql(no_style(), [Address, Letting, User, Profile])
+        with connection.cursor() as cursor:
+            for statement in sql:
+                cursor.execute(statement)
+
+    def _invalidate(self, first_letting, lettings, first_user, users):
+        """Invalidate the recommendations and sitemaps the raw inserts bypassed."""
+        recommendations.invalidate(*seeding.CITY_KEYS)
+        chunk = getattr(settings, "SITEMAP_CHUNK_SIZE", 50000)
+        for section, first, count in (
+            ("lettings", first_letting, lettings),
+            ("profiles", first_user, users),
+        ):
+            for pk in range(first, first + count, chunk):
+                sitemaps.invalidate(section, pk)
+            if count:
+                sitemaps.invalidate(section, first + count - 1)
@@ -0,0 +1,48 @@
+"""
+Print the slowest query fingerprints recorded by the server processes.
+
+Usage:
+    python manage.py slow_queries --limit 10 --order max --plans
+    python manage.py slow_queries --reset
+"""
+
+from django.core.management.base import BaseCommand
+
+from oc_lettings_site import slow_queries
+
+
+class Command(BaseCommand):
+    help = "List the slow query fingerprints with the highest total, maximum or count."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=20, help="Fingerprints to list.")
+        parser.add_argument(
+            "--order", choices=("total", "max", "count"), default="total", help="Sort key."
+        )
+        parser.add_argument("--plans", action="store_true", help="Print the query plans.")
+        parser.add_argument(
+            "--reset", action="store_true", help="Forget the recorded slow queries."
+        )
+
+    def handle(self, *args, **options):
+        if options["reset"]:
+            slow_queries.reset()
+            self.stdout.write(self.style.SUCCESS("Slow query log cleared"))
+            return
+
+        columns = ("count", "total ms", "mean ms", "max ms", "fingerprint")
+        self.stdout.write("%8s %10s %10s %10s  %s" % columns)
+        for query in slow_queries.top(options["limit"], options["order"]):
+            self.stdout.write(
+                "%8d %10.1f %10.1f %10.1f  %s"
+                % (
+                    query["count"],
+                    query["total"] * 1000,
+                    query["mean"] * 1000,
+                    query["max"] * 1000,
+                    query["fingerprint"],
+                )
+            )
+            if options["plans"] and query["plan"]:
+                for line in query["plan"].splitlines():
+                    self.stdout.write(" " * 10 + line)
@@ -0,0 +1,92 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Add the checkpoint and id mapping tables of the ``migrate_legacy_data``
+    command, and stop tracking the legacy models.
+
+    The legacy Address, Letting and Profile models are only removed from
+    the migration state: their tables stay in place until the command has
+    copied and verified their rows, and drops them with ``--cleanup``. The
+    copy itself is not a data migration, which would run in a single
+    transaction holding the database lock for its whole duration.
+    """
+
+    dependencies = [
+        ("oc_lettings_site", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.DeleteModel(name="Letting"),
+                migrations.DeleteModel(name="Profile"),
+                migrations.DeleteModel(name="Address"),
+            ],
+        ),
+        migrations.CreateModel(
+            name="LegacyCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source", models.CharField(max_length=32, unique=True)),
+                ("last_legacy_id", models.BigIntegerField(default=0)),
+                ("copied", models.PositiveIntegerField(default=0)),
+                ("skipped", models.PositiveIntegerField(default=0)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("copied", "Copied"),
+                            ("verified", "Verified"),
+                            ("cleaned", "Cleaned up"),
+                        ],
+                        default="pending",
+                        max_length=16,
+                    ),
+                ),
+                ("checksum", models.CharField(blank=True, max_length=64)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Legacy data checkpoint",
+                "verbose_name_plural": "Legacy data checkpoints",
+            },
+        ),
+        migrations.CreateModel(
+            name="LegacyIdMap",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source", models.CharField(max_length=32)),
+                ("legacy_id", models.BigIntegerField()),
+                ("new_id", models.BigIntegerField()),
+            ],
+            options={
+                "verbose_name": "Legacy id mapping",
+                "verbose_name_plural": "Legacy id mappings",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("source", "legacy_id"),
+                        name="legacyidmap_source_legacy_id_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
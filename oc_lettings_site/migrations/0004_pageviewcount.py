@@ -0,0 +1,45 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Add the page view counters, upserted in batches by ``page_views.upsert``.
+    """
+
+    dependencies = [
+        ("oc_lettings_site", "0003_task"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PageViewCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("kind", models.CharField(max_length=16)),
+                ("object_key", models.CharField(max_length=150)),
+                ("count", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "verbose_name": "Page view count",
+                "verbose_name_plural": "Page view counts",
+                "indexes": [
+                    models.Index(fields=["kind", "-count"], name="pageviewcount_ranking_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("kind", "object_key"), name="pageviewcount_kind_key_uniq"
+                    )
+                ],
+            },
+        ),
+    ]
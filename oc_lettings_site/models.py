@@ -0,0 +1,164 @@
+from django.db import models
+from django.utils import timezone
+
+
+class LegacyCheckpoint(models.Model):
+    """
+    Progress of the copy of one legacy ``oc_lettings_site_*`` table.
+
+    Written by the ``migrate_legacy_data`` management command in the same
+    transaction as each copied batch, so an interrupted copy resumes after
+    the last committed batch.
+
+    Attributes:
+        source (CharField): Name of the legacy table, e.g. "address".
+        last_legacy_id (BigIntegerField): Highest legacy primary key copied.
+        copied (PositiveIntegerField): Rows copied so far.
+        skipped (PositiveIntegerField): Rows that could not be copied, such
+            as lettings whose legacy address is missing.
+        status (CharField): Stage reached by the table.
+        checksum (CharField): SHA-256 of the legacy rows at the last
+            successful verification.
+        updated_at (DateTimeField): Last change of the checkpoint.
+    """
+
+    PENDING = "pending"
+    COPIED = "copied"
+    VERIFIED = "verified"
+    CLEANED = "cleaned"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (COPIED, "Copied"),
+        (VERIFIED, "Verified"),
+        (CLEANED, "Cleaned up"),
+    ]
+
+    source = models.CharField(max_length=32, unique=True)
+    last_legacy_id = models.BigIntegerField(default=0)
+    copied = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    checksum = models.CharField(max_length=64, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "%s: %s" % (self.source, self.status)
+
+    class Meta:
+        verbose_name = "Legacy data checkpoint"
+        verbose_name_plural = "Legacy data checkpoints"
+
+
+class LegacyIdMap(models.Model):
+    """
+    Primary key of the row a legacy row was copied to.
+
+    Used to translate the foreign keys of later tables (a legacy letting
+    points to a legacy address) and to verify the copied rows.
+
+    Attributes:
+        source (CharField): Name of the legacy table.
+        legacy_id (BigIntegerField): Primary key in the legacy table.
+        new_id (BigIntegerField): Primary key in the app table.
+    """
+
+    source = models.CharField(max_length=32)
+    legacy_id = models.BigIntegerField()
+    new_id = models.BigIntegerField()
+
+    def __str__(self):
+        return "%s %d -> %d" % (self.source, self.legacy_id, self.new_id)
+
+    class Meta:
+        verbose_name = "Legacy id mapping"
+        verbose_name_plural = "Legacy id mappings"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["source", "legacy_id"], name="legacyidmap_source_legacy_id_uniq"
+            ),
+        ]
+
+
+class Task(models.Model):
+    """
+    Deferred call of a task function, for the ``db`` mode of ``oc_lettings_site.tasks``.
+
+    Rows are written in the transaction of the change that defers them and
+    run by the ``run_tasks`` management command. A task that succeeds is
+    deleted; one that keeps failing is kept with the ``failed`` status.
+
+    Attributes:
+        name (CharField): Dotted path of the task function.
+        args (JSONField): Positional arguments of the call.
+        kwargs (JSONField): Keyword arguments of the call.
+        status (CharField): ``pending``, ``running`` or ``failed``.
+        attempts (PositiveIntegerField): Runs started so far.
+        max_attempts (PositiveIntegerField): Runs allowed before failing.
+        run_after (DateTimeField): Earliest time of the next run.
+        last_error (TextField): Error of the last failed run.
+        created_at (DateTimeField): Time the task was deferred.
+        updated_at (DateTimeField): Last change of the row.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (FAILED, "Failed"),
+    ]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=1)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "%s (%s)" % (self.name, self.status)
+
+    class Meta:
+        verbose_name = "Task"
+        verbose_name_plural = "Tasks"
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="task_status_run_after_idx"),
+        ]
+
+
+class PageViewCount(models.Model):
+    """
+    Number of views of a detail page, maintained by ``oc_lettings_site.page_views``.
+
+    Attributes:
+        kind (CharField): Kind of the page, such as "letting" or "profile".
+        object_key (CharField): URL argument of the page: a letting id or a
+            username.
+        count (BigIntegerField): Views counted so far.
+        updated_at (DateTimeField): Time of the last flush of views.
+    """
+
+    kind = models.CharField(max_length=16)
+    object_key = models.CharField(max_length=150)
+    count = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return "%s %s: %d views" % (self.kind, self.object_key, self.count)
+
+    class Meta:
+        verbose_name = "Page view count"
+        verbose_name_plural = "Page view counts"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "object_key"], name="pageviewcount_kind_key_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["kind", "-count"], name="pageviewcount_ranking_idx"),
+        ]
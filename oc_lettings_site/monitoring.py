@@ -0,0 +1,47 @@
+"""
+Error monitoring setup for the OC Lettings site.
+
+The Sentry SDK and its Django and logging integrations are only imported when
+a server entry point (``wsgi.py`` or ``asgi.py``) or the ``run_tasks`` worker
+starts with ``settings.SENTRY_DSN`` set. Other management commands and
+``django.setup()`` in general do not pay for them.
+"""
+
+import logging
+
+from django.conf import settings
+
+_initialized = False
+
+
+def init_sentry():
+    """
+    Initialize the Sentry SDK if a DSN is configured.
+
+    The SDK is configured by the ``SENTRY_DSN`` and ``SENTRY_ENVIRONMENT``
+    settings, so this runs once Django is set up. Calling it more than once
+    has no effect.
+
+    Returns:
+        bool: Whether Sentry is initialized.
+    """
+    global _initialized
+    dsn = settings.SENTRY_DSN
+    if _initialized or not dsn:
+        return _initialized
+
+    import sentry_sdk
+    from sentry_sdk.integrations.django import DjangoIntegration
+    from sentry_sdk.integrations.logging import LoggingIntegration
+
+    sentry_logging = LoggingIntegration(level=logging.INFO, event_level=logging.ERROR)
+
+    sentry_sdk.init(
+        dsn=dsn,
+        integrations=[DjangoIntegration(), sentry_logging],
+        traces_sample_rate=1.0,
+        send_default_pii=True,
+        environment=settings.SENTRY_ENVIRONMENT,
+    )
+    _initialized = True
+    return _initialized
@@ -0,0 +1,81 @@
+"""
+Normalization of free-text values used as join keys.
+
+Cities are typed by hand both in addresses and in profiles, with varying
+case, accents, punctuation and spacing. They are compared through a key
+computed once, when the row is written, and stored in an indexed column,
+so matching two tables is an index lookup rather than a scan applying the
+normalization to every row. Whole addresses are compared the same way,
+through a hash of their normalized fields.
+"""
+
+import hashlib
+import re
+import unicodedata
+
+KEY_LENGTH = 64
+ADDRESS_KEY_LENGTH = 40
+
+_SEPARATORS = re.compile(r"[\W_]+")
+
+# Street type words and their usual abbreviations, compared as one.
+STREET_ABBREVIATIONS = {
+    "avenue": "ave",
+    "boulevard": "blvd",
+    "court": "ct",
+    "drive": "dr",
+    "lane": "ln",
+    "place": "pl",
+    "road": "rd",
+    "street": "st",
+}
+
+
+def _words(text):
+    """Return the case-folded, accent-free words of a text."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return [word for word in _SEPARATORS.split(stripped) if word]
+
+
+def city_key(name):
+    """
+    Return the normalized form of a city name.
+
+    The name is case-folded, stripped of accents, and its words are joined
+    with single dashes, so "Saint-Étienne", "saint etienne" and
+    " SAINT  ÉTIENNE " share the key ``"saint-etienne"``. Keys are cut to
+    ``KEY_LENGTH`` characters, the length of the city columns.
+
+    Args:
+        name (str): City name as entered.
+
+    Returns:
+        str: The key, empty if the name has no letters or digits.
+    """
+    return "-".join(_words(name))[:KEY_LENGTH]
+
+
+def address_key(number, street, city, state, zip_code, country_iso_code):
+    """
+    Return the normalized key of an address.
+
+    Every text field is normalized like ``city_key``, and the street types
+    are abbreviated ("Main Street" and "main st." match), then the fields
+    are hashed into a fixed-length key for the indexed column.
+
+    Returns:
+        str: SHA-1 hex digest of ``ADDRESS_KEY_LENGTH`` characters.
+    """
+    street_words = [STREET_ABBREVIATIONS.get(word, word) for word in _words(street)]
+    normalized = "|".join(
+        [
+            str(number),
+            "-".join(street_words),
+            city_key(city),
+            "-".join(_words(state)),
+            str(zip_code),
+            "-".join(_words(country_iso_code)),
+        ]
+    )
+    return hashlib.sha1(normalized.encode(), usedforsecurity=False).hexdigest()
@@ -0,0 +1,161 @@
+"""
+Page cache with single-flight regeneration.
+
+``@page_cache`` caches the rendered responses of a public view for
+``PAGE_CACHE_TIMEOUT`` seconds. When an entry expires, one request
+regenerates it while the others do not touch the database:
+
+* within a process, the first thread to miss a key regenerates it and the
+  other threads wait for it on an event;
+* across the worker processes of a host, the regenerating request holds a
+  lock in the shared cache (``cache.add``); the requests of other workers
+  poll the cache for the new entry for up to ``PAGE_CACHE_WAIT`` seconds,
+  and regenerate the page themselves only if it is still missing then;
+* entries are kept ``PAGE_CACHE_STALE_TIMEOUT`` seconds past their
+  expiry, and an expired entry is served as is (stale-while-revalidate)
+  while the lock holder regenerates it, so only the lock holder waits.
+  It regenerates the page within its own request, as the view needs the
+  request: the first request after the expiry still pays for a render.
+
+Only successful ``GET`` and ``HEAD`` responses that set no cookie are
+cached. Cached pages are not invalidated when the data changes: they are
+at most ``PAGE_CACHE_TIMEOUT`` seconds old, plus the stale period.
+"""
+
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+CACHE_KEY = "page-cache:%s"
+LOCK_SUFFIX = ":lock"
+POLL_INTERVAL = 0.05
+
+_lock = threading.Lock()
+_inflight = {}
+
+
+def cache_key(request):
+    """Return the cache key of the page requested."""
+    path = request.get_full_path().encode()
+    return CACHE_KEY % hashlib.md5(path, usedforsecurity=False).hexdigest()
+
+
+def _entry(response, request):
+    return {
+        "content": response.content,
+        "status": response.status_code,
+        "headers": dict(response.headers),
+        "template": getattr(request, "rendered_template", None),
+        "fresh_until": time.time() + settings.PAGE_CACHE_TIMEOUT,
+    }
+
+
+def _response(entry, request):
+    response = HttpResponse(entry["content"], status=entry["status"], headers=entry["headers"])
+    if entry["template"] is not None:
+        # Lets PreloadMiddleware add the page's preload links to cached pages.
+        request.rendered_template = entry["template"]
+    return response
+
+
+def _cacheable(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and "Cookie" not in response.get("Vary", "")
+    )
+
+
+def _regenerate(view, request, args, kwargs, key):
+    """Run the view and cache its response, if cacheable."""
+    response = view(request, *args, **kwargs)
+    if _cacheable(response):
+        timeout = settings.PAGE_CACHE_TIMEOUT + settings.PAGE_CACHE_STALE_TIMEOUT
+        cache.set(key, _entry(response, request), timeout)
+    return response
+
+
+def _wait_for(key, seconds):
+    """Poll the cache for an entry written by another process."""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def _single_flight(view, request, args, kwargs, key, stale):
+    """
+    Regenerate a page in one request per host.
+
+    Args:
+        stale (dict): The expired entry, served while another request
+            regenerates it, or ``None``.
+    """
+    with _lock:
+        event = _inflight.get(key)
+        leader = event is None
+        if leader:
+            event = _inflight[key] = threading.Event()
+    if not leader:
+        if stale is not None:
+            return _response(stale, request)
+        event.wait(settings.PAGE_CACHE_WAIT)
+        entry = cache.get(key)
+        if entry is not None:
+            return _response(entry, request)
+        return view(request, *args, **kwargs)
+
+    lock_key = key + LOCK_SUFFIX
+    try:
+        if cache.add(lock_key, 1, timeout=settings.PAGE_CACHE_LOCK_TIMEOUT):
+            try:
+                return _regenerate(view, request, args, kwargs, key)
+            finally:
+                cache.delete(lock_key)
+        # Another worker is regenerating the page.
+        entry = stale or _wait_for(key, settings.PAGE_CACHE_WAIT)
+        if entry is not None:
+            return _response(entry, request)
+        return _regenerate(view, request, args, kwargs, key)
+    finally:
+        with _lock:
+            del _inflight[key]
+        event.set()
+
+
+def page_cache(view):
+    """
+    Cache the responses of a view, regenerating each expired page once.
+
+    Apply it under ``@query_budget``, so the budget is checked on the
+    requests that do regenerate a page.
+
+    Args:
+        view (callable): The view function.
+
+    Returns:
+        callable: The caching view.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.PAGE_CACHE_TIMEOUT or request.method not in ("GET", "HEAD"):
+            return view(request, *args, **kwargs)
+        key = cache_key(request)
+        entry = cache.get(key)
+        if entry is not None and entry["fresh_until"] > time.time():
+            return _response(entry, request)
+        if not settings.PAGE_CACHE_SINGLE_FLIGHT:
+            return _regenerate(view, request, args, kwargs, key)
+        return _single_flight(view, request, args, kwargs, key, entry)
+
+    return wrapper
@@ -0,0 +1,128 @@
+"""
+Buffered page view counters.
+
+Writing a row per page view would queue every request on the SQLite write
+lock. ``@count_views`` instead adds each successful view of a page to an
+in-memory counter of the worker process. Every ``PAGE_VIEWS_FLUSH_INTERVAL``
+seconds, or once ``PAGE_VIEWS_MAX_PENDING`` pages have pending views, the
+counters are handed to the ``upsert`` background task (see
+``oc_lettings_site.tasks``), which adds them to the ``PageViewCount`` rows
+with one batched ``INSERT ... ON CONFLICT DO UPDATE`` statement. The views
+still pending when the process exits are flushed by an ``atexit`` hook.
+
+The counters are approximate: the views buffered by a worker that is
+killed are lost.
+"""
+
+import atexit
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import PageViewCount
+from .tasks import task
+
+_lock = threading.Lock()
+_pending = Counter()
+_state = {"last_flush": time.monotonic()}
+
+
+def _upsert_sql():
+    table = connection.ops.quote_name(PageViewCount._meta.db_table)
+    return (
+        "INSERT INTO %s (kind, object_key, count, updated_at) VALUES (%%s, %%s, %%s, %%s)"
+        " ON CONFLICT (kind, object_key) DO UPDATE"
+        " SET count = %s.count + excluded.count, updated_at = excluded.updated_at"
+        % (table, table)
+    )
+
+
+@task
+def upsert(rows):
+    """
+    Add view counts to the ``PageViewCount`` rows, creating the missing ones.
+
+    Args:
+        rows (list): ``[kind, object_key, views]`` lists.
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.executemany(_upsert_sql(), [(kind, key, views, now) for kind, key, views in rows])
+
+
+def flush():
+    """
+    Hand the views pending in this process to the ``upsert`` task.
+
+    Returns:
+        int: Number of pages whose views were flushed.
+    """
+    with _lock:
+        rows = [[kind, key, views] for (kind, key), views in _pending.items()]
+        _pending.clear()
+        _state["last_flush"] = time.monotonic()
+    if rows:
+        upsert.defer(rows)
+    return len(rows)
+
+
+def record(kind, object_key):
+    """Count a view of a page, flushing the pending views when due."""
+    with _lock:
+        _pending[kind, str(object_key)] += 1
+        due = (
+            len(_pending) >= settings.PAGE_VIEWS_MAX_PENDING
+            or time.monotonic() - _state["last_flush"] >= settings.PAGE_VIEWS_FLUSH_INTERVAL
+        )
+    if due:
+        flush()
+
+
+def reset():
+    """Drop the views pending in this process."""
+    with _lock:
+        _pending.clear()
+
+
+def pending():
+    """Return a copy of the views not flushed yet, keyed by ``(kind, object_key)``."""
+    with _lock:
+        return dict(_pending)
+
+
+def count_views(kind, kwarg):
+    """
+    Count the successful views of a detail page.
+
+    Apply it above ``@query_budget``, so the flushes it triggers are not
+    counted against the view.
+
+    Args:
+        kind (str): Kind of the page, such as ``"letting"``.
+        kwarg (str): URL keyword argument identifying the object shown.
+
+    Returns:
+        callable: Decorator of view functions.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and request.method == "GET":
+                record(kind, kwargs[kwarg])
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+@atexit.register
+def _flush_at_exit():
+    flush()
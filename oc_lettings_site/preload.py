@@ -0,0 +1,247 @@
+"""
+Preload headers and Early Hints for the static files of the rendered pages.
+
+The stylesheet, script and logo of ``base.html`` are only requested once the
+browser has parsed the page that references them. ``PreloadMiddleware``
+announces them in a ``Link: <url>; rel=preload`` header instead, so their
+download starts with the response headers.
+
+The assets of a template are found by walking its compiled node tree,
+through ``{% extends %}`` and ``{% include %}``, for ``{% static %}`` tags
+with a literal path, and are computed once per template (on each render in
+``DEBUG``, so edited templates are picked up). The template rendered for a
+request is noted on the request by the ``DjangoTemplates`` backend below.
+Other backends noting their templates with ``NotedTemplateMixin`` list the
+assets of a template with their own ``static_paths(template_name)`` method,
+like the optional Jinja2 backend of ``oc_lettings_site.jinja2``.
+
+Under ASGI, ``EarlyHintsMiddleware`` also sends the links of a view in a
+``103 Early Hints`` response, before the view runs, to servers supporting
+the ``http.response.early_hint`` extension (Hypercorn). The links sent are
+the ones of the last response of the same view.
+"""
+
+import posixpath
+import threading
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist, engines
+from django.template.backends import django as django_backend
+from django.template.loader_tags import ExtendsNode, IncludeNode
+from django.templatetags.static import StaticNode, static
+from django.urls import Resolver404, resolve
+
+EARLY_HINT_EXTENSION = "http.response.early_hint"
+
+# ``as`` attribute of the preloaded files, by extension.
+DESTINATIONS = {
+    ".css": "style",
+    ".js": "script",
+    ".gif": "image",
+    ".ico": "image",
+    ".jpeg": "image",
+    ".jpg": "image",
+    ".png": "image",
+    ".svg": "image",
+    ".webp": "image",
+    ".woff": "font",
+    ".woff2": "font",
+}
+
+_lock = threading.Lock()
+_template_links = {}
+_view_links = {}
+
+
+class NotedTemplateMixin:
+    """Template of a backend, noting its name on the request it is rendered for."""
+
+    def render(self, context=None, request=None):
+        name = self.origin.template_name
+        if request is not None and name and not hasattr(request, "rendered_template"):
+            request.rendered_template = (self.backend.name, name)
+        return super().render(context, request)
+
+
+class Template(NotedTemplateMixin, django_backend.Template):
+    """Django template noting its name on the request it is rendered for."""
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """``DjangoTemplates`` backend whose templates are noted on the request."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+def _literal(expression):
+    """Return the value of a filter-less string literal expression, else ``None``."""
+    if expression.filters or not isinstance(expression.var, str):
+        return None
+    return str(expression.var)
+
+
+def static_paths(template, seen=None):
+    """
+    Return the literal ``{% static %}`` paths of a compiled template.
+
+    Args:
+        template (django.template.Template): The template.
+        seen (set): Names of the templates already walked.
+
+    Returns:
+        list: Paths in the order of the template, parents first.
+    """
+    seen = set() if seen is None else seen
+    seen.add(template.origin.template_name)
+    paths = []
+    for node in template.nodelist.get_nodes_by_type(ExtendsNode):
+        paths += _walk(template.engine, _literal(node.parent_name), seen)
+    for node in template.nodelist.get_nodes_by_type(IncludeNode):
+        name = _literal(node.template) if hasattr(node.template, "filters") else None
+        paths += _walk(template.engine, name, seen)
+    for node in template.nodelist.get_nodes_by_type(StaticNode):
+        path = _literal(node.path)
+        if path is not None:
+            paths.append(path)
+    return paths
+
+
+def _walk(engine, name, seen):
+    if name is None or name in seen:
+        return []
+    try:
+        return static_paths(engine.get_template(name), seen)
+    except TemplateDoesNotExist:
+        return []
+
+
+def link(path):
+    """
+    Return the ``Link`` header value preloading a static file.
+
+    Returns:
+        str: The value, or ``None`` for files that are not preloaded.
+    """
+    destination = DESTINATIONS.get(posixpath.splitext(path)[1].lower())
+    if destination is None:
+        return None
+    try:
+        url = static(path)
+    except ValueError:
+        # Missing from the manifest: the page itself will fail to load it.
+        return None
+    value = "<%s>; rel=preload; as=%s" % (url, destination)
+    if destination == "font":
+        value += "; crossorigin"
+    return value
+
+
+def template_links(backend, template_name):
+    """
+    Return the ``Link`` values preloading the static files of a template.
+
+    Args:
+        backend (str): Name of the template engine.
+        template_name (str): Name of the template.
+
+    Returns:
+        list: Distinct values, in the order of the template.
+    """
+    key = (backend, template_name)
+    if key in _template_links and not settings.DEBUG:
+        return _template_links[key]
+    engine = engines[backend]
+    if isinstance(engine, django_backend.DjangoTemplates):
+        paths = static_paths(engine.engine.get_template(template_name))
+    elif hasattr(engine, "static_paths"):
+        paths = engine.static_paths(template_name)
+    else:
+        paths = []
+    links = []
+    for path in paths:
+        value = link(path)
+        if value and value not in links:
+            links.append(value)
+    with _lock:
+        _template_links[key] = links
+    return links
+
+
+def view_links(view_name):
+    """Return the ``Link`` values of the last response of a view."""
+    return _view_links.get(view_name, [])
+
+
+def reset():
+    """Forget the links computed so far."""
+    with _lock:
+        _template_links.clear()
+        _view_links.clear()
+
+
+class PreloadMiddleware:
+    """
+    Add preload ``Link`` headers to the HTML pages rendered from a template.
+
+    Only successful HTML responses get them, including the streamed list
+    pages; links already set by the view are kept first.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        rendered = getattr(request, "rendered_template", None)
+        if (
+            rendered is None
+            or response.status_code != 200
+            or not response.get("Content-Type", "").startswith("text/html")
+        ):
+            return response
+        links = template_links(*rendered)
+        if links:
+            response["Link"] = ", ".join(filter(None, [response.get("Link")] + links))
+        match = request.resolver_match
+        if match is not None:
+            with _lock:
+                _view_links[match.view_name] = links
+        return response
+
+
+class EarlyHintsMiddleware:
+    """
+    ASGI middleware sending the links of a view as ``103 Early Hints``.
+
+    Args:
+        app: The ASGI application.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and EARLY_HINT_EXTENSION in scope.get("extensions", {}):
+            links = self.links(scope)
+            if links:
+                await send(
+                    {
+                        "type": EARLY_HINT_EXTENSION,
+                        "links": [value.encode("latin-1") for value in links],
+                    }
+                )
+        await self.app(scope, receive, send)
+
+    def links(self, scope):
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        try:
+            return view_links(resolve(path).view_name)
+        except Resolver404:
+            return []
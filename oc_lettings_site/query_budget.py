@@ -0,0 +1,157 @@
+"""
+Per-view budgets of database queries.
+
+A view decorated with ``@query_budget(n)`` runs with a database execute
+wrapper counting the queries it makes, rendering included. When a request
+needs more than ``n`` queries, typically because a template change brought
+back a query per row:
+
+* in strict mode (``QUERY_BUDGET_STRICT``, on under DEBUG and in tests)
+  the request fails with ``QueryBudgetExceeded``;
+* otherwise the violation is logged with the fingerprints of the queries
+  (see ``oc_lettings_site.sql``), a stack trace of the first query over
+  budget for a sample of ``QUERY_BUDGET_STACK_SAMPLE_RATE`` of the
+  violations, and counted per URL name in the shared cache.
+
+``budgets()`` lists the budget of every named URL, and ``violations()``
+the counts recorded so far.
+"""
+
+import functools
+import logging
+import random
+import traceback
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.urls import get_resolver
+
+from .sql import fingerprint
+
+logger = logging.getLogger(__name__)
+
+COUNTER_KEY = "query-budget:violations:%s"
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode when a view makes more queries than its budget."""
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting queries by fingerprint.
+
+    Args:
+        budget (int): Queries allowed before a stack trace is taken.
+        capture_stack (bool): Whether to keep the stack of the first query
+            over budget.
+    """
+
+    def __init__(self, budget, capture_stack):
+        self.budget = budget
+        self.capture_stack = capture_stack
+        self.count = 0
+        self.fingerprints = Counter()
+        self.stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        self.fingerprints[fingerprint(sql)] += 1
+        if self.count == self.budget + 1 and self.capture_stack:
+            self.stack = "".join(traceback.format_stack(limit=30)[:-1])
+        return execute(sql, params, many, context)
+
+
+def _url_name(request, view):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match is not None else "%s.%s" % (view.__module__, view.__name__)
+
+
+def query_budget(max_queries):
+    """
+    Limit the number of queries a view makes per request.
+
+    Args:
+        max_queries (int): Queries allowed, template rendering included.
+
+    Returns:
+        callable: Decorator of view functions.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            strict = settings.QUERY_BUDGET_STRICT
+            sampled = strict or random.random() < settings.QUERY_BUDGET_STACK_SAMPLE_RATE
+            counter = QueryCounter(max_queries, capture_stack=sampled)
+            with connection.execute_wrapper(counter):
+                response = view(request, *args, **kwargs)
+            if counter.count > max_queries:
+                report_violation(_url_name(request, view), max_queries, counter, strict)
+            return response
+
+        wrapper.query_budget = max_queries
+        return wrapper
+
+    return decorator
+
+
+def report_violation(name, budget, counter, strict):
+    """
+    Fail, or log and count, a request over its query budget.
+
+    Raises:
+        QueryBudgetExceeded: In strict mode.
+    """
+    queries = "\n".join(
+        "  %d x %s" % (count, sql) for sql, count in counter.fingerprints.most_common(5)
+    )
+    message = "%s made %d queries, over its budget of %d:\n%s" % (
+        name,
+        counter.count,
+        budget,
+        queries,
+    )
+    if strict:
+        raise QueryBudgetExceeded(
+            message + ("\nFirst query over budget:\n" + counter.stack if counter.stack else "")
+        )
+    key = COUNTER_KEY % name
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, timeout=None)
+    if counter.stack:
+        message += "\nFirst query over budget:\n" + counter.stack
+    logger.warning(message)
+
+
+def budgets():
+    """
+    Return the query budget of every named URL whose view has one.
+
+    Returns:
+        dict: Budgets keyed by URL name, e.g. ``"lettings:index"``.
+    """
+    found = {}
+
+    def walk(patterns, namespace):
+        for pattern in patterns:
+            if hasattr(pattern, "url_patterns"):
+                prefix = namespace + pattern.namespace + ":" if pattern.namespace else namespace
+                walk(pattern.url_patterns, prefix)
+            elif pattern.name and hasattr(pattern.callback, "query_budget"):
+                found[namespace + pattern.name] = pattern.callback.query_budget
+
+    walk(get_resolver().url_patterns, "")
+    return found
+
+
+def violations():
+    """Return the number of violations counted so far, keyed by URL name."""
+    names = list(budgets())
+    counts = cache.get_many([COUNTER_KEY % name for name in names])
+    return {name: counts.get(COUNTER_KEY % name, 0) for name in names}
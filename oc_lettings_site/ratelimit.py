@@ -0,0 +1,145 @@
+"""
+Token bucket rate limiting of the site's views.
+
+Every request takes a token from the bucket of its client IP address, and
+from the bucket of its client IP and URL name for the routes listed in
+``RATELIMIT_ROUTES``, such as the letting and profile pages that scrapers
+walk one id at a time. Buckets are refilled at a constant rate up to their
+burst size; a request finding one of them empty gets a ``429 Too Many
+Requests`` response, before the view or any query runs.
+
+Each bucket is a single timestamp in the ``RATELIMIT_CACHE`` cache: the
+time at which the bucket will be full again (the "generic cell rate
+algorithm" form of a token bucket). With the default SQLite cache, shared
+by all the worker processes, taking a token is one atomic upsert, so
+concurrent requests of one client, in any worker, never share a token.
+Any other cache is read and written under a lock of the process, which is
+only atomic when the cache belongs to a single process: a ``LocMemCache``
+is an opt-in for deployments running one worker process.
+
+Health probes, the addresses of ``RATELIMIT_EXEMPT_IPS`` and staff users
+are never limited. Staff users are only looked up for the requests about
+to be limited, so limiting costs no session or user query.
+"""
+
+import math
+import threading
+import time
+from importlib import import_module
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .cache import SQLiteCache
+
+CACHE_KEY = "ratelimit:%s:%s"
+ALL_ROUTES = "*"
+
+_lock = threading.Lock()
+
+
+def client_ip(request):
+    """
+    Return the IP address of the client of a request.
+
+    With ``RATELIMIT_PROXY_COUNT`` proxies in front of the site, the address
+    is read from ``X-Forwarded-For``, skipping the entries the client could
+    have forged.
+    """
+    proxies = settings.RATELIMIT_PROXY_COUNT
+    if proxies:
+        forwarded = [
+            address.strip()
+            for address in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")
+            if address.strip()
+        ]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def take(key, rate, burst, now=None):
+    """
+    Take a token from a bucket.
+
+    Args:
+        key (str): Cache key of the bucket.
+        rate (float): Tokens added per second.
+        burst (int): Size of the bucket.
+        now (float): Current time, ``time.time()`` by default.
+
+    Returns:
+        float: ``0`` if a token was taken, else the seconds until one is
+            available.
+    """
+    store = caches[settings.RATELIMIT_CACHE]
+    now = time.time() if now is None else now
+    interval = 1.0 / rate
+    if isinstance(store, SQLiteCache):
+        return store.take_token(key, interval, burst, now)
+    with _lock:
+        full_at = max(store.get(key) or now, now) + interval
+        wait = full_at - now - burst * interval
+        if wait > 0:
+            return wait
+        store.set(key, full_at, timeout=math.ceil(full_at - now) + 1)
+    return 0
+
+
+def _is_staff(request):
+    user = getattr(request, "user", None)
+    if user is None:
+        # Stateless views run without sessions; read the session only now.
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not session_key:
+            return False
+        engine = import_module(settings.SESSION_ENGINE)
+        user = get_user(SimpleNamespace(session=engine.SessionStore(session_key)))
+    return user.is_active and user.is_staff
+
+
+def too_many_requests(wait):
+    """Build the ``429`` response, telling the client when to retry."""
+    response = HttpResponse(
+        b"Too many requests, please slow down.\n",
+        status=429,
+        content_type="text/plain; charset=utf-8",
+    )
+    response["Retry-After"] = str(math.ceil(wait))
+    return response
+
+
+class RateLimitMiddleware:
+    """
+    Answer ``429 Too Many Requests`` to clients over their request rate.
+
+    The check runs in ``process_view``, once the URL is resolved and before
+    any view, so it must come before the middleware whose ``process_view``
+    does work, such as CSRF.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.RATELIMIT_ENABLED:
+            return None
+        route = request.resolver_match.view_name
+        ip = client_ip(request)
+        if route in settings.RATELIMIT_EXEMPT_ROUTES or ip in settings.RATELIMIT_EXEMPT_IPS:
+            return None
+        buckets = [(ALL_ROUTES, settings.RATELIMIT_DEFAULT)]
+        if route in settings.RATELIMIT_ROUTES:
+            buckets.append((route, settings.RATELIMIT_ROUTES[route]))
+        now = time.time()
+        for name, (rate, burst) in buckets:
+            wait = take(CACHE_KEY % (name, ip), rate, burst, now)
+            if wait:
+                return None if _is_staff(request) else too_many_requests(wait)
+        return None
@@ -0,0 +1,274 @@
+"""
+Generation of synthetic lettings and profiles for load tests and benchmarks.
+
+Rows are generated in batches as plain tuples and inserted with one
+``executemany`` per table and batch, bypassing model instances and signals.
+Each batch draws from its own ``random.Random`` seeded with the run's seed
+and the batch number, so the data is the same whether the batches are
+generated in this process or in a pool of worker processes, and from one
+run to the next. Primary keys are assigned up front, after the highest
+existing ones, so lettings can point to their addresses without a read.
+
+Cities are drawn with weights proportional to their population, street
+numbers on a logarithmic scale, and titles mostly between 20 and 60
+characters with a long tail up to the 256 characters the column holds.
+"""
+
+import math
+import random
+from contextlib import contextmanager
+
+from lettings.geo import geohash
+from oc_lettings_site.normalization import address_key, city_key
+
+# name, state, first zip code, latitude, longitude, population (thousands)
+CITIES = [
+    ("New York", "NY", 10001, 40.7128, -74.0060, 8336),
+    ("Los Angeles", "CA", 90001, 34.0522, -118.2437, 3822),
+    ("Chicago", "IL", 60601, 41.8781, -87.6298, 2665),
+    ("Houston", "TX", 77001, 29.7604, -95.3698, 2302),
+    ("Phoenix", "AZ", 85001, 33.4484, -112.0740, 1644),
+    ("Philadelphia", "PA", 19101, 39.9526, -75.1652, 1567),
+    ("San Antonio", "TX", 78201, 29.4241, -98.4936, 1472),
+    ("San Diego", "CA", 92101, 32.7157, -117.1611, 1381),
+    ("Dallas", "TX", 75201, 32.7767, -96.7970, 1299),
+    ("Austin", "TX", 73301, 30.2672, -97.7431, 974),
+    ("Jacksonville", "FL", 32099, 30.3322, -81.6557, 971),
+    ("San Jose", "CA", 95101, 37.3382, -121.8863, 971),
+    ("Fort Worth", "TX", 76101, 32.7555, -97.3308, 956),
+    ("Columbus", "OH", 43085, 39.9612, -82.9988, 907),
+    ("Charlotte", "NC", 28201, 35.2271, -80.8431, 897),
+    ("Indianapolis", "IN", 46201, 39.7684, -86.1581, 880),
+    ("San Francisco", "CA", 94102, 37.7749, -122.4194, 808),
+    ("Seattle", "WA", 98101, 47.6062, -122.3321, 749),
+    ("Denver", "CO", 80201, 39.7392, -104.9903, 713),
+    ("Nashville", "TN", 37201, 36.1627, -86.7816, 683),
+    ("Washington", "DC", 20001, 38.9072, -77.0369, 671),
+    ("Boston", "MA", 2108, 42.3601, -71.0589, 650),
+    ("Portland", "OR", 97201, 45.5152, -122.6784, 635),
+    ("Las Vegas", "NV", 88901, 36.1699, -115.1398, 656),
+    ("Detroit", "MI", 48201, 42.3314, -83.0458, 620),
+    ("Memphis", "TN", 37501, 35.1495, -90.0490, 621),
+    ("Baltimore", "MD", 21201, 39.2904, -76.6122, 569),
+    ("Milwaukee", "WI", 53201, 43.0389, -87.9065, 563),
+    ("Albuquerque", "NM", 87101, 35.0844, -106.6504, 561),
+    ("Tucson", "AZ", 85701, 32.2226, -110.9747, 546),
+    ("Fresno", "CA", 93650, 36.7378, -119.7871, 545),
+    ("Sacramento", "CA", 94203, 38.5816, -121.4944, 528),
+    ("Atlanta", "GA", 30301, 33.7490, -84.3880, 499),
+    ("Kansas City", "MO", 64101, 39.0997, -94.5786, 510),
+    ("Miami", "FL", 33101, 25.7617, -80.1918, 449),
+    ("Raleigh", "NC", 27601, 35.7796, -78.6382, 476),
+    ("Omaha", "NE", 68101, 41.2565, -95.9345, 485),
+    ("Minneapolis", "MN", 55401, 44.9778, -93.2650, 425),
+    ("New Orleans", "LA", 70112, 29.9511, -90.0715, 370),
+    ("Brunswick", "GA", 31520, 31.1499, -81.4915, 15),
+    ("Willoughby", "OH", 44094, 41.6398, -81.4065, 23),
+    ("Newport News", "VA", 23601, 37.0871, -76.4730, 184),
+    ("Marquette", "MI", 49855, 46.5436, -87.3954, 21),
+    ("Aliquippa", "PA", 15001, 40.6367, -80.2401, 9),
+    ("East Meadow", "NY", 11554, 40.7140, -73.5590, 38),
+]
+
+STREETS = (
+    "Main", "Oak", "Pine", "Maple", "Cedar", "Elm", "Washington", "Lake", "Hill",
+    "Park", "Walnut", "Sunset", "Lincoln", "Jackson", "Church", "River", "Highland",
+    "Willow", "Meadow", "Forest", "Spring", "Ridge", "Franklin", "Chestnut", "Madison",
+    "Bedford", "Harvard", "Argyle", "Wintergreen", "Military", "Mill", "Center", "Union",
+)
+STREET_TYPES = ("Street", "Avenue", "Road", "Boulevard", "Lane", "Drive", "Court", "Place")
+ADJECTIVES = (
+    "Cozy", "Sunny", "Charming", "Spacious", "Modern", "Rustic", "Bright", "Quiet",
+    "Stylish", "Historic", "Luxurious", "Secluded", "Renovated", "Peaceful", "Elegant",
+)
+PROPERTIES = (
+    "Studio", "Loft", "Cottage", "Apartment", "Bungalow", "Cabin", "Townhouse", "Villa",
+    "Guest Suite", "Farmhouse", "Condo", "Penthouse", "Tiny House", "Chalet",
+)
+FEATURES = (
+    "with Hot Tub", "near the Beach", "with Garden", "Downtown", "with Lake View",
+    "with Fireplace", "close to Transit", "with Rooftop Deck", "in the Woods",
+    "with Pool", "pet friendly", "with Mountain View", "and Free Parking",
+)
+FIRST_NAMES = (
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda",
+    "David", "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+    "Thomas", "Sarah", "Carlos", "Maria", "Wei", "Mei", "Ahmed", "Fatima", "Yuki", "Olga",
+)
+LAST_NAMES = (
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson",
+    "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Nguyen", "Chen", "Kim",
+)
+
+CITY_WEIGHTS = [city[5] for city in CITIES]
+CITY_KEYS = [city_key(city[0]) for city in CITIES]
+
+ADDRESS_COLUMNS = (
+    "id", "number", "street", "city", "state", "zip_code", "country_iso_code",
+    "latitude", "longitude", "geohash", "normalized_key",
+)
+LETTING_COLUMNS = ("id", "title", "address_id")
+SUMMARY_COLUMNS = ("letting_id", "title", "city", "state", "city_key", "updated_at")
+USER_COLUMNS = (
+    "id", "password", "last_login", "is_superuser", "username", "first_name", "last_name",
+    "email", "is_staff", "is_active", "date_joined",
+)
+PROFILE_COLUMNS = ("id", "favorite_city", "favorite_city_key", "user_id", "updated_at")
+
+
+def batch_random(seed, batch):
+    """Return the random generator of one batch of a run."""
+    return random.Random(seed * 1000003 + batch)
+
+
+def make_title(rng):
+    """
+    Return a letting title.
+
+    Most titles read "Adjective Property Feature" and are 20 to 60
+    characters long; one in fifty piles up features, up to 256 characters.
+    """
+    title = "%s %s %s" % (rng.choice(ADJECTIVES), rng.choice(PROPERTIES), rng.choice(FEATURES))
+    if rng.random() < 0.02:
+        target = rng.randint(len(title), 256)
+        while len(title) < target:
+            title += " & " + rng.choice(FEATURES)
+        title = title[:256].rstrip()
+    return title
+
+
+def letting_rows(seed, batch, first_id, size, timestamp):
+    """
+    Generate a batch of addresses, lettings and their summaries.
+
+    Args:
+        seed (int): Seed of the run.
+        batch (int): Number of the batch in the run.
+        first_id (int): Primary key of the first address and letting.
+        size (int): Lettings in the batch.
+        timestamp (str): Database value of the summaries' ``updated_at``.
+
+    Returns:
+        tuple: Rows of ``ADDRESS_COLUMNS``, ``LETTING_COLUMNS`` and
+            ``SUMMARY_COLUMNS``.
+    """
+    rng = batch_random(seed, batch)
+    random_, uniform, gauss, choice = rng.random, rng.uniform, rng.gauss, rng.choice
+    cities = rng.choices(range(len(CITIES)), weights=CITY_WEIGHTS, k=size)
+    addresses, lettings, summaries = [], [], []
+    for pk, index in zip(range(first_id, first_id + size), cities):
+        name, state, zip_base, lat, lon, _population = CITIES[index]
+        latitude = round(lat + gauss(0, 0.05), 6)
+        longitude = round(lon + gauss(0, 0.05), 6)
+        number = min(int(math.exp(uniform(0, 9.21))), 9999)
+        street = "%s %s" % (choice(STREETS), choice(STREET_TYPES))
+        zip_code = min(zip_base + int(random_() * 60), 99999)
+        addresses.append(
+            (
+                pk,
+                number,
+                street,
+                name,
+                state,
+                zip_code,
+                "USA",
+                latitude,
+                longitude,
+                geohash(latitude, longitude),
+                address_key(number, street, name, state, zip_code, "USA"),
+            )
+        )
+        title = make_title(rng)
+        lettings.append((pk, title, pk))
+        summaries.append((pk, title, name, state, CITY_KEYS[index], timestamp))
+    return addresses, lettings, summaries
+
+
+def user_rows(seed, batch, first_id, size, timestamp, password):
+    """
+    Generate a batch of users and their profiles.
+
+    Args:
+        seed (int): Seed of the run.
+        batch (int): Number of the batch in the run.
+        first_id (int): Primary key of the first user and profile.
+        size (int): Users in the batch.
+        timestamp (str): Database value of ``date_joined`` and ``updated_at``.
+        password (str): Password hash given to every user, or ``None`` for
+            unusable passwords.
+
+    Returns:
+        tuple: Rows of ``USER_COLUMNS`` and ``PROFILE_COLUMNS``.
+    """
+    rng = batch_random(seed, batch)
+    choice, getrandbits = rng.choice, rng.getrandbits
+    cities = rng.choices(range(len(CITIES)), weights=CITY_WEIGHTS, k=size)
+    users, profiles = [], []
+    for pk, index in zip(range(first_id, first_id + size), cities):
+        first_name, last_name = choice(FIRST_NAMES), choice(LAST_NAMES)
+        username = "%s%s%d" % (first_name.lower(), last_name.lower(), pk)
+        users.append(
+            (
+                pk,
+                password or "!%032x" % getrandbits(128),
+                None,
+                False,
+                username,
+                first_name,
+                last_name,
+                username + "@example.com",
+                False,
+                True,
+                timestamp,
+            )
+        )
+        favorite = CITIES[index][0] if getrandbits(3) else ""
+        profiles.append(
+            (pk, favorite, CITY_KEYS[index] if favorite else "", pk, timestamp)
+        )
+    return users, profiles
+
+
+def generate(task):
+    """Generate the rows of one batch; ``task`` is ``(kind, *arguments)``."""
+    kind, *arguments = task
+    return kind, (letting_rows if kind == "lettings" else user_rows)(*arguments)
+
+
+def insert_sql(connection, table, columns):
+    """Return the ``INSERT`` statement of rows of ``columns`` into ``table``."""
+    return "INSERT INTO %s (%s) VALUES (%s)" % (
+        connection.ops.quote_name(table),
+        ", ".join(connection.ops.quote_name(column) for column in columns),
+        ", ".join(["%s"] * len(columns)),
+    )
+
+
+@contextmanager
+def relaxed_sqlite_pragmas(connection):
+    """
+    Trade durability for insert speed on SQLite while the block runs.
+
+    Commits no longer wait for the disk and the page cache is enlarged. A
+    crash during the block can lose the last transactions, which is fine
+    for generated data. The previous settings are restored afterwards. On
+    other databases, and inside a transaction where SQLite cannot change
+    them, the block runs unchanged.
+    """
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        yield
+        return
+    pragmas = {"synchronous": "OFF", "cache_size": "-262144", "temp_store": "MEMORY"}
+    with connection.cursor() as cursor:
+        previous = {}
+        for name, value in pragmas.items():
+            cursor.execute("PRAGMA %s" % name)
+            previous[name] = cursor.fetchone()[0]
+            cursor.execute("PRAGMA %s = %s" % (name, value))
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in previous.items():
+                cursor.execute("PRAGMA %s = %s" % (name, value))
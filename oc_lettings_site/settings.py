@@ -10,18 +10,20 @@ https://docs.djangoproject.com/en/4.2/topics/settings/
 """
 
 import os
-import logging
+import sys
 
 from pathlib import Path
 
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    pass
-
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Only import python-dotenv when there is a .env file to load.
+if os.path.exists(os.path.join(BASE_DIR, ".env")):
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(os.path.join(BASE_DIR, ".env"))
+    except ImportError:
+        pass
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -36,31 +38,17 @@ DEBUG = os.environ.get("DEBUG", "True").lower() in ("true", "1", "yes")
 
 ALLOWED_HOSTS = os.environ.get("ALLOWED_HOSTS", "localhost,127.0.0.1").split(",")
 
+# Whether the test suite is running (pytest or ``manage.py test``).
+TESTING = "pytest" in sys.modules or sys.argv[1:2] == ["test"]
+
 
 # Sentry Configuration
+# The SDK is initialized lazily by the server entry points and the run_tasks
+# worker, see monitoring.py.
 SENTRY_DSN = os.environ.get("SENTRY_DSN", "")
-if SENTRY_DSN:
-    import sentry_sdk
-    from sentry_sdk.integrations.django import DjangoIntegration
-    from sentry_sdk.integrations.logging import LoggingIntegration
-
-    sentry_logging = LoggingIntegration(
-        level=logging.INFO,
-        event_level=logging.ERROR
-    )
-
-    sentry_sdk.init(
-        dsn=SENTRY_DSN,
-        integrations=[DjangoIntegration(), sentry_logging],
-        traces_sample_rate=1.0,
-        send_default_pii=True,
-        environment=os.environ.get("SENTRY_ENVIRONMENT", "development"),
-    )
+SENTRY_ENVIRONMENT = os.environ.get("SENTRY_ENVIRONMENT", "development")
 
 
-handler404 = "oc_lettings_site.views.custom_404_view"
-handler500 = "oc_lettings_site.views.custom_500_view"
-
 # Application definition
 
 INSTALLED_APPS = [
@@ -76,21 +64,32 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "oc_lettings_site.health.HealthCheckMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
+    "oc_lettings_site.compression.CompressionMiddleware",
+    "oc_lettings_site.ratelimit.RateLimitMiddleware",
+    "oc_lettings_site.stateless.StatelessSessionMiddleware",
     "django.middleware.common.CommonMiddleware",
-    "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
-    "django.contrib.messages.middleware.MessageMiddleware",
+    "oc_lettings_site.stateless.StatelessCsrfViewMiddleware",
+    "oc_lettings_site.stateless.StatelessAuthenticationMiddleware",
+    "oc_lettings_site.stateless.StatelessMessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "oc_lettings_site.preload.PreloadMiddleware",
 ]
 
+# Serve views decorated with @stateless without sessions, auth, CSRF and messages
+STATELESS_ROUTES = True
+
+# Seconds during which a readiness probe result is reused
+READINESS_CACHE_TTL = float(os.environ.get("READINESS_CACHE_TTL", "5"))
+
 ROOT_URLCONF = "oc_lettings_site.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates noting the rendered template for the preload headers
+        "BACKEND": "oc_lettings_site.preload.DjangoTemplates",
         "DIRS": [os.path.join(BASE_DIR, "templates")],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -104,8 +103,37 @@ TEMPLATES = [
     },
 ]
 
+# Render the public pages with Jinja2, an optional dependency, when set to
+# "jinja2". The templates without a Jinja2 port (in templates/jinja2 and the
+# jinja2 directories of the apps) are still rendered by DjangoTemplates, see
+# oc_lettings_site/jinja2.py.
+TEMPLATE_ENGINE = os.environ.get("TEMPLATE_ENGINE", "django")
+if TEMPLATE_ENGINE == "jinja2":
+    TEMPLATES.insert(
+        0,
+        {
+            "BACKEND": "oc_lettings_site.jinja2.Jinja2",
+            "DIRS": [os.path.join(BASE_DIR, "templates", "jinja2")],
+            "APP_DIRS": True,
+            "OPTIONS": {"environment": "oc_lettings_site.jinja2.environment"},
+        },
+    )
+
 WSGI_APPLICATION = "oc_lettings_site.wsgi.application"
 
+# Error pages
+# The 404 and 500 pages are rendered once per process, and kept compressed
+# too with ERROR_PAGES_PRECOMPRESS (else compressed on every response). 404s
+# are logged once per path prefix, then counted and logged together every
+# NOT_FOUND_LOG_INTERVAL seconds.
+
+ERROR_PAGES_PRECOMPRESS = True
+NOT_FOUND_LOG_INTERVAL = int(os.environ.get("NOT_FOUND_LOG_INTERVAL", "60"))
+
+# Send the preload links of the pages as 103 Early Hints, under ASGI servers
+# supporting it (Hypercorn)
+EARLY_HINTS = os.environ.get("EARLY_HINTS", "False").lower() in ("true", "1", "yes")
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -118,6 +146,148 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The SQLite backend shares entries between all the gunicorn workers of a host.
+
+CACHES = {
+    "default": {
+        "BACKEND": "oc_lettings_site.cache.SQLiteCache",
+        "LOCATION": os.environ.get(
+            "CACHE_LOCATION", os.path.join(BASE_DIR, ".cache", "cache.sqlite3")
+        ),
+        "TIMEOUT": 300,
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.environ.get("CACHE_MAX_ENTRIES", "10000")),
+            "MAX_SIZE": int(os.environ.get("CACHE_MAX_SIZE", str(64 * 1024 * 1024))),
+        },
+    },
+}
+
+
+# Sitemaps
+# Chunk files are written to SITEMAP_ROOT; page URLs are prefixed with
+# SITEMAP_BASE_URL, without which the sitemaps are not served.
+
+SITEMAP_ROOT = os.environ.get("SITEMAP_ROOT", os.path.join(BASE_DIR, ".cache", "sitemaps"))
+SITEMAP_BASE_URL = os.environ.get("SITEMAP_BASE_URL", "").rstrip("/")
+SITEMAP_CHUNK_SIZE = 50000
+
+
+# Geocoding
+# CSV table of postcode centroids used to geocode addresses offline.
+
+ZIP_CENTROIDS_FILE = os.environ.get(
+    "ZIP_CENTROIDS_FILE", os.path.join(BASE_DIR, "lettings", "data", "zip_centroids.csv")
+)
+NEARBY_MAX_RADIUS_KM = 100
+NEARBY_MAX_RESULTS = 50
+# Radius of the first circle of the radius search, which doubles it from there
+NEARBY_FIRST_RADIUS_KM = 0.25
+# Addresses read at most per cell by the radius search, which splits fuller cells
+NEARBY_CELL_CANDIDATES = 64
+
+# Lettings returned at most by one request to the batch lookup endpoint
+LETTINGS_BATCH_MAX_IDS = 100
+
+
+# Recommendations
+# Lettings shown on a profile page from its favorite city, cached per city
+# until a letting of that city changes.
+
+RECOMMENDATIONS_LIMIT = 5
+RECOMMENDATIONS_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+# Page cache
+# Public pages are cached for PAGE_CACHE_TIMEOUT seconds (not in DEBUG or
+# tests) and regenerated by one request per host when they expire, the
+# others being served the stale page or waiting up to PAGE_CACHE_WAIT seconds.
+
+PAGE_CACHE_TIMEOUT = int(os.environ.get("PAGE_CACHE_TIMEOUT", "0" if DEBUG or TESTING else "60"))
+PAGE_CACHE_STALE_TIMEOUT = 30
+PAGE_CACHE_WAIT = 2.0
+PAGE_CACHE_LOCK_TIMEOUT = 10
+PAGE_CACHE_SINGLE_FLIGHT = True
+
+# Streamed list pages and compression
+# The lettings and profiles lists are read and rendered STREAMING_CHUNK_SIZE
+# rows at a time, and streamed when longer (such pages are not cached).
+# Responses are compressed on the fly, with Brotli when the optional brotli
+# package is installed and the client accepts it, gzip otherwise.
+
+STREAMING_CHUNK_SIZE = int(os.environ.get("STREAMING_CHUNK_SIZE", "500"))
+COMPRESSION_BROTLI_QUALITY = 5
+
+
+# Page views
+# Views of the letting and profile pages are counted in memory per worker
+# and added to the database every PAGE_VIEWS_FLUSH_INTERVAL seconds (at each
+# view in DEBUG and tests). The most viewed lettings are cached on the index.
+
+PAGE_VIEWS_FLUSH_INTERVAL = 0 if DEBUG or TESTING else 10
+PAGE_VIEWS_MAX_PENDING = 1000
+POPULAR_LETTINGS_LIMIT = 5
+POPULAR_LETTINGS_CACHE_TIMEOUT = 300
+
+
+# Query budgets
+# Views over their query budget fail in strict mode, and are otherwise
+# logged (with a stack trace for a sample of them) and counted.
+
+QUERY_BUDGET_STRICT = os.environ.get(
+    "QUERY_BUDGET_STRICT", str(DEBUG or TESTING)
+).lower() in ("true", "1", "yes")
+QUERY_BUDGET_STACK_SAMPLE_RATE = float(os.environ.get("QUERY_BUDGET_STACK_SAMPLE_RATE", "0.1"))
+
+
+# Slow query log
+# Queries slower than the threshold are aggregated per fingerprint, with
+# their query plan, in each process and merged into the shared cache after
+# a request, every SLOW_QUERY_FLUSH_INTERVAL seconds.
+
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "True").lower() in ("true", "1", "yes")
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_MAX_FINGERPRINTS = 200
+SLOW_QUERY_FLUSH_INTERVAL = 30
+
+
+# Background tasks
+# TASKS_MODE is "immediate" (run in the caller), "thread" (a bounded pool of
+# threads per worker process) or "db" (durable Task rows run by the
+# run_tasks command). Failed tasks are retried TASKS_RETRIES times.
+
+TASKS_MODE = os.environ.get("TASKS_MODE", "immediate" if DEBUG or TESTING else "thread")
+TASKS_THREADS = int(os.environ.get("TASKS_THREADS", "2"))
+TASKS_QUEUE_SIZE = 1000
+TASKS_RETRIES = 3
+TASKS_RETRY_DELAY = 1.0
+TASKS_RUNNING_TIMEOUT = 600
+TASKS_SHUTDOWN_TIMEOUT = 5
+
+
+# Rate limiting
+# Limits of (requests per second, burst): one per client IP over all the
+# views, and one per client IP and URL name for RATELIMIT_ROUTES, kept in
+# RATELIMIT_CACHE, shared by the workers. A LocMemCache alias may be used
+# instead by deployments running a single worker process (see ratelimit.py).
+# The client IP is REMOTE_ADDR, or the X-Forwarded-For entry added by the
+# last of the RATELIMIT_PROXY_COUNT proxies in front of the site (1 on Render).
+
+RATELIMIT_PROXY_COUNT = int(os.environ.get("RATELIMIT_PROXY_COUNT", "0"))
+RATELIMIT_ENABLED = os.environ.get(
+    "RATELIMIT_ENABLED", str(not (DEBUG or TESTING))
+).lower() in ("true", "1", "yes")
+RATELIMIT_CACHE = "default"
+RATELIMIT_DEFAULT = (10, 100)
+RATELIMIT_ROUTES = {
+    "lettings:letting": (1, 30),
+    "profiles:profile": (1, 30),
+}
+RATELIMIT_EXEMPT_ROUTES = ("healthz", "readyz")
+RATELIMIT_EXEMPT_IPS = [ip for ip in os.environ.get("RATELIMIT_EXEMPT_IPS", "").split(",") if ip]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
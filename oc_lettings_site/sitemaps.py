@@ -0,0 +1,278 @@
+"""
+Sitemap generation for the lettings and profiles pages.
+
+``/sitemap.xml`` is a sitemap index pointing to one sitemap per chunk of
+``SITEMAP_CHUNK_SIZE`` (50,000 by default) primary keys of each section. A
+chunk covers a fixed primary key range, so a change to a row only affects
+the chunk that row falls in. Chunks are written to ``SITEMAP_ROOT`` as plain
+and gzipped XML, built with keyset iteration over the primary key, and
+served from disk. Saving or deleting a row deletes its chunk and the index,
+in a background task, and they are rebuilt on the next request for them (or
+by the ``build_sitemaps`` management command).
+
+The page URLs are prefixed with ``SITEMAP_BASE_URL``, never with the host of
+the request building a file, as the files are shared by every request.
+Without it, the sitemaps are not served.
+"""
+
+import gzip
+import os
+import tempfile
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import F, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.urls import reverse
+
+from lettings.models import Address, Letting, LettingSummary
+from profiles.models import Profile
+
+from .tasks import task
+
+BATCH_SIZE = 2000
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+XMLNS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+
+
+class SitemapSection:
+    """
+    A set of pages listed in the sitemap, one per row of a table.
+
+    Args:
+        name (str): Section name, used in the chunk file names and URLs.
+        queryset (QuerySet): Rows of the section.
+        pk_field (str): Name of the primary key column of the queryset.
+        location (callable): Returns the path of the page of a row, given
+            the row as a dict of the ``fields`` values.
+        fields (tuple): Columns ``location`` needs.
+    """
+
+    def __init__(self, name, queryset, pk_field, location, fields):
+        self.name = name
+        self.queryset = queryset
+        self.pk_field = pk_field
+        self.location = location
+        self.fields = fields
+
+    def chunk_of(self, pk):
+        """Return the number of the chunk a primary key falls in."""
+        return (pk - 1) // chunk_size()
+
+    def iter_chunk(self, number):
+        """
+        Yield the rows of a chunk in primary key order, one batch at a time.
+
+        Yields:
+            dict: The row's primary key, ``updated_at`` and ``fields``.
+        """
+        size = chunk_size()
+        last_pk = number * size
+        end_pk = last_pk + size
+        columns = (self.pk_field, "updated_at") + self.fields
+        while True:
+            batch = list(
+                self.queryset.filter(
+                    **{self.pk_field + "__gt": last_pk, self.pk_field + "__lte": end_pk}
+                )
+                .order_by(self.pk_field)
+                .values(*columns)[:BATCH_SIZE]
+            )
+            yield from batch
+            if len(batch) < BATCH_SIZE:
+                return
+            last_pk = batch[-1][self.pk_field]
+
+    def has_chunk(self, number):
+        """
+        Return whether a chunk holds at least one row.
+
+        Args:
+            number (int): Chunk number.
+
+        Returns:
+            bool: Whether the chunk is listed in the sitemap index.
+        """
+        max_pk = self.queryset.aggregate(max_pk=Max(self.pk_field))["max_pk"]
+        if max_pk is None or number > self.chunk_of(max_pk):
+            return False
+        size = chunk_size()
+        return self.queryset.filter(
+            **{self.pk_field + "__gt": number * size, self.pk_field + "__lte": (number + 1) * size}
+        ).exists()
+
+    def chunk_lastmods(self):
+        """
+        Return the chunks holding at least one row, with their latest change.
+
+        Returns:
+            list: ``(chunk_number, lastmod)`` tuples in chunk order.
+        """
+        rows = (
+            self.queryset.annotate(chunk=(F(self.pk_field) - 1) / chunk_size())
+            .values("chunk")
+            .annotate(lastmod=Max("updated_at"))
+            .order_by("chunk")
+        )
+        return [(row["chunk"], row["lastmod"]) for row in rows]
+
+
+SECTIONS = {
+    "lettings": SitemapSection(
+        "lettings",
+        LettingSummary.objects.all(),
+        "letting_id",
+        lambda row: reverse("lettings:letting", args=[row["letting_id"]]),
+        (),
+    ),
+    "profiles": SitemapSection(
+        "profiles",
+        Profile.objects.all(),
+        "id",
+        lambda row: reverse("profiles:profile", args=[row["user__username"]]),
+        ("user__username",),
+    ),
+}
+
+
+def chunk_size():
+    return getattr(settings, "SITEMAP_CHUNK_SIZE", 50000)
+
+
+def sitemap_path(name, compressed=False):
+    """Return the path of a sitemap file in ``SITEMAP_ROOT``."""
+    return os.path.join(settings.SITEMAP_ROOT, name + (".gz" if compressed else ""))
+
+
+def chunk_name(section, number):
+    return "sitemap-%s-%d.xml" % (section, number)
+
+
+def _write(name, parts):
+    """
+    Write a sitemap and its gzipped copy atomically.
+
+    Both files are written under temporary names and renamed into place, so
+    concurrent readers and writers never see a partial file.
+    """
+    os.makedirs(settings.SITEMAP_ROOT, exist_ok=True)
+    plain = tempfile.NamedTemporaryFile(dir=settings.SITEMAP_ROOT, delete=False)
+    packed = tempfile.NamedTemporaryFile(dir=settings.SITEMAP_ROOT, delete=False)
+    try:
+        with plain, packed, gzip.GzipFile(fileobj=packed, mode="wb", mtime=0) as compressor:
+            for part in parts:
+                data = part.encode()
+                plain.write(data)
+                compressor.write(data)
+        os.replace(plain.name, sitemap_path(name))
+        os.replace(packed.name, sitemap_path(name, compressed=True))
+    except BaseException:
+        for leftover in (plain.name, packed.name):
+            if os.path.exists(leftover):
+                os.unlink(leftover)
+        raise
+
+
+def build_chunk(section, number, base_url):
+    """
+    Write the sitemap of one chunk of a section.
+
+    Args:
+        section (str): Key of ``SECTIONS``.
+        number (int): Chunk number.
+        base_url (str): Scheme and host prepended to the page paths.
+
+    Returns:
+        str: Name of the written sitemap file.
+    """
+    sitemap = SECTIONS[section]
+
+    def parts():
+        yield XML_HEADER + "<urlset %s>\n" % XMLNS
+        for row in sitemap.iter_chunk(number):
+            yield "<url><loc>%s</loc><lastmod>%s</lastmod></url>\n" % (
+                escape(base_url + sitemap.location(row)),
+                row["updated_at"].date().isoformat(),
+            )
+        yield "</urlset>\n"
+
+    name = chunk_name(section, number)
+    _write(name, parts())
+    return name
+
+
+def build_index(base_url):
+    """
+    Write the sitemap index listing every non-empty chunk of every section.
+
+    Returns:
+        str: Name of the written index file.
+    """
+
+    def parts():
+        yield XML_HEADER + "<sitemapindex %s>\n" % XMLNS
+        for section, sitemap in SECTIONS.items():
+            for number, lastmod in sitemap.chunk_lastmods():
+                yield "<sitemap><loc>%s/%s</loc><lastmod>%s</lastmod></sitemap>\n" % (
+                    escape(base_url),
+                    chunk_name(section, number),
+                    lastmod.date().isoformat(),
+                )
+        yield "</sitemapindex>\n"
+
+    _write("sitemap.xml", parts())
+    return "sitemap.xml"
+
+
+@task
+def invalidate(section, pk):
+    """
+    Delete the sitemap chunk holding a row, and the index.
+
+    Args:
+        section (str): Key of ``SECTIONS``.
+        pk (int): Primary key of the changed row.
+    """
+    names = ["sitemap.xml", chunk_name(section, SECTIONS[section].chunk_of(pk))]
+    for name in names:
+        for compressed in (False, True):
+            try:
+                os.unlink(sitemap_path(name, compressed))
+            except FileNotFoundError:
+                pass
+
+
+@receiver(post_save, sender=Letting, dispatch_uid="sitemap_letting_saved")
+@receiver(post_delete, sender=Letting, dispatch_uid="sitemap_letting_deleted")
+def letting_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate.defer("lettings", instance.pk)
+
+
+@receiver(post_save, sender=Address, dispatch_uid="sitemap_address_saved")
+def address_changed(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    letting_id = Letting.objects.filter(address=instance).values_list("pk", flat=True).first()
+    if letting_id is not None:
+        invalidate.defer("lettings", letting_id)
+
+
+@receiver(post_save, sender=Profile, dispatch_uid="sitemap_profile_saved")
+@receiver(post_delete, sender=Profile, dispatch_uid="sitemap_profile_deleted")
+def profile_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate.defer("profiles", instance.pk)
+
+
+@receiver(post_save, sender=User, dispatch_uid="sitemap_user_saved")
+def user_changed(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # Logins only update last_login, which does not appear in the sitemap.
+    if raw or created or update_fields == frozenset(["last_login"]):
+        return
+    profile_id = Profile.objects.filter(user=instance).values_list("pk", flat=True).first()
+    if profile_id is not None:
+        invalidate.defer("profiles", profile_id)
@@ -0,0 +1,245 @@
+"""
+Slow query log.
+
+Every database connection gets an execute wrapper timing its queries. A
+query slower than ``SLOW_QUERY_THRESHOLD_MS`` is recorded under its
+fingerprint (see ``oc_lettings_site.sql``) with its count, total and
+maximum time, one sample statement and, the first time this process sees
+the fingerprint, the output of ``EXPLAIN QUERY PLAN`` for it.
+
+The wrapper only updates in-memory figures. The ``EXPLAIN`` statements and
+the merge of the figures into the shared cache run once the request has
+finished (or the ``run_tasks`` worker ran a batch), outside of the execute
+wrappers of the request, so they count towards no ``@query_budget``. The
+merge runs every ``SLOW_QUERY_FLUSH_INTERVAL`` seconds, and when the
+process exits, so the admin page and the ``slow_queries`` command show the
+offenders of all server processes. Both the in-process and the shared table keep at
+most ``SLOW_QUERY_MAX_FINGERPRINTS`` fingerprints, dropping those with the
+lowest total time, so memory stays bounded.
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .sql import fingerprint
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "slow-queries:stats"
+LOCK_KEY = "slow-queries:lock"
+SAMPLE_LENGTH = 2000
+
+_lock = threading.Lock()
+_local = threading.local()
+_pending = {}
+_explained = set()
+_unexplained = {}
+_state = {"last_flush": time.monotonic()}
+
+
+def _trim(stats, limit):
+    """Keep the ``limit`` fingerprints with the highest total time."""
+    if len(stats) > limit:
+        for key in sorted(stats, key=lambda key: stats[key]["total"])[: len(stats) - limit]:
+            del stats[key]
+
+
+def _merge(into, key, entry):
+    current = into.get(key)
+    if current is None:
+        into[key] = dict(entry)
+        return
+    current["count"] += entry["count"]
+    current["total"] += entry["total"]
+    current["max"] = max(current["max"], entry["max"])
+    current["last_seen"] = max(current["last_seen"], entry["last_seen"])
+    current["plan"] = current["plan"] or entry["plan"]
+
+
+def explain(connection, sql, params):
+    """
+    Return the query plan of a statement, or ``""`` if it cannot be explained.
+
+    Only ``SELECT`` statements are explained, as explaining a write may run
+    part of it on some databases.
+    """
+    if not sql.lstrip().upper().startswith("SELECT"):
+        return ""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("%s %s" % (connection.ops.explain_query_prefix(), sql), params)
+            return "\n".join(" ".join(str(column) for column in row) for row in cursor.fetchall())
+    except DatabaseError:
+        return ""
+
+
+def record(connection, sql, params, seconds):
+    """
+    Add a slow execution of a statement to this process' figures.
+
+    A statement of a new fingerprint is queued to be explained by
+    ``explain_pending()``.
+    """
+    key = fingerprint(sql)
+    entry = {
+        "count": 1,
+        "total": seconds,
+        "max": seconds,
+        "last_seen": time.time(),
+        "sql": sql[:SAMPLE_LENGTH],
+        "plan": "",
+    }
+    with _lock:
+        new = key not in _explained
+        if new:
+            if len(_explained) >= 4 * settings.SLOW_QUERY_MAX_FINGERPRINTS:
+                _explained.clear()
+            _explained.add(key)
+            _unexplained[key] = (connection.alias, sql, params)
+        _merge(_pending, key, entry)
+        _trim(_pending, settings.SLOW_QUERY_MAX_FINGERPRINTS)
+    if new:
+        logger.warning("New slow query (%.0f ms): %s", seconds * 1000, key)
+
+
+def explain_pending():
+    """
+    Explain the statements of the new fingerprints recorded so far.
+
+    A database connection opened for the ``EXPLAIN`` statements is closed
+    again: after a request, Django has already closed the request's own.
+    """
+    with _lock:
+        queued = [item for item in _unexplained.items() if item[0] in _pending]
+        _unexplained.clear()
+    if not queued:
+        return
+    plans = {}
+    opened = set()
+    _local.active = True
+    try:
+        for key, (alias, sql, params) in queued:
+            connection = connections[alias]
+            if connection.connection is None:
+                opened.add(alias)
+            plans[key] = explain(connection, sql, params)
+    finally:
+        _local.active = False
+        for alias in opened:
+            connections[alias].close()
+    with _lock:
+        for key, plan in plans.items():
+            if key in _pending:
+                _pending[key]["plan"] = _pending[key]["plan"] or plan
+
+
+def flush():
+    """
+    Explain the new statements and merge this process' figures into the shared table.
+
+    Skipped, keeping the figures for the next flush, while another process
+    holds the lock.
+    """
+    explain_pending()
+    if not cache.add(LOCK_KEY, 1, timeout=10):
+        return False
+    try:
+        with _lock:
+            pending = dict(_pending)
+            _pending.clear()
+            _state["last_flush"] = time.monotonic()
+        stats = cache.get(CACHE_KEY) or {}
+        for key, entry in pending.items():
+            _merge(stats, key, entry)
+        _trim(stats, settings.SLOW_QUERY_MAX_FINGERPRINTS)
+        cache.set(CACHE_KEY, stats, timeout=None)
+    finally:
+        cache.delete(LOCK_KEY)
+    return True
+
+
+def top(limit=20, order="total"):
+    """
+    Return the slowest fingerprints of all processes.
+
+    Args:
+        limit (int): Number of fingerprints.
+        order (str): ``"total"``, ``"max"`` or ``"count"``.
+
+    Returns:
+        list: Dicts with the ``fingerprint``, ``count``, ``total``,
+            ``mean`` and ``max`` time in seconds, ``last_seen`` timestamp,
+            sample ``sql`` and ``plan``.
+    """
+    flush()
+    stats = cache.get(CACHE_KEY) or {}
+    rows = [
+        dict(entry, fingerprint=key, mean=entry["total"] / entry["count"])
+        for key, entry in stats.items()
+    ]
+    rows.sort(key=lambda row: row[order], reverse=True)
+    return rows[:limit]
+
+
+def reset():
+    """Forget every recorded slow query."""
+    with _lock:
+        _pending.clear()
+        _explained.clear()
+        _unexplained.clear()
+    cache.delete(CACHE_KEY)
+
+
+@receiver(request_finished, dispatch_uid="slow_query_flush")
+def flush_when_due(**kwargs):
+    """
+    Explain the new statements, and flush the figures when due.
+
+    Runs after each request, and after each batch of the ``run_tasks`` worker.
+    """
+    with _lock:
+        due = _pending and (
+            time.monotonic() - _state["last_flush"] >= settings.SLOW_QUERY_FLUSH_INTERVAL
+        )
+    if due:
+        flush()
+    else:
+        explain_pending()
+
+
+@atexit.register
+def _flush_at_exit():
+    if _pending:
+        flush()
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    """Execute wrapper recording the statements slower than the threshold."""
+    if getattr(_local, "active", False):
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    elapsed = time.perf_counter() - start
+    if elapsed * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS and not many:
+        _local.active = True
+        try:
+            record(context["connection"], sql, params, elapsed)
+        finally:
+            _local.active = False
+    return result
+
+
+@receiver(connection_created, dispatch_uid="slow_query_log")
+def install(sender, connection, **kwargs):
+    """Add the slow query wrapper to every new database connection."""
+    if settings.SLOW_QUERY_LOG and slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_wrapper)
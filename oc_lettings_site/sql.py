@@ -0,0 +1,39 @@
+"""
+Helpers to group SQL statements by shape.
+
+Two executions of the same ORM query differ only in their parameters, and
+``IN`` lists in their number of placeholders. Their fingerprint is the
+statement with every literal and placeholder replaced by ``?`` and every
+``IN`` list collapsed, so counters and logs keyed by fingerprint stay
+bounded however many distinct values the site queries.
+"""
+
+import hashlib
+import re
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """
+    Return the shape of an SQL statement.
+
+    Args:
+        sql (str): Statement, with ``%s`` placeholders or inline literals.
+
+    Returns:
+        str: The statement with literals and placeholders replaced by
+            ``?``, ``IN`` lists by ``(...)`` and whitespace collapsed.
+    """
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql.replace("%s", "?"))
+    sql = _IN_LIST.sub("(...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def fingerprint_id(fingerprint):
+    """Return a short stable identifier of a fingerprint, usable in cache keys."""
+    return hashlib.blake2b(fingerprint.encode(), digest_size=8).hexdigest()
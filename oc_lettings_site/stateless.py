@@ -0,0 +1,100 @@
+"""
+Stateless routing for the public read-only pages.
+
+Anonymous visitors of the lettings and profiles pages need neither a session,
+a user, a CSRF token nor flash messages. Views decorated with ``@stateless``
+are served without running the session, authentication, CSRF and messages
+middleware for ``GET`` and ``HEAD`` requests, while every other URL, such as
+``admin/``, keeps the full stack.
+
+The middleware classes below are drop-in subclasses of the Django ones, so
+the admin system checks still find them in ``settings.MIDDLEWARE``.
+"""
+
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.middleware.csrf import CsrfViewMiddleware
+from django.urls import Resolver404, resolve
+
+SAFE_METHODS = ("GET", "HEAD")
+
+
+def stateless(view):
+    """
+    Mark a view as not needing sessions, authentication, CSRF or messages.
+
+    Args:
+        view (callable): The view function.
+
+    Returns:
+        callable: The same view, flagged as stateless.
+    """
+    view.stateless = True
+    return view
+
+
+@lru_cache(maxsize=4096)
+def _path_is_stateless(path_info):
+    try:
+        match = resolve(path_info)
+    except Resolver404:
+        return False
+    return getattr(match.func, "stateless", False)
+
+
+@receiver(setting_changed)
+def _clear_path_cache(setting, **kwargs):
+    if setting in ("ROOT_URLCONF", "STATELESS_ROUTES"):
+        _path_is_stateless.cache_clear()
+
+
+def is_stateless(request):
+    """
+    Return whether the request targets a stateless view with a safe method.
+
+    The answer is computed once per request and once per path for the URL
+    resolution.
+    """
+    if not hasattr(request, "_stateless"):
+        request._stateless = (
+            getattr(settings, "STATELESS_ROUTES", True)
+            and request.method in SAFE_METHODS
+            and _path_is_stateless(request.path_info)
+        )
+    return request._stateless
+
+
+class StatelessSkipMixin:
+    """Skip the middleware for requests to stateless views."""
+
+    def __call__(self, request):
+        if is_stateless(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class StatelessSessionMiddleware(StatelessSkipMixin, SessionMiddleware):
+    """SessionMiddleware that does nothing for stateless views."""
+
+
+class StatelessCsrfViewMiddleware(StatelessSkipMixin, CsrfViewMiddleware):
+    """CsrfViewMiddleware that does nothing for stateless views."""
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if is_stateless(request):
+            return None
+        return super().process_view(request, callback, callback_args, callback_kwargs)
+
+
+class StatelessAuthenticationMiddleware(StatelessSkipMixin, AuthenticationMiddleware):
+    """AuthenticationMiddleware that does nothing for stateless views."""
+
+
+class StatelessMessageMiddleware(StatelessSkipMixin, MessageMiddleware):
+    """MessageMiddleware that does nothing for stateless views."""
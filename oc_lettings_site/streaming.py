@@ -0,0 +1,89 @@
+"""
+Streamed rendering of the list pages.
+
+A list page is normally rendered into one string, holding every row, before
+its first byte is sent. ``render_list`` reads the rows with a server-side
+cursor instead, ``STREAMING_CHUNK_SIZE`` at a time, and:
+
+* renders the page as usual when the rows fit in one chunk, so short lists
+  are still cached by ``@page_cache``;
+* otherwise renders the page with the first chunk and streams it: the part
+  of the page up to the end of the first chunk is sent first, then each
+  following chunk is rendered and sent with the rows template alone, then
+  the rest of the page.
+
+The page template includes its rows template, which renders the rows of
+``rows_name`` followed by ``{{ rows_marker }}``. The marker is empty except
+when streaming, where it shows where the following chunks go. The time to
+first byte and the memory used only depend on the chunk size, not on the
+number of rows. Streamed pages are not cached.
+
+Under ASGI, Django 4.2 reads a synchronous streaming iterator in full before
+sending anything, so the chunks are then produced by an asynchronous
+iterator instead, each one rendered in the thread of the view (which holds
+its database connection).
+"""
+
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.shortcuts import render
+from django.template import loader
+from django.utils.safestring import mark_safe
+
+ROWS_MARKER = mark_safe("<!-- more rows -->")
+
+
+def _stream(head, rows_template, rows_name, rows, size, tail):
+    yield head
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            break
+        yield rows_template.render({rows_name: chunk})
+    yield tail
+
+
+async def _astream(chunks):
+    """Yield the chunks of a synchronous iterator, read in the thread of the view."""
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def render_list(request, template_name, rows_template_name, context, rows_name, rows):
+    """
+    Render a list page, streaming it when it has more than one chunk of rows.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        template_name (str): Template of the page.
+        rows_template_name (str): Template of the rows, included by the page.
+        context (dict): Context of the page, without the rows.
+        rows_name (str): Name of the rows in the context.
+        rows (QuerySet): The rows, read in chunks of ``STREAMING_CHUNK_SIZE``.
+
+    Returns:
+        HttpResponse: The rendered page, or a ``StreamingHttpResponse``,
+            asynchronous under ASGI.
+    """
+    size = settings.STREAMING_CHUNK_SIZE
+    iterator = rows.iterator(chunk_size=size)
+    first = list(islice(iterator, size))
+    if len(first) < size:
+        return render(request, template_name, {**context, rows_name: first})
+    page = loader.render_to_string(
+        template_name, {**context, rows_name: first, "rows_marker": ROWS_MARKER}, request
+    )
+    head, _, tail = page.partition(ROWS_MARKER)
+    rows_template = loader.get_template(rows_template_name)
+    chunks = _stream(head, rows_template, rows_name, iterator, size, tail)
+    if isinstance(request, ASGIRequest):
+        chunks = _astream(chunks)
+    return StreamingHttpResponse(chunks)
@@ -0,0 +1,263 @@
+"""
+Background tasks, deferred off the request path.
+
+A function decorated with ``@task`` keeps working as a plain function and
+gains a ``defer(*args, **kwargs)`` method, which runs it according to
+``TASKS_MODE``:
+
+* ``"immediate"`` runs it right away, in the caller, and lets its errors
+  propagate (the default in ``DEBUG`` and tests, so side effects are
+  visible as soon as the change that caused them);
+* ``"thread"`` hands it, once the current transaction commits, to a
+  bounded pool of ``TASKS_THREADS`` threads of the current process. Up to
+  ``TASKS_QUEUE_SIZE`` calls wait for a thread; past that, the call runs
+  in the caller rather than piling up in memory. Calls still queued when
+  the process exits are lost, so this mode suits the side effects that
+  can be missed, such as cache purges;
+* ``"db"`` writes a ``Task`` row in the current transaction, so the call
+  is durable and atomic with the change that deferred it. The rows are
+  run by ``manage.py run_tasks``.
+
+A failing call is retried up to ``retries`` times (``TASKS_RETRIES`` by
+default), ``TASKS_RETRY_DELAY`` seconds apart, doubling at each attempt.
+The arguments must be JSON serializable.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+IMMEDIATE = "immediate"
+THREAD = "thread"
+DB = "db"
+
+
+class TaskError(Exception):
+    """Raised for a ``Task`` row naming no task function."""
+
+
+def task(func=None, *, retries=None):
+    """
+    Declare a task function.
+
+    Args:
+        func (callable): A module-level function.
+        retries (int): Retries after a failure, ``TASKS_RETRIES`` by default.
+
+    Returns:
+        callable: The same function, with a ``defer`` method.
+    """
+    if func is None:
+        return partial(task, retries=retries)
+    func.task_name = "%s.%s" % (func.__module__, func.__qualname__)
+    func.task_retries = retries
+    func.defer = partial(defer, func)
+    return func
+
+
+def _retries(func):
+    return settings.TASKS_RETRIES if func.task_retries is None else func.task_retries
+
+
+def _retry_delay(attempt):
+    """Seconds to wait before the retry following the ``attempt``-th run."""
+    return settings.TASKS_RETRY_DELAY * 2 ** (attempt - 1)
+
+
+def defer(func, *args, **kwargs):
+    """Run a task function according to ``TASKS_MODE``, see the module docstring."""
+    mode = settings.TASKS_MODE
+    if mode == IMMEDIATE:
+        func(*args, **kwargs)
+    elif mode == THREAD:
+        transaction.on_commit(partial(_pool.submit, func, args, kwargs, 1))
+    elif mode == DB:
+        Task.objects.create(
+            name=func.task_name,
+            args=list(args),
+            kwargs=kwargs,
+            max_attempts=_retries(func) + 1,
+        )
+    else:
+        raise ValueError("Unknown TASKS_MODE %r" % mode)
+
+
+class ThreadPool:
+    """
+    Bounded queue of task calls and the threads running them, per process.
+
+    The threads are started by the first call submitted in each process,
+    so that none is inherited from the gunicorn master through a fork.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.queue = None
+
+    def _start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.Queue(settings.TASKS_QUEUE_SIZE)
+            for number in range(settings.TASKS_THREADS):
+                threading.Thread(
+                    target=self._work, name="tasks-%d" % number, daemon=True
+                ).start()
+            self.pid = os.getpid()
+
+    def submit(self, func, args, kwargs, attempt):
+        """Queue a call, or run it in the caller if the queue is full."""
+        if self.pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait((func, args, kwargs, attempt))
+        except queue.Full:
+            logger.warning("Task queue full, running %s inline", func.task_name)
+            self._run(func, args, kwargs, attempt)
+
+    def _work(self):
+        while True:
+            call = self.queue.get()
+            try:
+                close_old_connections()
+                self._run(*call)
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+    def _run(self, func, args, kwargs, attempt):
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            if attempt > _retries(func):
+                logger.exception("Task %s failed after %d attempts", func.task_name, attempt)
+                return
+            logger.warning("Task %s failed, retrying", func.task_name, exc_info=True)
+            timer = threading.Timer(
+                _retry_delay(attempt), self.submit, (func, args, kwargs, attempt + 1)
+            )
+            timer.daemon = True
+            timer.start()
+
+    def drain(self, timeout):
+        """
+        Wait for the queued calls to run.
+
+        Returns:
+            bool: Whether the queue was emptied within ``timeout`` seconds.
+        """
+        if self.pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+_pool = ThreadPool()
+
+
+@atexit.register
+def _drain_at_exit():
+    if not _pool.drain(settings.TASKS_SHUTDOWN_TIMEOUT):
+        logger.warning("Exiting with %d queued tasks", _pool.queue.unfinished_tasks)
+
+
+def drain(timeout=10):
+    """Wait for the calls queued in this process' threads, see ``ThreadPool.drain``."""
+    return _pool.drain(timeout)
+
+
+def _load(name):
+    try:
+        func = import_string(name)
+    except ImportError as exc:
+        raise TaskError("No task %s" % name) from exc
+    if getattr(func, "task_name", None) != name:
+        raise TaskError("%s is not a task" % name)
+    return func
+
+
+def claim(limit):
+    """
+    Mark due ``Task`` rows as running, for this worker only.
+
+    Rows left running for ``TASKS_RUNNING_TIMEOUT`` seconds, by a worker
+    that died, are made pending again first.
+
+    Returns:
+        list: The claimed tasks.
+    """
+    now = timezone.now()
+    Task.objects.filter(
+        status=Task.RUNNING,
+        updated_at__lt=now - timedelta(seconds=settings.TASKS_RUNNING_TIMEOUT),
+    ).update(status=Task.PENDING, updated_at=now)
+    due = Task.objects.filter(status=Task.PENDING, run_after__lte=now).order_by("run_after", "pk")
+    claimed = []
+    for pk in due.values_list("pk", flat=True)[:limit]:
+        # The status condition makes the claim atomic between workers.
+        if Task.objects.filter(pk=pk, status=Task.PENDING).update(
+            status=Task.RUNNING, attempts=F("attempts") + 1, updated_at=now
+        ):
+            claimed.append(pk)
+    return list(Task.objects.filter(pk__in=claimed).order_by("run_after", "pk"))
+
+
+def run(row):
+    """
+    Run a claimed ``Task`` row.
+
+    Returns:
+        bool: Whether the call succeeded. A successful task is deleted; a
+            failed one is rescheduled, or marked failed after its last
+            attempt.
+    """
+    try:
+        _load(row.name)(*row.args, **row.kwargs)
+    except Exception:
+        row.last_error = traceback.format_exc()
+        if row.attempts >= row.max_attempts:
+            logger.exception("Task %s failed after %d attempts", row.name, row.attempts)
+            row.status = Task.FAILED
+        else:
+            logger.warning("Task %s failed, retrying", row.name, exc_info=True)
+            row.status = Task.PENDING
+            row.run_after = timezone.now() + timedelta(seconds=_retry_delay(row.attempts))
+        row.save(update_fields=["status", "run_after", "last_error", "updated_at"])
+        return False
+    row.delete()
+    return True
+
+
+def run_pending(limit=100):
+    """
+    Claim and run the due ``Task`` rows.
+
+    Returns:
+        tuple: Numbers of tasks run and of tasks that failed.
+    """
+    ran = failed = 0
+    for row in claim(limit):
+        ran += 1
+        failed += not run(row)
+    return ran, failed
@@ -0,0 +1,10 @@
+"""
+Template filter building the URLs of list rows, see ``oc_lettings_site.row_urls``.
+"""
+
+from django import template
+
+from oc_lettings_site import row_urls
+
+register = template.Library()
+register.filter("row_url", row_urls.row_url)
@@ -1,2 +1,1549 @@
+import asyncio
+import gzip
+import importlib.util
+import json
+import re
+import os
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.core.validators import RegexValidator
+from django.db import connection
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from io import StringIO
+
+from lettings import geo, popularity
+from lettings.models import Address, Letting, LettingSummary
+from profiles.models import Profile
+from . import (
+    audit,
+    compression,
+    errors,
+    health,
+    legacy,
+    monitoring,
+    page_cache,
+    page_views,
+    preload,
+    query_budget,
+    ratelimit,
+    row_urls,
+    seeding,
+    sitemaps,
+    slow_queries,
+    tasks,
+    views,
+)
+from .cache import SQLiteCache
+from .management.commands.importtime import parse_importtime
+from .models import LegacyCheckpoint, LegacyIdMap, PageViewCount, Task
+from .normalization import address_key, city_key
+from .sql import fingerprint
+from .warmup import warm_up
+
+
 def test_dummy():
     assert 1
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    """Tests for the shared SQLite cache backend."""
+
+    def setUp(self):
+        """Create a cache in a temporary directory."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "cache.sqlite3")
+        self.cache = SQLiteCache(self.path, {"OPTIONS": {"MAX_ENTRIES": 10}})
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_set_and_get(self):
+        """Test that stored values are read back."""
+        self.cache.set("page", {"body": b"<html>"})
+        self.assertEqual(self.cache.get("page"), {"body": b"<html>"})
+        self.assertIsNone(self.cache.get("missing"))
+
+    def test_entries_are_shared_between_instances(self):
+        """Test that another instance on the same file sees the entries."""
+        self.cache.set("page", "shared")
+        other = SQLiteCache(self.path, {})
+        self.assertEqual(other.get("page"), "shared")
+
+    def test_expired_entries_are_not_returned(self):
+        """Test that an entry past its timeout is gone."""
+        self.cache.set("page", "stale", timeout=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get("page"))
+        self.assertFalse(self.cache.has_key("page"))
+
+    def test_add_keeps_live_value(self):
+        """Test that add() only stores missing keys."""
+        self.assertTrue(self.cache.add("lock", 1))
+        self.assertFalse(self.cache.add("lock", 2))
+        self.assertEqual(self.cache.get("lock"), 1)
+
+    def test_incr_and_delete(self):
+        """Test incr() and delete()."""
+        self.cache.set("counter", 1)
+        self.assertEqual(self.cache.incr("counter", 2), 3)
+        self.assertTrue(self.cache.delete("counter"))
+        with self.assertRaises(ValueError):
+            self.cache.incr("counter")
+
+    def test_take_token_is_atomic(self):
+        """Test that concurrent connections never take the same token."""
+        barrier = threading.Barrier(8)
+        waits = []
+
+        def take():
+            cache = SQLiteCache(self.path, {})
+            barrier.wait()
+            waits.extend(cache.take_token("bucket", 60.0, 10) for _ in range(5))
+
+        threads = [threading.Thread(target=take) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(waits.count(0), 10)
+        self.assertIsNone(self.cache.get("bucket"))
+
+    def test_max_entries_evicts_least_recently_used(self):
+        """Test that culling drops the least recently used entries first."""
+        for index in range(10):
+            self.cache.set("key%d" % index, index)
+            self.cache._connection().execute(
+                "UPDATE cache SET accessed = ? WHERE key = ?",
+                (index, self.cache.make_key("key%d" % index)),
+            )
+        self.cache.set("key10", 10)
+        self.assertIsNone(self.cache.get("key0"))
+        self.assertEqual(self.cache.get("key9"), 9)
+        self.assertEqual(self.cache.get("key10"), 10)
+
+    def test_max_size_limits_stored_bytes(self):
+        """Test that the total size of the values stays under MAX_SIZE."""
+        cache = SQLiteCache(self.path, {"OPTIONS": {"MAX_SIZE": 4096}})
+        for index in range(10):
+            cache.set("blob%d" % index, b"x" * 1000)
+        total = cache._connection().execute("SELECT TOTAL(size) FROM cache").fetchone()[0]
+        self.assertLessEqual(total, 4096)
+        self.assertIsNotNone(cache.get("blob9"))
+
+    def test_size_cull_keeps_entries_that_fit(self):
+        """Test that culling by size stops once the entries fit again."""
+        cache = SQLiteCache(self.path, {"OPTIONS": {"MAX_SIZE": 4096}})
+        for index in range(5):
+            cache.set("blob%d" % index, b"x" * 1000)
+        self.assertIsNone(cache.get("blob0"))
+        self.assertEqual([cache.get("blob%d" % i) is not None for i in range(1, 5)], [True] * 4)
+
+    def test_stats_follow_the_entries(self):
+        """Test that the running count and size match the entries after each change."""
+        conn = self.cache._connection()
+
+        def check():
+            self.assertEqual(
+                self.cache._stats(conn),
+                conn.execute("SELECT COUNT(*), TOTAL(size) FROM cache").fetchone(),
+            )
+
+        self.cache.set("a", "x")
+        self.cache.set("a", "x" * 100)
+        self.cache.set("b", 1)
+        self.cache.incr("b", 1000000)
+        check()
+        self.cache.delete("a")
+        self.cache.set("c", 1, timeout=0.01)
+        time.sleep(0.02)
+        self.cache.get("c")
+        check()
+        self.cache.clear()
+        self.assertEqual(self.cache._stats(conn), (0, 0))
+
+
+class WarmupTest(TestCase):
+    """Tests for the worker warmup."""
+
+    def test_warm_up_compiles_templates(self):
+        """Test that warm_up() loads templates and URLs and renders the error pages."""
+        report = warm_up()
+        self.assertGreater(report["templates"], 0)
+        self.assertGreater(report["url_names"], 0)
+        self.assertEqual(report["error_pages"], 2)
+        self.assertNotIn("connections", report)
+
+    def test_gunicorn_config(self):
+        """Test that the gunicorn configuration preloads and recycles workers."""
+        config = runpy.run_path(os.path.join(settings.BASE_DIR, "gunicorn.conf.py"))
+        self.assertTrue(config["preload_app"])
+        self.assertGreaterEqual(config["workers"], 1)
+        self.assertGreater(config["max_requests_jitter"], 0)
+        self.assertTrue(callable(config["when_ready"]))
+        self.assertNotIn("post_fork", config)
+
+
+class StartupTest(SimpleTestCase):
+    """Tests for the cold-start path of the project."""
+
+    SCRIPT = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import django\n"
+        "django.setup()\n"
+        "print(time.perf_counter() - start)\n"
+        "print('sentry_sdk' in sys.modules)\n"
+    )
+
+    def run_setup(self, **env):
+        """Run django.setup() in a fresh interpreter and return its output lines."""
+        environment = dict(os.environ, DJANGO_SETTINGS_MODULE="oc_lettings_site.settings")
+        environment.update(env)
+        result = subprocess.run(
+            [sys.executable, "-c", self.SCRIPT],
+            cwd=settings.BASE_DIR,
+            env=environment,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return result.stdout.split()
+
+    def test_setup_within_budget(self):
+        """Test that django.setup() stays within the start-up time budget."""
+        budget = float(os.environ.get("STARTUP_BUDGET_SECONDS", "1.0"))
+        seconds = min(float(self.run_setup()[0]) for _ in range(3))
+        self.assertLess(seconds, budget)
+
+    def test_setup_does_not_import_sentry(self):
+        """Test that the Sentry SDK is not imported by django.setup()."""
+        output = self.run_setup(SENTRY_DSN="https://key@sentry.invalid/1")
+        self.assertEqual(output[1], "False")
+
+    @override_settings(SENTRY_DSN="")
+    def test_sentry_reads_the_settings(self):
+        """Test that Sentry is left uninitialized without the SENTRY_DSN setting."""
+        with mock.patch.dict(os.environ, SENTRY_DSN="https://key@sentry.invalid/1"):
+            self.assertFalse(monitoring.init_sentry())
+        self.assertNotIn("sentry_sdk", sys.modules)
+
+    def test_parse_importtime(self):
+        """Test parsing of python -X importtime output."""
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     django.utils.version\n"
+            "import time:       300 |        420 |   django\n"
+        )
+        imports = parse_importtime(output)
+        self.assertEqual(
+            imports[0],
+            {"module": "django.utils.version", "self_us": 120, "cumulative_us": 120, "depth": 2},
+        )
+        self.assertEqual(imports[1]["depth"], 1)
+        self.assertEqual(imports[1]["cumulative_us"], 420)
+
+
+class HealthCheckTest(TestCase):
+    """Tests for the liveness and readiness endpoints."""
+
+    def setUp(self):
+        """Start every test without a cached readiness result."""
+        health.reset_readiness_cache()
+
+    def test_healthz(self):
+        """Test that the liveness probe answers 200."""
+        response = self.client.get("/healthz")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "ok"})
+
+    def test_readyz(self):
+        """Test that the readiness probe reports every check."""
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["checks"], {"database": True, "migrations": True, "static": True}
+        )
+
+    def test_probes_skip_sessions_and_host_validation(self):
+        """Test that probes are answered before the session and host checks."""
+        response = self.client.get("/healthz", HTTP_HOST="10.0.0.12")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(hasattr(response.wsgi_request, "session"))
+
+    def test_readyz_result_is_cached(self):
+        """Test that the checks only run once per TTL."""
+        self.client.get("/readyz")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 0)
+
+    @override_settings(READINESS_CACHE_TTL=0)
+    def test_readyz_unavailable(self):
+        """Test that a failing check makes the probe answer 503."""
+        with mock.patch.object(health, "check_migrations", return_value=False):
+            response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["status"], "unavailable")
+
+    def test_views_without_middleware(self):
+        """Test that the URLs also resolve to views serving the same responses."""
+        self.assertEqual(reverse("healthz"), "/healthz")
+        self.assertEqual(reverse("readyz"), "/readyz")
+        middleware = [
+            path for path in settings.MIDDLEWARE
+            if path != "oc_lettings_site.health.HealthCheckMiddleware"
+        ]
+        for url in ("/healthz", "/readyz"):
+            expected = self.client.get(url)
+            health.reset_readiness_cache()
+            with override_settings(MIDDLEWARE=middleware):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, expected.status_code)
+            self.assertEqual(response.json(), expected.json())
+
+
+class StatelessRoutingTest(TestCase):
+    """Tests for the stateless routing of the public pages."""
+
+    def test_public_pages_skip_session_and_auth(self):
+        """Test that GET requests to public views get no session, user or CSRF cookie."""
+        for url in (reverse("index"), reverse("lettings:index"), reverse("profiles:index")):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(hasattr(response.wsgi_request, "session"))
+            self.assertFalse(hasattr(response.wsgi_request, "user"))
+            self.assertNotIn("csrftoken", response.cookies)
+
+    def test_admin_keeps_full_stack(self):
+        """Test that the admin still runs sessions, authentication and CSRF."""
+        response = self.client.get("/admin/login/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(hasattr(response.wsgi_request, "session"))
+        self.assertTrue(hasattr(response.wsgi_request, "user"))
+        self.assertIn("csrftoken", response.cookies)
+
+    def test_unsafe_methods_keep_full_stack(self):
+        """Test that only GET and HEAD requests are stateless."""
+        response = self.client.post(reverse("lettings:index"))
+        self.assertTrue(hasattr(response.wsgi_request, "session"))
+
+    @override_settings(STATELESS_ROUTES=False)
+    def test_setting_disables_stateless_routing(self):
+        """Test that STATELESS_ROUTES=False restores the full stack everywhere."""
+        response = self.client.get(reverse("lettings:index"))
+        self.assertTrue(hasattr(response.wsgi_request, "session"))
+
+
+class SitemapTest(TestCase):
+    """Tests for the chunked sitemaps."""
+
+    def setUp(self):
+        """Write the sitemaps to a temporary directory, two rows per chunk."""
+        self.directory = tempfile.mkdtemp()
+        overrides = override_settings(
+            SITEMAP_ROOT=self.directory,
+            SITEMAP_BASE_URL="https://example.com",
+            SITEMAP_CHUNK_SIZE=2,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.lettings = []
+        for index in range(3):
+            address = Address.objects.create(
+                number=index + 1,
+                street="Street",
+                city="Anytown",
+                state="CA",
+                zip_code=12345,
+                country_iso_code="USA",
+            )
+            letting = Letting.objects.create(title="Letting %d" % index, address=address)
+            self.lettings.append(letting)
+        user = User.objects.create_user(username="sitemapuser")
+        self.profile = Profile.objects.create(user=user, favorite_city="Paris")
+
+    def chunk_number(self, letting):
+        return sitemaps.SECTIONS["lettings"].chunk_of(letting.pk)
+
+    def test_index_lists_chunks(self):
+        """Test that the index lists every non-empty chunk of both sections."""
+        response = self.client.get("/sitemap.xml")
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content).decode()
+        chunks = {self.chunk_number(letting) for letting in self.lettings}
+        for number in chunks:
+            self.assertIn("https://example.com/sitemap-lettings-%d.xml" % number, content)
+        self.assertIn("https://example.com/sitemap-profiles-", content)
+        self.assertEqual(content.count("<sitemap>"), len(chunks) + 1)
+
+    def test_chunk_lists_pages_with_lastmod(self):
+        """Test that a chunk lists the pages of its rows with a lastmod."""
+        letting = self.lettings[0]
+        response = self.client.get("/sitemap-lettings-%d.xml" % self.chunk_number(letting))
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("<loc>https://example.com/lettings/%d/</loc>" % letting.pk, content)
+        self.assertIn("<lastmod>", content)
+
+    def test_gzip_is_served_when_accepted(self):
+        """Test that gzip-accepting clients get the precompressed file."""
+        response = self.client.get("/sitemap.xml", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        body = gzip.decompress(b"".join(response.streaming_content))
+        self.assertIn(b"<sitemapindex", body)
+
+    def test_plain_file_when_gzip_refused(self):
+        """Test that clients refusing gzip, or only naming x-gzip, get the plain file."""
+        for header in ("gzip;q=0", "x-gzip", "identity, *;q=0"):
+            response = self.client.get("/sitemap.xml", HTTP_ACCEPT_ENCODING=header)
+            self.assertNotIn("Content-Encoding", response, header)
+            self.assertIn(b"<sitemapindex", b"".join(response.streaming_content))
+
+    def test_change_invalidates_only_its_chunk(self):
+        """Test that saving a row deletes its chunk and the index, not other chunks."""
+        call_command("build_sitemaps", stdout=StringIO())
+        first, last = self.lettings[0], self.lettings[-1]
+        self.assertNotEqual(self.chunk_number(first), self.chunk_number(last))
+        first.title = "Renamed"
+        first.save()
+        files = os.listdir(self.directory)
+        self.assertNotIn("sitemap.xml", files)
+        self.assertNotIn(sitemaps.chunk_name("lettings", self.chunk_number(first)), files)
+        self.assertIn(sitemaps.chunk_name("lettings", self.chunk_number(last)), files)
+
+    def test_unknown_section(self):
+        """Test that an unknown section is a 404."""
+        response = self.client.get("/sitemap-users-0.xml")
+        self.assertEqual(response.status_code, 404)
+
+    def test_empty_chunk(self):
+        """Test that a chunk without rows is a 404 and writes no file."""
+        last = self.chunk_number(self.lettings[-1])
+        for number in (last + 1, 10**30):
+            response = self.client.get("/sitemap-lettings-%d.xml" % number)
+            self.assertEqual(response.status_code, 404)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    @override_settings(SITEMAP_BASE_URL="")
+    def test_base_url_is_required(self):
+        """Test that sitemaps are not built from the request host without SITEMAP_BASE_URL."""
+        response = self.client.get("/sitemap.xml")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_file_deleted_after_build(self):
+        """Test that a file deleted between its build and its opening is built again."""
+        build_index = sitemaps.build_index
+
+        def build_then_invalidate(base_url):
+            build_index(base_url)
+            if build.call_count == 1:
+                sitemaps.invalidate("lettings", self.lettings[0].pk)
+
+        with mock.patch.object(
+            sitemaps, "build_index", side_effect=build_then_invalidate
+        ) as build:
+            response = self.client.get("/sitemap.xml")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(build.call_count, 2)
+        self.assertIn(b"<sitemapindex", b"".join(response.streaming_content))
+
+
+class NormalizationTest(SimpleTestCase):
+    """Tests for the normalized join keys."""
+
+    def test_city_key(self):
+        """Test that spellings of a city differing in case, accents and spacing share a key."""
+        for name in ("Saint-Étienne", "saint etienne", " SAINT  ÉTIENNE ", "Saint_Etienne."):
+            self.assertEqual(city_key(name), "saint-etienne")
+        self.assertEqual(city_key("北京"), "北京")
+        self.assertEqual(city_key(" -- "), "")
+        self.assertEqual(len(city_key("x " * 64)), 64)
+
+    def test_migrations_keep_a_copy_of_city_key(self):
+        """Test that the city key migrations compute today's keys without importing them."""
+        for module in ("lettings.migrations.0006_city_keys",
+                       "profiles.migrations.0003_profile_favorite_city_key"):
+            frozen = importlib.import_module(module).city_key
+            self.assertIsNot(frozen, city_key)
+            for name in ("Saint-Étienne", "北京", " -- ", "x " * 64):
+                self.assertEqual(frozen(name), city_key(name))
+
+    def test_migration_keeps_a_copy_of_address_key(self):
+        """Test that the address key migration computes today's keys without importing them."""
+        frozen = importlib.import_module(
+            "lettings.migrations.0007_address_normalized_key"
+        ).address_key
+        self.assertIsNot(frozen, address_key)
+        for address in (
+            (7, "Main Street", "Saint-Étienne", "CA", 12345, "USA"),
+            (7, " main st. ", "x " * 64, "ca", 12345, "usa"),
+        ):
+            self.assertEqual(frozen(*address), address_key(*address))
+
+
+class AuditDataTest(TestCase):
+    """Tests for the data integrity audit."""
+
+    def setUp(self):
+        """Set up valid rows and rows loaded in bulk, bypassing validation."""
+        for index in range(3):
+            address = Address.objects.create(
+                number=index + 1,
+                street="Main Street",
+                city="Anytown",
+                state="CA",
+                zip_code=12345,
+                country_iso_code="USA",
+            )
+            Letting.objects.create(title="Letting %d" % index, address=address)
+        self.bad = Address.objects.bulk_create(
+            [
+                Address(
+                    number=10000,
+                    street="",
+                    city="Anytown",
+                    state="C",
+                    zip_code=12345,
+                    country_iso_code="USA",
+                )
+            ]
+        )[0]
+        self.user = User.objects.create_user(username="member")
+        Profile.objects.create(user=self.user, favorite_city="x" * 65)
+
+    def run_audit(self, *args):
+        out = StringIO()
+        call_command("audit_data", "--jobs", "1", "--chunk-size", "2", *args, stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_pk_ranges(self):
+        """Test that primary key chunks cover sparse keys without empty chunks."""
+        Address.objects.filter(pk=self.bad.pk).update(id=1000)
+        ranges = list(audit.pk_ranges(Address, 2))
+        self.assertEqual(len(ranges), 2)
+        self.assertEqual(ranges[-1][1], 1000)
+        self.assertEqual(list(audit.pk_ranges(Address, 3))[-1], (1000, None))
+
+    def test_report(self):
+        """Test that the report lists orphaned rows and validator violations."""
+        report = self.run_audit()
+        addresses = report["tables"]["lettings.Address"]
+        self.assertEqual(addresses["rows"], 4)
+        for rule in ("without_letting", "number.max_value", "street.blank", "state.min_length"):
+            self.assertEqual(addresses["checks"][rule], {"count": 1, "sample": [self.bad.pk]})
+        self.assertEqual(addresses["checks"]["city.max_length"]["count"], 0)
+        profiles = report["tables"]["profiles.Profile"]
+        self.assertEqual(profiles["checks"]["favorite_city.max_length"]["count"], 1)
+        self.assertEqual(report["tables"]["lettings.Letting"]["problems"], 0)
+        self.assertEqual(report["problems"], 5)
+
+    def test_orphans_and_python_validators(self):
+        """Test that missing foreign rows and validators without SQL form are reported."""
+        Letting.objects.filter(title="Letting 0").update(address_id=999)
+        field = Address._meta.get_field("city")
+        with mock.patch.object(field, "validators", [RegexValidator(r"^[a-z]+$")]):
+            report = self.run_audit("--sample", "2")
+        checks = report["tables"]["lettings.Letting"]["checks"]
+        self.assertEqual(checks["missing_address"]["count"], 1)
+        checks = report["tables"]["lettings.Address"]["checks"]
+        self.assertEqual(checks["city.RegexValidator"]["count"], 4)
+        self.assertEqual(len(checks["city.RegexValidator"]["sample"]), 2)
+        Letting.objects.filter(address_id=999).delete()
+
+    def test_fail_on_problems(self):
+        """Test that the command fails on problems when asked to, after writing the report."""
+        path = os.path.join(tempfile.mkdtemp(), "audit.json")
+        with self.assertRaises(CommandError):
+            self.run_audit("--output", path, "--fail-on-problems")
+        with open(path) as report:
+            self.assertEqual(json.load(report)["problems"], 5)
+
+
+class LegacyDataMigrationTest(TestCase):
+    """Tests for the batched copy of the legacy tables."""
+
+    def setUp(self):
+        """Fill the legacy tables, next to rows already in the app tables."""
+        existing = Address.objects.create(
+            number=18,
+            street="Rue de la plage",
+            city="Plage Koopa",
+            state="RC",
+            zip_code=8888,
+            country_iso_code="ROY",
+        )
+        Letting.objects.create(title="Maison au bord de mer", address=existing)
+        self.users = [User.objects.create_user(username="user%d" % i) for i in range(3)]
+        Profile.objects.create(user=self.users[2], favorite_city="Paris")
+        with connection.cursor() as cursor:
+            for i in range(1, 6):
+                cursor.execute(
+                    "INSERT INTO oc_lettings_site_address VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                    [i, i * 10, "Street %d" % i, "City %d" % i, "ST", 10000 + i, "USA"],
+                )
+                cursor.execute(
+                    "INSERT INTO oc_lettings_site_letting VALUES (%s, %s, %s)",
+                    [i, "Legacy letting %d" % i, i],
+                )
+            for i, user in enumerate(self.users, start=1):
+                cursor.execute(
+                    "INSERT INTO oc_lettings_site_profile VALUES (%s, %s, %s)",
+                    [i, "Legacy city %d" % i, user.pk],
+                )
+
+    def migrate(self, *args):
+        out = StringIO()
+        call_command("migrate_legacy_data", "--batch-size", "2", *args, stdout=out)
+        return out.getvalue()
+
+    def test_copy_and_verify(self):
+        """Test that rows are copied with translated foreign keys and verified."""
+        self.migrate()
+        letting = Letting.objects.select_related("address").get(title="Legacy letting 3")
+        self.assertEqual(letting.address.street, "Street 3")
+        self.assertEqual(
+            letting.address.normalized_key,
+            address_key(30, "Street 3", "City 3", "ST", 10003, "USA"),
+        )
+        self.assertEqual(LettingSummary.objects.get(pk=letting.pk).city_key, "city-3")
+        self.assertEqual(Letting.objects.count(), 6)
+        self.assertEqual(
+            sorted(Profile.objects.values_list("user__username", "favorite_city_key")),
+            [("user0", "legacy-city-1"), ("user1", "legacy-city-2"), ("user2", "paris")],
+        )
+        checkpoints = {c.source: c for c in LegacyCheckpoint.objects.all()}
+        self.assertEqual(checkpoints["letting"].status, LegacyCheckpoint.VERIFIED)
+        self.assertEqual(checkpoints["letting"].last_legacy_id, 5)
+        self.assertEqual(checkpoints["profile"].status, LegacyCheckpoint.COPIED)
+        self.assertEqual((checkpoints["profile"].copied, checkpoints["profile"].skipped), (2, 1))
+
+    def test_resume_after_failure(self):
+        """Test that an interrupted copy resumes after the last committed batch."""
+        table = legacy.TABLES[0]
+        original = table.create
+        calls = []
+
+        def fail_on_second_batch(values):
+            calls.append(values)
+            if len(calls) == 2:
+                raise RuntimeError("interrupted")
+            return original(values)
+
+        with mock.patch.object(table, "create", fail_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                legacy.copy_table(table, batch_size=2)
+        checkpoint = LegacyCheckpoint.objects.get(source="address")
+        self.assertEqual((checkpoint.last_legacy_id, checkpoint.copied), (2, 2))
+        self.assertEqual(LegacyIdMap.objects.filter(source="address").count(), 2)
+
+        legacy.copy_table(table, batch_size=2)
+        self.assertEqual(Address.objects.filter(street__startswith="Street").count(), 5)
+        self.assertEqual(legacy.verify_table(table)["missing"], 0)
+
+    def test_verification_detects_changes(self):
+        """Test that a copied row changed afterwards fails the verification."""
+        self.migrate()
+        Address.objects.filter(street="Street 4").update(city="Changed")
+        report = legacy.verify_table(legacy.TABLES[0])
+        self.assertNotEqual(report["legacy_checksum"], report["copied_checksum"])
+        self.assertEqual(
+            LegacyCheckpoint.objects.get(source="address").status, LegacyCheckpoint.COPIED
+        )
+
+    def test_cleanup(self):
+        """Test that the legacy tables are only dropped once verified, unless forced."""
+        with self.assertRaises(CommandError):
+            self.migrate("--cleanup")
+        self.assertTrue(legacy.TABLES[0].exists())
+        output = self.migrate("--cleanup", "--force")
+        self.assertIn("oc_lettings_site_address", output)
+        self.assertFalse(any(table.exists() for table in legacy.TABLES))
+        self.assertEqual(
+            set(LegacyCheckpoint.objects.values_list("status", flat=True)),
+            {LegacyCheckpoint.CLEANED},
+        )
+
+
+class SeedTest(TestCase):
+    """Tests for the synthetic data seeder."""
+
+    def seed(self, *args):
+        call_command(
+            "seed", "--lettings", "250", "--users", "120", "--batch-size", "100", *args,
+            stdout=StringIO(),
+        )
+
+    def snapshot(self):
+        return (
+            list(Letting.objects.order_by("pk").values_list("pk", "title", "address__city")),
+            list(Profile.objects.order_by("pk").values_list("user__username", "favorite_city")),
+        )
+
+    def test_seed_inserts_consistent_rows(self):
+        """Test that the seeded rows are valid and linked like rows saved through the models."""
+        Letting.objects.create(
+            title="Existing",
+            address=Address.objects.create(
+                number=1, street="A", city="B", state="CC", zip_code=1, country_iso_code="USA"
+            ),
+        )
+        self.seed("--fast")
+        self.assertEqual(Letting.objects.count(), 251)
+        self.assertEqual(LettingSummary.objects.count(), 251)
+        self.assertEqual(Profile.objects.count(), 120)
+        self.assertEqual(User.objects.count(), 120)
+        self.assertEqual(audit.audit_tables(chunk_size=100)["lettings.Letting"]["problems"], 0)
+        address = Address.objects.exclude(city="B").first()
+        self.assertEqual(address.geohash, geo.geohash(address.latitude, address.longitude))
+        self.assertEqual(
+            address.normalized_key,
+            address_key(
+                address.number,
+                address.street,
+                address.city,
+                address.state,
+                address.zip_code,
+                address.country_iso_code,
+            ),
+        )
+        summary = LettingSummary.objects.select_related("letting").last()
+        self.assertEqual(summary.title, summary.letting.title)
+        titles = Letting.objects.values_list("title", flat=True)
+        self.assertTrue(all(len(title) <= 256 for title in titles))
+        user = User.objects.first()
+        self.assertFalse(user.has_usable_password())
+
+    def test_seed_is_deterministic_across_workers(self):
+        """Test that the same seed generates the same rows inline and in worker processes."""
+        self.seed("--workers", "0")
+        inline = self.snapshot()
+        Letting.objects.all().delete()
+        Address.objects.all().delete()
+        User.objects.all().delete()
+        self.seed("--workers", "2")
+        self.assertEqual(self.snapshot(), inline)
+        self.assertEqual(
+            seeding.letting_rows(3, 1, 1, 5, "t"), seeding.letting_rows(3, 1, 1, 5, "t")
+        )
+        self.assertNotEqual(
+            seeding.letting_rows(3, 1, 1, 5, "t"), seeding.letting_rows(4, 1, 1, 5, "t")
+        )
+
+
+class QueryBudgetTest(TestCase):
+    """Tests for the per-view query budgets."""
+
+    def setUp(self):
+        """Set up a view making one query per letting, over a budget of one."""
+        for index in range(3):
+            address = Address.objects.create(
+                number=index + 1,
+                street="Main Street",
+                city="Anytown",
+                state="CA",
+                zip_code=12345,
+                country_iso_code="USA",
+            )
+            Letting.objects.create(title="Letting %d" % index, address=address)
+
+        @query_budget.query_budget(1)
+        def per_row_view(request):
+            return [letting.address.city for letting in Letting.objects.all()]
+
+        self.view = per_row_view
+        self.request = RequestFactory().get("/")
+        self.counter_key = query_budget.COUNTER_KEY % (__name__ + ".per_row_view")
+        cache.delete(self.counter_key)
+
+    def test_fingerprint(self):
+        """Test that statements differing only by their values share a fingerprint."""
+        self.assertEqual(
+            fingerprint('SELECT "a" FROM "t" WHERE "id" IN (%s, %s, %s) AND "b" = \'x\' LIMIT 21'),
+            'SELECT "a" FROM "t" WHERE "id" IN (...) AND "b" = ? LIMIT ?',
+        )
+        self.assertEqual(
+            fingerprint("SELECT  1 FROM T3 WHERE x IN (%s)"), "SELECT ? FROM T3 WHERE x IN (...)"
+        )
+
+    def test_every_public_view_has_a_budget(self):
+        """Test that the public pages are registered with their budgets."""
+        budgets = query_budget.budgets()
+        expected = {
+            "index": 0,
+            "lettings:index": 2,
+            "lettings:letting": 1,
+            "profiles:index": 1,
+            "profiles:profile": 2,
+        }
+        self.assertEqual({name: budgets.get(name) for name in expected}, expected)
+        out = StringIO()
+        call_command("query_budgets", stdout=out)
+        self.assertIn("profiles:profile", out.getvalue())
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_strict_mode_fails(self):
+        """Test that exceeding a budget fails in strict mode, with the repeated query."""
+        with self.assertRaises(query_budget.QueryBudgetExceeded) as raised:
+            self.view(self.request)
+        self.assertIn("made 4 queries, over its budget of 1", str(raised.exception))
+        self.assertIn('3 x SELECT "lettings_address"', str(raised.exception))
+        self.assertIn("per_row_view", str(raised.exception))
+
+    @override_settings(QUERY_BUDGET_STRICT=False, QUERY_BUDGET_STACK_SAMPLE_RATE=1.0)
+    def test_production_mode_logs_and_counts(self):
+        """Test that exceeding a budget is logged with a stack trace and counted."""
+        with self.assertLogs("oc_lettings_site.query_budget", "WARNING") as logs:
+            self.assertEqual(self.view(self.request), ["Anytown"] * 3)
+            self.view(self.request)
+        self.assertIn("First query over budget", logs.output[0])
+        self.assertIn("per_row_view", logs.output[0])
+        self.assertEqual(cache.get(self.counter_key), 2)
+
+    def test_public_pages_within_budget(self):
+        """Test that the public pages stay within their budgets as rows are added."""
+        user = User.objects.create_user(username="member", first_name="Ann")
+        Profile.objects.create(user=user, favorite_city="Anytown")
+        for index in range(3):
+            Profile.objects.create(user=User.objects.create_user(username="user%d" % index))
+        letting_id = Letting.objects.first().id
+        for url in (
+            reverse("index"),
+            reverse("lettings:index"),
+            reverse("lettings:letting", args=[letting_id]),
+            reverse("profiles:index"),
+            reverse("profiles:profile", args=["member"]),
+        ):
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_FLUSH_INTERVAL=0)
+class SlowQueryLogTest(TestCase):
+    """Tests for the slow query log."""
+
+    def setUp(self):
+        """Start from an empty log."""
+        slow_queries.reset()
+        self.addCleanup(slow_queries.reset)
+
+    def find(self, text):
+        return [query for query in slow_queries.top(200) if text in query["fingerprint"]]
+
+    def test_queries_aggregated_by_fingerprint_with_plan(self):
+        """Test that executions differing by their values are counted together, with a plan."""
+        Letting.objects.filter(title="a").count()
+        Letting.objects.filter(title="b").count()
+        (query,) = self.find('WHERE "lettings_letting"."title" = ?')
+        self.assertEqual(query["count"], 2)
+        self.assertGreaterEqual(query["total"], query["max"])
+        self.assertIn("letting_title_idx", query["plan"])
+
+    @override_settings(SLOW_QUERY_MAX_FINGERPRINTS=3)
+    def test_memory_is_bounded(self):
+        """Test that only the slowest fingerprints are kept."""
+        for field in ("number", "street", "city", "state", "zip_code"):
+            Address.objects.filter(**{field: 1}).exists()
+        self.assertLessEqual(len(slow_queries.top(200)), 3)
+
+    def test_admin_page_is_staff_only(self):
+        """Test that the report page lists the fingerprints to staff users only."""
+        Letting.objects.filter(title="a").count()
+        url = reverse("slow-queries")
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user(username="staff", password="pass", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url, {"order": "count"})
+        self.assertContains(response, "lettings_letting")
+        self.assertTemplateUsed(response, "admin/slow_queries.html")
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_explain_counts_towards_no_budget(self):
+        """Test that the plans of a request's queries are read after it, outside its budget."""
+        address = Address.objects.create(
+            number=1, street="Main", city="Springfield", state="IL", zip_code=62701,
+            country_iso_code="USA",
+        )
+        letting = Letting.objects.create(title="Explained", address=address)
+        slow_queries.reset()
+        response = self.client.get(reverse("lettings:letting", args=[letting.pk]))
+        self.assertEqual(response.status_code, 200)
+        (query,) = self.find('FROM "lettings_letting"')
+        self.assertIn("SEARCH", query["plan"])
+
+    def test_explain_closes_the_connection_it_opened(self):
+        """Test that a connection opened after the request for EXPLAIN is closed again."""
+        for was_open in (False, True):
+            slow_queries.reset()
+            Letting.objects.filter(title="a").count()
+            closed = mock.MagicMock(connection=object() if was_open else None)
+            with mock.patch.object(slow_queries, "connections", {"default": closed}):
+                slow_queries.explain_pending()
+            closed.cursor.assert_called()
+            self.assertEqual(closed.close.called, not was_open)
+
+    def test_wrapper_does_no_io(self):
+        """Test that recording a slow query neither explains it nor writes the cache."""
+        with mock.patch.object(slow_queries, "explain") as explain, mock.patch.object(
+            slow_queries, "cache"
+        ) as shared:
+            Letting.objects.filter(title="a").count()
+        explain.assert_not_called()
+        self.assertEqual(shared.method_calls, [])
+
+    def test_command(self):
+        """Test that the command lists the fingerprints and clears the log."""
+        Letting.objects.filter(title="a").count()
+        out = StringIO()
+        call_command("slow_queries", "--plans", stdout=out)
+        self.assertIn("lettings_letting", out.getvalue())
+        call_command("slow_queries", "--reset", stdout=StringIO())
+        self.assertEqual(slow_queries.top(), [])
+
+
+class PreloadTest(TestCase):
+    """Tests for the preload headers and Early Hints."""
+
+    STYLE = "</static/css/styles.css>; rel=preload; as=style"
+    SCRIPT = "</static/js/scripts.js>; rel=preload; as=script"
+    LOGO = "</static/assets/img/logo.png>; rel=preload; as=image"
+
+    def setUp(self):
+        """Start without computed links."""
+        preload.reset()
+        self.addCleanup(preload.reset)
+
+    def test_pages_preload_base_assets(self):
+        """Test that pages extending base.html preload its stylesheet, script and logo."""
+        for url in (reverse("index"), reverse("lettings:index"), reverse("profiles:index")):
+            links = self.client.get(url)["Link"].split(", ")
+            self.assertEqual(links, [self.STYLE, self.LOGO, self.SCRIPT])
+
+    def test_links_computed_once_per_template(self):
+        """Test that the template tree is walked once per template outside DEBUG."""
+        with override_settings(DEBUG=False), mock.patch.object(
+            preload, "static_paths", wraps=preload.static_paths
+        ) as static_paths:
+            self.client.get(reverse("index"))
+            walked = static_paths.call_count
+            self.client.get(reverse("index"))
+        self.assertGreater(walked, 0)
+        self.assertEqual(static_paths.call_count, walked)
+
+    def test_error_and_non_html_responses_skipped(self):
+        """Test that error pages and other content types get no preload header."""
+        self.assertNotIn("Link", self.client.get("/missing-page/"))
+        self.assertNotIn("Link", self.client.get("/healthz"))
+
+    def test_early_hints_sent_for_known_views(self):
+        """Test that the ASGI middleware sends the links of the view's last response."""
+        self.client.get(reverse("index"))
+        sent = []
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200})
+
+        async def send(message):
+            sent.append(message)
+
+        async def request(path, extensions):
+            scope = {"type": "http", "path": path, "extensions": extensions}
+            await preload.EarlyHintsMiddleware(app)(scope, None, send)
+
+        asyncio.run(request("/", {}))
+        self.assertEqual([message["type"] for message in sent], ["http.response.start"])
+        sent.clear()
+        asyncio.run(request("/", {preload.EARLY_HINT_EXTENSION: {}}))
+        self.assertEqual(sent[0]["type"], preload.EARLY_HINT_EXTENSION)
+        self.assertIn(self.STYLE.encode(), sent[0]["links"])
+        sent.clear()
+        asyncio.run(request("/lettings/", {preload.EARLY_HINT_EXTENSION: {}}))
+        self.assertEqual([message["type"] for message in sent], ["http.response.start"])
+
+
+@override_settings(NOT_FOUND_LOG_INTERVAL=3600)
+class ErrorPagesTest(TestCase):
+    """Tests for the pre-rendered error pages and the 404 log."""
+
+    def setUp(self):
+        """Start without rendered pages."""
+        errors.reset()
+        self.addCleanup(errors.reset)
+
+    def test_404_page_rendered_once(self):
+        """Test that the 404 page is rendered on the first error only."""
+        with mock.patch.object(
+            errors, "render_to_string", wraps=errors.render_to_string
+        ) as render_to_string:
+            for _ in range(3):
+                response = self.client.get("/lettings/404/")
+        self.assertEqual(render_to_string.call_count, 1)
+        self.assertEqual(response.status_code, 404)
+        self.assertContains(response, "404 - Page Not Found", status_code=404)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_gzipped_page_for_clients_accepting_it(self):
+        """Test that clients accepting gzip get the precompressed page."""
+        response = self.client.get("/missing/", HTTP_ACCEPT_ENCODING="br;q=0, gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn(b"404 - Page Not Found", gzip.decompress(response.content))
+        # Sent as precompressed, CompressionMiddleware leaving it as is.
+        self.assertEqual(response.content, errors._pages[404][1]["gzip"])
+        response = self.client.get("/missing/", HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertNotIn("Content-Encoding", response)
+        self.assertContains(response, "404 - Page Not Found", status_code=404)
+
+    @override_settings(ERROR_PAGES_PRECOMPRESS=False)
+    def test_precompression_can_be_disabled(self):
+        """Test that without ERROR_PAGES_PRECOMPRESS the page is compressed on every response."""
+        with mock.patch.object(compression, "precompress") as precompress:
+            response = self.client.get("/missing/", HTTP_ACCEPT_ENCODING="gzip")
+        precompress.assert_not_called()
+        self.assertEqual(errors._pages[404][1], {})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertIn(b"404 - Page Not Found", gzip.decompress(response.content))
+
+    def test_500_page(self):
+        """Test that the 500 handler serves the pre-rendered page."""
+        errors.render_error_pages()
+        with self.assertLogs("oc_lettings_site.views", "ERROR"):
+            response = views.custom_500_view(RequestFactory().get("/"))
+        self.assertEqual(response.status_code, 500)
+        self.assertIn(b"500 - Internal Server Error", response.content)
+
+    def test_404_logged_once_per_prefix_then_counted(self):
+        """Test that the 404s of a prefix are logged in aggregate."""
+        with self.assertLogs("oc_lettings_site.errors", "WARNING") as logs:
+            for number in range(3):
+                self.client.get("/lettings/%d00/" % number)
+            self.client.get("/wp-admin/")
+        self.assertEqual(
+            logs.output,
+            [
+                "WARNING:oc_lettings_site.errors:404 error: Page not found - /lettings/000/",
+                "WARNING:oc_lettings_site.errors:404 error: Page not found - /wp-admin/",
+            ],
+        )
+        with override_settings(NOT_FOUND_LOG_INTERVAL=0), self.assertLogs(
+            "oc_lettings_site.errors", "WARNING"
+        ) as logs:
+            self.client.get("/lettings/300/")
+        self.assertIn("2 more pages not found under /lettings/", logs.output[0])
+        self.assertIn("Page not found - /lettings/300/", logs.output[1])
+        self.assertEqual(len(logs.output), 2)
+
+
+@override_settings(
+    RATELIMIT_ENABLED=True,
+    RATELIMIT_DEFAULT=(1, 4),
+    RATELIMIT_ROUTES={"lettings:index": (1, 2)},
+    RATELIMIT_EXEMPT_IPS=["10.0.0.9"],
+)
+class RateLimitTest(TestCase):
+    """Tests for the rate limiting."""
+
+    def setUp(self):
+        """Start with no request counted, at the start of a window."""
+        caches[settings.RATELIMIT_CACHE].clear()
+        clock = mock.patch.object(ratelimit, "time")
+        clock.start().time.return_value = 1000.0
+        self.addCleanup(clock.stop)
+
+    def test_client_limited_once_over_its_burst(self):
+        """Test that the request over the burst gets a cheap 429."""
+        for _ in range(4):
+            self.assertEqual(self.client.get(reverse("index")).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("profiles:index"))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1")
+        other = self.client.get(reverse("index"), REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(other.status_code, 200)
+
+    def test_route_bucket(self):
+        """Test that listed routes have their own, smaller bucket."""
+        statuses = [self.client.get(reverse("lettings:index")).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(self.client.get(reverse("index")).status_code, 200)
+
+    def test_exemptions(self):
+        """Test that exempt addresses, health probes and staff users are not limited."""
+        for _ in range(6):
+            response = self.client.get(reverse("index"), REMOTE_ADDR="10.0.0.9")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.client.get("/readyz").status_code, 200)
+        staff = User.objects.create_user(username="staff", password="pass", is_staff=True)
+        self.client.force_login(staff)
+        for _ in range(6):
+            self.assertEqual(self.client.get(reverse("index")).status_code, 200)
+
+    @override_settings(RATELIMIT_ENABLED=False)
+    def test_disabled(self):
+        """Test that RATELIMIT_ENABLED=False lets every request through."""
+        for _ in range(6):
+            self.assertEqual(self.client.get(reverse("index")).status_code, 200)
+
+    def test_bucket_refills(self):
+        """Test that tokens come back at the bucket's rate."""
+        self.assertEqual(ratelimit.take("ratelimit:test", 2, 1, now=100.0), 0)
+        self.assertAlmostEqual(ratelimit.take("ratelimit:test", 2, 1, now=100.0), 0.5)
+        self.assertEqual(ratelimit.take("ratelimit:test", 2, 1, now=100.5), 0)
+
+    @override_settings(RATELIMIT_PROXY_COUNT=1)
+    def test_client_ip_behind_proxy(self):
+        """Test that the client IP is the one added by the trusted proxy."""
+        request = RequestFactory().get("/", HTTP_X_FORWARDED_FOR="1.1.1.1, 2.2.2.2")
+        self.assertEqual(ratelimit.client_ip(request), "2.2.2.2")
+        self.assertEqual(ratelimit.client_ip(RequestFactory().get("/")), "127.0.0.1")
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=60, PAGE_CACHE_WAIT=2.0)
+class PageCacheTest(SimpleTestCase):
+    """Tests for the single-flight page cache."""
+
+    def setUp(self):
+        """Start with an empty cache and a slow view counting its runs."""
+        cache.clear()
+        self.runs = []
+
+        @page_cache.page_cache
+        def view(request):
+            self.runs.append(request.path)
+            time.sleep(0.2)
+            return HttpResponse("page %d" % len(self.runs))
+
+        self.view = view
+        self.request = RequestFactory().get("/lettings/")
+
+    def concurrent_requests(self, count=8):
+        """Run the view from several threads at once and return the bodies."""
+        barrier = threading.Barrier(count)
+        bodies = []
+
+        def request():
+            barrier.wait()
+            bodies.append(self.view(RequestFactory().get("/lettings/")).content)
+
+        threads = [threading.Thread(target=request) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return bodies
+
+    def test_page_cached(self):
+        """Test that a fresh page is served from the cache."""
+        self.view(self.request)
+        self.assertEqual(self.view(self.request).content, b"page 1")
+        self.assertEqual(len(self.runs), 1)
+
+    def test_concurrent_misses_regenerate_once(self):
+        """Test that concurrent requests to a missing page run the view once."""
+        self.assertEqual(self.concurrent_requests(), [b"page 1"] * 8)
+        self.assertEqual(len(self.runs), 1)
+
+    @override_settings(PAGE_CACHE_SINGLE_FLIGHT=False)
+    def test_herd_without_single_flight(self):
+        """Test that without single-flight every concurrent request runs the view."""
+        self.concurrent_requests()
+        self.assertEqual(len(self.runs), 8)
+
+    def test_stale_page_served_while_regenerating(self):
+        """Test that an expired page is served to the requests not regenerating it."""
+        self.view(self.request)
+        key = page_cache.cache_key(self.request)
+        entry = cache.get(key)
+        entry["fresh_until"] = 0
+        cache.set(key, entry)
+        bodies = self.concurrent_requests()
+        self.assertEqual(sorted(bodies), [b"page 1"] * 7 + [b"page 2"])
+        self.assertEqual(len(self.runs), 2)
+
+    def test_waits_for_another_worker(self):
+        """Test that a request waits for the page regenerated by another worker."""
+        key = page_cache.cache_key(self.request)
+        cache.add(key + page_cache.LOCK_SUFFIX, 1)
+        entry = {
+            "content": b"other worker",
+            "status": 200,
+            "headers": {},
+            "template": None,
+            "fresh_until": time.time() + 60,
+        }
+        timer = threading.Timer(0.2, cache.set, (key, entry))
+        timer.start()
+        self.assertEqual(self.view(self.request).content, b"other worker")
+        timer.join()
+        self.assertEqual(self.runs, [])
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        """Test that PAGE_CACHE_TIMEOUT=0 disables the cache."""
+        self.view(self.request)
+        self.view(self.request)
+        self.assertEqual(len(self.runs), 2)
+
+    def test_load_test_command(self):
+        """Test that the load test reports both modes."""
+        out = StringIO()
+        call_command("bench_page_cache", "--clients", "2", "--path", "/", stdout=out)
+        self.assertIn("single-flight off", out.getvalue())
+        self.assertIn("single-flight on", out.getvalue())
+
+
+TASK_CALLS = []
+
+
+@tasks.task(retries=1)
+def record_call(value):
+    """Task of the tests, recording its argument."""
+    TASK_CALLS.append(value)
+
+
+@tasks.task(retries=1)
+def fail_once(value):
+    """Task of the tests, failing on its first run for a value."""
+    if value not in TASK_CALLS:
+        TASK_CALLS.append(value)
+        raise RuntimeError("first run of %s" % value)
+    TASK_CALLS.append(value)
+
+
+@override_settings(TASKS_RETRY_DELAY=0.01)
+class TasksTest(TestCase):
+    """Tests for the background tasks."""
+
+    def setUp(self):
+        """Forget the calls of the previous tests."""
+        TASK_CALLS.clear()
+
+    def test_immediate_mode_runs_in_caller(self):
+        """Test that immediate tasks run before defer() returns."""
+        record_call.defer(1)
+        self.assertEqual(TASK_CALLS, [1])
+
+    @override_settings(TASKS_MODE="thread")
+    def test_thread_mode_runs_after_commit_with_retries(self):
+        """Test that thread tasks run in a worker thread once the transaction commits."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            record_call.defer(2)
+        self.assertEqual(TASK_CALLS, [])
+        with self.assertLogs("oc_lettings_site.tasks", "WARNING"):
+            for callback in callbacks:
+                callback()
+            with self.captureOnCommitCallbacks(execute=True):
+                fail_once.defer(3)
+            deadline = time.monotonic() + 5
+            while TASK_CALLS.count(3) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertTrue(tasks.drain(5))
+        self.assertEqual(sorted(TASK_CALLS), [2, 3, 3])
+
+    @override_settings(TASKS_MODE="db")
+    def test_db_mode_runs_from_command(self):
+        """Test that db tasks are stored, then run and deleted by run_tasks."""
+        record_call.defer(4)
+        stored = Task.objects.get()
+        self.assertEqual(stored.name, "oc_lettings_site.tests.record_call")
+        self.assertEqual((stored.args, stored.max_attempts), ([4], 2))
+        self.assertEqual(TASK_CALLS, [])
+        out = StringIO()
+        call_command("run_tasks", "--once", stdout=out)
+        self.assertEqual(TASK_CALLS, [4])
+        self.assertFalse(Task.objects.exists())
+        self.assertIn("Ran 1 tasks, 0 failed", out.getvalue())
+
+    def test_run_tasks_initializes_sentry(self):
+        """Test that the task worker reports its failures to Sentry."""
+        with mock.patch.object(monitoring, "init_sentry") as init_sentry:
+            call_command("run_tasks", "--once", stdout=StringIO())
+        init_sentry.assert_called_once_with()
+
+    @override_settings(TASKS_MODE="db")
+    def test_db_mode_retries_then_fails(self):
+        """Test that failing db tasks are rescheduled, then marked failed."""
+        Task.objects.create(name=fail_once.task_name, args=[5], max_attempts=1)
+        fail_once.defer(6)
+        with self.assertLogs("oc_lettings_site.tasks", "WARNING"):
+            self.assertEqual(tasks.run_pending(), (2, 2))
+        failed = Task.objects.get(args=[5])
+        self.assertEqual((failed.status, failed.attempts), (Task.FAILED, 1))
+        self.assertIn("first run of 5", failed.last_error)
+        retried = Task.objects.get(args=[6])
+        self.assertEqual(retried.status, Task.PENDING)
+        self.assertGreater(retried.run_after, retried.updated_at)
+        Task.objects.filter(pk=retried.pk).update(run_after=retried.updated_at)
+        self.assertEqual(tasks.run_pending(), (1, 0))
+        self.assertEqual(list(Task.objects.values_list("args", flat=True)), [[5]])
+
+    @override_settings(TASKS_MODE="db")
+    def test_db_mode_only_runs_tasks(self):
+        """Test that a row naming a function that is not a task is not run."""
+        Task.objects.create(name="shutil.rmtree", args=["/nonexistent"])
+        with self.assertLogs("oc_lettings_site.tasks", "ERROR"):
+            self.assertEqual(tasks.run_pending(), (1, 1))
+        self.assertIn("not a task", Task.objects.get().last_error)
+
+    @override_settings(TASKS_MODE="db")
+    def test_model_changes_defer_side_effects(self):
+        """Test that saving a letting defers its geocoding, cache and sitemap invalidations."""
+        address = Address.objects.create(
+            number=1, street="Main", city="Springfield", state="IL", zip_code=62701,
+            country_iso_code="USA",
+        )
+        Letting.objects.create(title="Deferred", address=address)
+        self.assertEqual(
+            set(Task.objects.values_list("name", flat=True)),
+            {
+                "lettings.recommendations.invalidate",
+                "lettings.signals.geocode_address",
+                "oc_lettings_site.sitemaps.invalidate",
+            },
+        )
+        self.assertEqual(tasks.run_pending(), (3, 0))
+
+
+class PageViewsTest(TestCase):
+    """Tests for the buffered page view counters and the popularity ranking."""
+
+    def setUp(self):
+        """Create lettings and a profile, without pending views or cached ranking."""
+        page_views.reset()
+        self.addCleanup(page_views.reset)
+        cache.delete(popularity.CACHE_KEY)
+        self.lettings = []
+        for number, title in enumerate(("Quiet", "Popular", "Busy"), start=1):
+            address = Address.objects.create(
+                number=number, street="Main", city="Springfield", state="IL",
+                zip_code=62701, country_iso_code="USA",
+            )
+            self.lettings.append(Letting.objects.create(title=title, address=address))
+        user = User.objects.create_user(username="viewed")
+        Profile.objects.create(user=user, favorite_city="Springfield")
+
+    def views(self, kind, key):
+        row = PageViewCount.objects.filter(kind=kind, object_key=str(key)).first()
+        return row.count if row else 0
+
+    def test_views_counted(self):
+        """Test that successful letting and profile views are counted, 404s are not."""
+        letting_url = reverse("lettings:letting", args=[self.lettings[0].pk])
+        self.client.get(letting_url)
+        self.client.get(letting_url)
+        self.client.get(reverse("lettings:letting", args=[9999]))
+        self.client.get(reverse("profiles:profile", args=["viewed"]))
+        self.assertEqual(self.views("letting", self.lettings[0].pk), 2)
+        self.assertEqual(self.views("letting", 9999), 0)
+        self.assertEqual(self.views("profile", "viewed"), 1)
+
+    @override_settings(PAGE_VIEWS_FLUSH_INTERVAL=3600)
+    def test_views_buffered_then_upserted(self):
+        """Test that views stay in memory until flushed, then add to the stored counts."""
+        url = reverse("lettings:letting", args=[self.lettings[0].pk])
+        for _ in range(3):
+            self.client.get(url)
+        self.assertEqual(page_views.pending(), {("letting", str(self.lettings[0].pk)): 3})
+        self.assertFalse(PageViewCount.objects.exists())
+        with self.assertNumQueries(1):
+            self.assertEqual(page_views.flush(), 1)
+        self.client.get(url)
+        page_views.flush()
+        self.assertEqual(self.views("letting", self.lettings[0].pk), 4)
+        self.assertEqual(page_views.pending(), {})
+
+    @override_settings(PAGE_VIEWS_FLUSH_INTERVAL=3600, PAGE_VIEWS_MAX_PENDING=2)
+    def test_flushed_when_too_many_pages_pending(self):
+        """Test that the views are flushed once enough pages have pending views."""
+        for letting in self.lettings[:2]:
+            self.client.get(reverse("lettings:letting", args=[letting.pk]))
+        self.assertEqual(PageViewCount.objects.count(), 2)
+
+    def test_index_shows_most_viewed_lettings(self):
+        """Test that the index lists the most viewed lettings, deleted ones left out."""
+        quiet, popular, busy = self.lettings
+        page_views.upsert([["letting", str(quiet.pk), 1], ["letting", str(popular.pk), 9]])
+        page_views.upsert([["letting", str(busy.pk), 5], ["letting", "9999", 50]])
+        self.assertEqual(
+            [letting["title"] for letting in popularity.popular_lettings()],
+            ["Popular", "Busy", "Quiet"],
+        )
+        with self.assertNumQueries(0):
+            popularity.popular_lettings()
+        response = self.client.get(reverse("lettings:index"))
+        self.assertContains(response, "Most viewed")
+        self.assertEqual(response.context["popular_lettings"][0]["views"], 9)
+
+
+JINJA2_TEMPLATES = {
+    "BACKEND": "oc_lettings_site.jinja2.Jinja2",
+    "DIRS": [os.path.join(settings.BASE_DIR, "templates", "jinja2")],
+    "APP_DIRS": True,
+    "OPTIONS": {"environment": "oc_lettings_site.jinja2.environment"},
+}
+
+
+class TemplateEnginesTest(TestCase):
+    """Tests for the row URLs and the optional Jinja2 backend."""
+
+    def setUp(self):
+        """Start without computed URLs and links."""
+        row_urls.reset()
+        preload.reset()
+        self.addCleanup(preload.reset)
+
+    def test_row_url(self):
+        """Test that row URLs are the reversed URLs, with a single reverse() per view."""
+        for viewname, value in (("lettings:letting", 42), ("profiles:profile", "jo é+x@y.z")):
+            self.assertEqual(row_urls.row_url(value, viewname), reverse(viewname, args=[value]))
+        with mock.patch.object(row_urls, "reverse", wraps=row_urls.reverse) as reverse_mock:
+            urls = [row_urls.row_url(pk, "lettings:letting") for pk in (1, 2)]
+        self.assertEqual(urls, ["/lettings/1/", "/lettings/2/"])
+        self.assertEqual(reverse_mock.call_count, 0)
+
+    def test_jinja2_ports_render_the_same_pages(self):
+        """Test that the Jinja2 ports render the same markup and preload links."""
+        address = Address.objects.create(
+            number=7, street="Main", city="Paris", state="IL", zip_code=1, country_iso_code="USA"
+        )
+        letting = Letting.objects.create(title="Loft <b>&</b>", address=address)
+        Profile.objects.create(user=User.objects.create_user(username="jo"), favorite_city="Paris")
+        urls = [
+            reverse("index"),
+            reverse("lettings:index"),
+            reverse("lettings:letting", args=[letting.pk]),
+            reverse("profiles:index"),
+            reverse("profiles:profile", args=["jo"]),
+        ]
+        django_pages = [self.client.get(url) for url in urls]
+        with override_settings(TEMPLATES=[JINJA2_TEMPLATES] + settings.TEMPLATES):
+            jinja2_pages = [self.client.get(url) for url in urls]
+        for django_page, jinja2_page in zip(django_pages, jinja2_pages):
+            self.assertEqual(
+                re.sub(r"\s+", " ", jinja2_page.content.decode()),
+                re.sub(r"\s+", " ", django_page.content.decode()),
+            )
+            self.assertEqual(jinja2_page["Link"], django_page["Link"])
+        self.assertIn(("jinja2", "lettings/index.html"), preload._template_links)
+
+    def test_bench_templates_command(self):
+        """Test that the benchmark renders the lettings index and builds its row URLs."""
+        out = StringIO()
+        call_command("bench_templates", "--rows", "10", "--repeat", "1", stdout=out)
+        self.assertIn("django       10 rows", out.getvalue())
+        self.assertIn("row URLs     10 rows", out.getvalue())
+
+
+class StreamingTest(TestCase):
+    """Tests for the streamed list pages and the response compression."""
+
+    def setUp(self):
+        """Create five lettings and profiles."""
+        for index in range(5):
+            address = Address.objects.create(
+                number=index + 1,
+                street="Main Street",
+                city="Anytown",
+                state="CA",
+                zip_code=12345,
+                country_iso_code="USA",
+            )
+            Letting.objects.create(title="Letting %d" % index, address=address)
+            Profile.objects.create(
+                user=User.objects.create_user(username="user%d" % index), favorite_city="Anytown"
+            )
+
+    def normalized(self, content):
+        return re.sub(r"\s+", " ", content.decode())
+
+    def test_long_lists_streamed(self):
+        """Test that lists longer than a chunk are streamed, with the same markup."""
+        for url in (reverse("lettings:index"), reverse("profiles:index")):
+            rendered = self.client.get(url)
+            with override_settings(STREAMING_CHUNK_SIZE=2):
+                streamed = self.client.get(url)
+            self.assertFalse(rendered.streaming)
+            self.assertTrue(streamed.streaming)
+            self.assertEqual(
+                self.normalized(b"".join(streamed.streaming_content)),
+                self.normalized(rendered.content),
+            )
+            self.assertEqual(streamed["Link"], rendered["Link"])
+
+    @override_settings(STREAMING_CHUNK_SIZE=2)
+    async def test_streamed_asynchronously_under_asgi(self):
+        """Test that ASGI requests get an asynchronous stream, not a buffered one."""
+        response = await self.async_client.get(
+            reverse("lettings:index"), headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertTrue(response.is_async)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertGreater(len(chunks), 2)
+        content = b"".join(gzip.decompress(chunk) for chunk in chunks)
+        self.assertIn(b"Letting 4", content)
+        self.assertTrue(content.rstrip().endswith(b"</html>"))
+
+    @override_settings(STREAMING_CHUNK_SIZE=2)
+    def test_streamed_page_gzipped(self):
+        """Test that streamed pages are gzipped on the fly for clients accepting it."""
+        response = self.client.get(reverse("lettings:index"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        content = gzip.decompress(b"".join(response.streaming_content))
+        self.assertIn(b"Letting 4", content)
+        self.assertTrue(content.rstrip().endswith(b"</html>"))
+
+    @skipUnless(compression.brotli, "Brotli is not installed")
+    def test_brotli_preferred(self):
+        """Test that clients accepting Brotli get it, streamed or not."""
+        for chunk_size in (2, 100):
+            with override_settings(STREAMING_CHUNK_SIZE=chunk_size):
+                response = self.client.get(
+                    reverse("profiles:index"), HTTP_ACCEPT_ENCODING="gzip, br"
+                )
+            self.assertEqual(response["Content-Encoding"], "br")
+            body = b"".join(response.streaming_content) if response.streaming else response.content
+            self.assertIn(b"user4", compression.brotli.decompress(body))
+
+    def test_accepts(self):
+        """Test the parsing of Accept-Encoding headers."""
+        self.assertTrue(compression.accepts("gzip, br", "br"))
+        self.assertTrue(compression.accepts("gzip;q=1.0, BR;q=0.5", "br"))
+        self.assertTrue(compression.accepts("*", "br"))
+        self.assertFalse(compression.accepts("gzip, br;q=0", "br"))
+        self.assertFalse(compression.accepts("*;q=1, br;q=0", "br"))
+        self.assertFalse(compression.accepts("gzip, brotli", "br"))
+        self.assertFalse(compression.accepts("", "br"))
+
+    def test_preferred_coding(self):
+        """Test that the coding with the highest weight is chosen, Brotli on a tie."""
+        with mock.patch.object(compression, "CODINGS", ("br", "gzip")):
+            self.assertEqual(compression.preferred_coding("gzip, br"), "br")
+            self.assertEqual(compression.preferred_coding("gzip, br;q=0.5"), "gzip")
+            self.assertEqual(compression.preferred_coding("*;q=1, br;q=0"), "gzip")
+            self.assertEqual(compression.preferred_coding("*;q=0.5, gzip;q=0.2"), "br")
+            self.assertIsNone(compression.preferred_coding("identity, gzip;q=0"))
+
+    def test_bench_streaming_command(self):
+        """Test that the benchmark serves the page streamed and buffered."""
+        out = StringIO()
+        call_command("bench_streaming", "--rows", "10", stdout=out)
+        self.assertIn("streamed      10 rows", out.getvalue())
+        self.assertIn("buffered      10 rows", out.getvalue())
@@ -16,8 +16,20 @@ from . import views
 
 urlpatterns = [
     path("", views.index, name="index"),
+    path("healthz", views.healthz, name="healthz"),
+    path("readyz", views.readyz, name="readyz"),
+    path("sitemap.xml", views.sitemap_index, name="sitemap"),
+    path(
+        "sitemap-<str:section>-<int:number>.xml",
+        views.sitemap_chunk,
+        name="sitemap-chunk",
+    ),
     path("lettings/", include("lettings.urls")),
     path("profiles/", include("profiles.urls")),
+    path("admin/slow-queries/", views.slow_query_report, name="slow-queries"),
     path("admin/", admin.site.urls),
     # path("sentry-debug/", trigger_error),
 ]
+
+handler404 = "oc_lettings_site.views.custom_404_view"
+handler500 = "oc_lettings_site.views.custom_500_view"
@@ -1,10 +1,21 @@
 import logging
 
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404
 from django.shortcuts import render
+from django.utils.cache import patch_vary_headers
+
+from . import compression, errors, health, sitemaps, slow_queries
+from .query_budget import query_budget
+from .stateless import stateless
 
 logger = logging.getLogger(__name__)
 
 
+@stateless
+@query_budget(0)
 def index(request):
     """
     Display the home page of the OC Lettings site.
@@ -30,40 +41,191 @@ def custom_404_view(request, exception):
     """
     Custom 404 error page view.
 
-    Handles Page Not Found errors by rendering a user-friendly
-    error page instead of Django's default 404 page.
+    Handles Page Not Found errors by serving a user-friendly
+    error page instead of Django's default 404 page. The page is
+    rendered once per process and the 404s are logged in aggregate,
+    see ``oc_lettings_site.errors``.
 
     Args:
         request (HttpRequest): The HTTP request object that resulted in 404.
         exception (Http404): The exception that triggered this error handler.
 
     Returns:
-        HttpResponse: Rendered HTML response with 404 status code containing
+        HttpResponse: Pre-rendered HTML response with 404 status code containing
             a custom error page with helpful information for the user.
 
     Template:
         404.html: Custom template for 404 error pages.
     """
-    logger.warning("404 error: Page not found - %s", request.path)
-    return render(request, "404.html", status=404)
+    errors.log_not_found(request.path)
+    return errors.error_response(request, 404)
 
 
 def custom_500_view(request):
     """
     Custom 500 error page view.
 
-    Handles Internal Server Error by rendering a user-friendly
-    error page instead of Django's default 500 page.
+    Handles Internal Server Error by serving a user-friendly
+    error page instead of Django's default 500 page. The page is
+    rendered once per process, see ``oc_lettings_site.errors``.
 
     Args:
         request (HttpRequest): The HTTP request object that resulted in 500 error.
 
     Returns:
-        HttpResponse: Rendered HTML response with 500 status code containing
+        HttpResponse: Pre-rendered HTML response with 500 status code containing
             a custom error page with helpful information for the user.
 
     Template:
         500.html: Custom template for 500 error pages.
     """
     logger.error("500 error: Internal server error on %s", request.path)
-    return render(request, "500.html", status=500)
+    return errors.error_response(request, 500)
+
+
+def healthz(request):
+    """
+    Liveness probe.
+
+    Requests to this URL are normally answered by HealthCheckMiddleware
+    before reaching the URL resolver; the view serves the same response when
+    the middleware is not installed.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: JSON response with a 200 status code.
+    """
+    return health.liveness_response()
+
+
+def readyz(request):
+    """
+    Readiness probe.
+
+    Checks that the database is reachable, that migrations are applied and
+    that static files are collected. The result is cached for
+    ``READINESS_CACHE_TTL`` seconds.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: JSON response with the result of each check and a 200
+            status code when they all pass, 503 otherwise.
+    """
+    return health.readiness_response()
+
+
+# Builds of a missing sitemap file before giving up, when each newly built
+# file is deleted by a change before it could be opened.
+SITEMAP_BUILD_ATTEMPTS = 3
+
+
+def _serve_sitemap(request, name, build):
+    """
+    Serve a sitemap file, building it first if it is missing.
+
+    The gzipped copy is sent to clients accepting gzip. A file deleted by a
+    change between its build and its opening is built again.
+
+    Raises:
+        Http404: If ``SITEMAP_BASE_URL`` is not set.
+    """
+    if not settings.SITEMAP_BASE_URL:
+        raise Http404("Sitemaps need SITEMAP_BASE_URL")
+    compressed = compression.accepts(request.headers.get("Accept-Encoding", ""), "gzip")
+    path = sitemaps.sitemap_path(name, compressed)
+    for attempt in range(SITEMAP_BUILD_ATTEMPTS + 1):
+        try:
+            handle = open(path, "rb")
+            break
+        except FileNotFoundError:
+            if attempt == SITEMAP_BUILD_ATTEMPTS:
+                raise
+            build(settings.SITEMAP_BASE_URL)
+    response = FileResponse(handle, content_type="application/xml")
+    if compressed:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+@stateless
+def sitemap_index(request):
+    """
+    Serve the sitemap index.
+
+    Lists one sitemap per chunk of lettings and profiles, with the date of
+    the latest change in each chunk.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        FileResponse: The sitemap index XML, gzipped when the client
+            accepts it.
+    """
+    return _serve_sitemap(request, "sitemap.xml", sitemaps.build_index)
+
+
+@stateless
+def sitemap_chunk(request, section, number):
+    """
+    Serve the sitemap of one chunk of lettings or profiles.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        section (str): ``"lettings"`` or ``"profiles"``.
+        number (int): Chunk number, as listed in the sitemap index.
+
+    Returns:
+        FileResponse: The chunk sitemap XML, gzipped when the client
+            accepts it.
+
+    Raises:
+        Http404: If the section is unknown, or the chunk holds no row.
+    """
+    if section not in sitemaps.SECTIONS:
+        raise Http404("Unknown sitemap section")
+
+    def build(base_url):
+        if not sitemaps.SECTIONS[section].has_chunk(number):
+            raise Http404("Empty sitemap chunk")
+        sitemaps.build_chunk(section, number, base_url)
+
+    return _serve_sitemap(request, sitemaps.chunk_name(section, number), build)
+
+
+@staff_member_required
+def slow_query_report(request):
+    """
+    Admin page listing the slowest query fingerprints of all server processes.
+
+    Args:
+        request (HttpRequest): The HTTP request object, from a staff user.
+            The ``order`` query parameter sorts by ``total`` (default),
+            ``max`` or ``count``.
+
+    Returns:
+        HttpResponse: Rendered HTML response within the admin layout.
+
+    Template:
+        admin/slow_queries.html: Template used to display the report.
+
+    Context:
+        queries (list): Top 50 fingerprints, see ``slow_queries.top``.
+        threshold_ms (float): Duration from which a query is recorded.
+    """
+    order = request.GET.get("order", "total")
+    if order not in ("total", "max", "count"):
+        order = "total"
+    context = dict(
+        admin.site.each_context(request),
+        title="Slow queries",
+        queries=slow_queries.top(50, order),
+        order=order,
+        threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS,
+    )
+    return render(request, "admin/slow_queries.html", context)
@@ -0,0 +1,78 @@
+"""
+Process warmup for the OC Lettings site.
+
+Compiling templates and building the URL resolver happen lazily in Django,
+on the first request that needs them. The ``warm_up()`` function does that
+work, and renders the error pages, ahead of time in the gunicorn master
+process (see ``gunicorn.conf.py``), so that the forked workers inherit the
+result and serve their first request as fast as the following ones.
+
+Database connections are not opened ahead of time: each request thread has
+its own connection, closed at the end of the request (``CONN_MAX_AGE`` is
+0), and opening a SQLite connection costs little.
+"""
+
+import logging
+import os
+import time
+
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.urls import get_resolver
+
+from .errors import render_error_pages
+
+logger = logging.getLogger(__name__)
+
+
+def compile_templates():
+    """
+    Load every template of every configured engine into its cached loader.
+
+    Returns:
+        int: Number of templates compiled.
+    """
+    compiled = 0
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            directory = str(directory)
+            for root, _dirs, files in os.walk(directory):
+                for filename in files:
+                    if not filename.endswith((".html", ".txt", ".xml")):
+                        continue
+                    name = os.path.relpath(os.path.join(root, filename), directory)
+                    try:
+                        engine.get_template(name.replace(os.sep, "/"))
+                    except (TemplateDoesNotExist, TemplateSyntaxError) as exc:
+                        logger.debug("Template %s skipped during warmup: %s", name, exc)
+                        continue
+                    compiled += 1
+    return compiled
+
+
+def resolve_urlconf():
+    """
+    Import the URLconf and build the reverse lookup tables.
+
+    Returns:
+        int: Number of named URL patterns.
+    """
+    return len(get_resolver().reverse_dict)
+
+
+def warm_up():
+    """
+    Pay the lazy initialization costs of the current process up front.
+
+    Returns:
+        dict: Counts of compiled templates, URL names and rendered error
+            pages, and the time spent in seconds.
+    """
+    start = time.perf_counter()
+    report = {
+        "templates": compile_templates(),
+        "url_names": resolve_urlconf(),
+        "error_pages": render_error_pages(),
+    }
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    logger.info("Warmup done: %s", report)
+    return report
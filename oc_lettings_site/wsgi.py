@@ -2,6 +2,10 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from oc_lettings_site.monitoring import init_sentry
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "oc_lettings_site.settings")
 
 application = get_wsgi_application()
+# After the setup, so Sentry reads its configuration from the loaded settings.
+init_sentry()
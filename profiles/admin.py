@@ -1,4 +1,20 @@
 from django.contrib import admin
+
+from oc_lettings_site.admin_tools import ScalableModelAdmin
 from .models import Profile
 
-admin.site.register(Profile)
+
+@admin.register(Profile)
+class ProfileAdmin(ScalableModelAdmin):
+    """
+    Admin for profiles.
+
+    The user is picked with an autocomplete widget instead of a select
+    listing every user, and the changelist loads users with a join so
+    ``Profile.__str__`` does not query them one by one.
+    """
+
+    list_display = ("__str__", "favorite_city")
+    list_select_related = ("user",)
+    search_fields = ("^user__username",)
+    autocomplete_fields = ("user",)
@@ -0,0 +1,58 @@
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+CHUNK_SIZE = 2000
+
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def city_key(name):
+    """
+    Return the normalized form of a city name.
+
+    A copy of ``oc_lettings_site.normalization.city_key`` as of this
+    migration, so later changes to it do not change what this migration
+    writes.
+    """
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return "-".join(word for word in _SEPARATORS.split(stripped) if word)[:64]
+
+
+def populate_favorite_city_keys(apps, schema_editor):
+    """Fill the favorite city keys of the existing profiles, in primary key chunks."""
+    Profile = apps.get_model("profiles", "Profile")
+    last_pk = 0
+    while True:
+        chunk = list(
+            Profile.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .only("pk", "favorite_city")[:CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+        for profile in chunk:
+            profile.favorite_city_key = city_key(profile.favorite_city)
+        Profile.objects.bulk_update(chunk, ["favorite_city_key"])
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+    """
+    Store the normalized favorite city of each profile.
+    """
+
+    dependencies = [
+        ("profiles", "0002_profile_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="favorite_city_key",
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(populate_favorite_city_keys, migrations.RunPython.noop),
+    ]
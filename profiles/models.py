@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from oc_lettings_site.normalization import city_key
+
 
 class Profile(models.Model):
     """
@@ -16,8 +18,13 @@ class Profile(models.Model):
             due to CASCADE behavior.
         favorite_city (CharField): Optional field storing the user's preferred city.
             Limited to 64 characters and can be left blank.
+        favorite_city_key (CharField): Normalized ``favorite_city``, computed
+            on save and matched against the lettings' city keys.
+        updated_at (DateTimeField): Last time the profile was saved, used as
+            the sitemap ``lastmod``.
 
     Methods:
+        save(): Saves the profile, updating ``favorite_city_key``.
         __str__(): Returns the username of the associated User for easy identification.
 
     Meta:
@@ -31,6 +38,17 @@ class Profile(models.Model):
 
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     favorite_city = models.CharField(max_length=64, blank=True)
+    favorite_city_key = models.CharField(max_length=64, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def save(self, *args, **kwargs):
+        """
+        Save the profile, updating the normalized key of its favorite city.
+        """
+        self.favorite_city_key = city_key(self.favorite_city)
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = set(kwargs["update_fields"]) | {"favorite_city_key"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         """
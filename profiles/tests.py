@@ -1,8 +1,12 @@
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
+from lettings.models import Address, Letting
 from .models import Profile
 
 
@@ -297,3 +301,112 @@ class ProfileIntegrationTest(TestCase):
         )
         self.assertEqual(detail_response.status_code, 200)
         self.assertContains(detail_response, "Barcelona")
+
+
+class ProfileAdminTest(TestCase):
+    """Tests for the profiles admin."""
+
+    def setUp(self):
+        """Log in a superuser and create a profile."""
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "adminpass")
+        self.client.force_login(self.admin)
+        Profile.objects.create(user=self.admin, favorite_city="Paris")
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """Test that the changelist loads users with a join."""
+        url = reverse("admin:profiles_profile_changelist")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for index in range(3):
+            user = User.objects.create_user(username="member%d" % index)
+            Profile.objects.create(user=user, favorite_city="Rome")
+        with CaptureQueriesContext(connection) as more:
+            response = self.client.get(url)
+        self.assertEqual(len(few), len(more))
+        self.assertContains(response, "member2")
+
+    def test_change_form_uses_autocomplete(self):
+        """Test that the user field does not list every user."""
+        User.objects.create_user(username="not_listed")
+        response = self.client.get(reverse("admin:profiles_profile_add"))
+        self.assertContains(response, "admin-autocomplete")
+        self.assertNotContains(response, "not_listed")
+
+    def test_search_by_username_prefix(self):
+        """Test that the changelist search matches username prefixes."""
+        user = User.objects.create_user(username="searched")
+        Profile.objects.create(user=user)
+        response = self.client.get(reverse("admin:profiles_profile_changelist"), {"q": "sear"})
+        self.assertContains(response, "searched")
+        self.assertNotContains(response, "Paris")
+
+
+class ProfileRecommendationsTest(TestCase):
+    """Tests for the lettings recommended on profile pages."""
+
+    def setUp(self):
+        """Set up a profile and lettings in its favorite city, written differently."""
+        cache.clear()
+        self.user = User.objects.create_user(username="traveller")
+        self.profile = Profile.objects.create(user=self.user, favorite_city="Saint-Étienne")
+        self.addresses = {}
+        for number, (title, city) in enumerate(
+            [("Zen Loft", "saint etienne"), ("Attic", " SAINT  ÉTIENNE"), ("Villa", "Lyon")],
+            start=1,
+        ):
+            self.addresses[title] = Address.objects.create(
+                number=number,
+                street="Rue Haute",
+                city=city,
+                state="FR",
+                zip_code=42000,
+                country_iso_code="FRA",
+            )
+            Letting.objects.create(title=title, address=self.addresses[title])
+        self.url = reverse("profiles:profile", args=["traveller"])
+
+    def titles(self, response):
+        return [letting["title"] for letting in response.context["recommended_lettings"]]
+
+    def test_favorite_city_key_normalized_on_save(self):
+        """Test that the favorite city key is computed when the profile is saved."""
+        self.assertEqual(self.profile.favorite_city_key, "saint-etienne")
+        self.profile.favorite_city = "Lyon"
+        self.profile.save(update_fields=["favorite_city"])
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.favorite_city_key, "lyon")
+
+    def test_profile_lists_lettings_in_favorite_city(self):
+        """Test that the profile page lists the lettings of the favorite city in title order."""
+        response = self.client.get(self.url)
+        self.assertEqual(self.titles(response), ["Attic", "Zen Loft"])
+        self.assertContains(response, "Lettings in Saint-Étienne")
+        self.assertNotContains(response, "Villa")
+
+    def test_recommendations_are_cached(self):
+        """Test that a second view reads the recommendations from the cache."""
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(any("lettings_lettingsummary" in q["sql"] for q in queries))
+
+    def test_recommendations_follow_letting_changes(self):
+        """Test that letting and address changes invalidate the cached lists."""
+        self.client.get(self.url)
+        villa = self.addresses["Villa"]
+        villa.city = "Saint Etienne"
+        villa.save()
+        Letting.objects.get(title="Attic").delete()
+        Letting.objects.filter(title="Zen Loft").get().delete()
+        Letting.objects.create(title="Bastide", address=self.addresses["Zen Loft"])
+        response = self.client.get(self.url)
+        self.assertEqual(self.titles(response), ["Bastide", "Villa"])
+
+    def test_no_recommendations_without_favorite_city(self):
+        """Test that profiles without a favorite city show no recommendations."""
+        self.profile.favorite_city = ""
+        self.profile.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["recommended_lettings"], [])
+        self.assertNotContains(response, "Lettings in")
@@ -1,18 +1,29 @@
 import logging
 
 from django.shortcuts import render, get_object_or_404
+
+from lettings.recommendations import city_lettings
+from oc_lettings_site.page_cache import page_cache
+from oc_lettings_site.page_views import count_views
+from oc_lettings_site.query_budget import query_budget
+from oc_lettings_site.stateless import stateless
+from oc_lettings_site.streaming import render_list
 from .models import Profile
 
 logger = logging.getLogger(__name__)
 
 
+@stateless
+@query_budget(1)
+@page_cache
 def index(request):
     """
     Display a list of all user profiles.
 
-    Retrieves all profile records from the database and renders them
-    in the profiles index template. This view serves as the main
-    listing page for user profiles.
+    Retrieves all profile records from the database, with their users in
+    the same query, and renders them in the profiles index template. Long
+    lists are streamed, see ``oc_lettings_site.streaming``. This view
+    serves as the main listing page for user profiles.
 
     Args:
         request (HttpRequest): The HTTP request object containing
@@ -20,26 +31,38 @@ def index(request):
 
     Returns:
         HttpResponse: Rendered HTML response containing the profiles
-            index page with a list of all available user profiles.
+            index page with a list of all available user profiles, or a
+            StreamingHttpResponse for long lists.
 
     Template:
         profiles/index.html: Template used to display the profiles list.
+        profiles/index_rows.html: Template of the rows of the list.
 
     Context:
-        profiles_list (QuerySet): All Profile objects from the database.
+        profiles_list (list): Profile objects from the database.
     """
-    profiles_list = Profile.objects.all()
-    logger.info("Profiles index accessed - %d profiles found", len(profiles_list))
-    context = {"profiles_list": profiles_list}
-    return render(request, "profiles/index.html", context)
-
-
+    logger.info("Profiles index accessed")
+    return render_list(
+        request,
+        "profiles/index.html",
+        "profiles/index_rows.html",
+        {},
+        "profiles_list",
+        Profile.objects.select_related("user"),
+    )
+
+
+@stateless
+@count_views("profile", "username")
+@query_budget(2)
+@page_cache
 def profile(request, username):
     """
     Display detailed information for a specific user profile.
 
     Retrieves a single profile record by the associated username and displays
-    the user's profile information including their favorite city.
+    the user's profile information including their favorite city, along with
+    lettings in that city, read from the per-city cache.
 
     Args:
         request (HttpRequest): The HTTP request object containing
@@ -59,8 +82,13 @@ def profile(request, username):
 
     Context:
         profile (Profile): The Profile object associated with the username.
+        recommended_lettings (list): Dicts with the ``id`` and ``title`` of
+            the first lettings in the user's favorite city.
     """
     logger.info("Profile detail accessed - username: %s", username)
-    profile = get_object_or_404(Profile, user__username=username)
-    context = {"profile": profile}
+    profile = get_object_or_404(Profile.objects.select_related("user"), user__username=username)
+    context = {
+        "profile": profile,
+        "recommended_lettings": city_lettings(profile.favorite_city_key),
+    }
     return render(request, "profiles/profile.html", context)